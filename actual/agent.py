@@ -12,412 +12,259 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-# @title Import necessary libraries
+
+# @title Entry point
+#
+# Agents live in their own modules (xero_agent.py, search_agent.py, ...) and
+# are only imported when selected through the registry, so importing this
+# module stays cheap. `adk web` still finds `root_agent` here: module-level
+# attribute access builds the agent on demand.
+
+import argparse
 import asyncio
 import os
-import weaviate
-import json
-import base64
-import logging
-from dotenv import load_dotenv
-from google.adk.agents import Agent, LlmAgent
-from google.adk.sessions import InMemorySessionService
-from google.adk.memory import InMemoryMemoryService
-from google.adk.runners import Runner
-from google.genai import types # For creating message Content/Parts
-from google.adk.tools.tool_context import ToolContext
-from google.adk.tools.mcp_tool.mcp_toolset import MCPToolset, StdioServerParameters, SseServerParams
-from google.adk.tools.agent_tool import AgentTool
-from crewai_tools import NL2SQLTool
-from opentelemetry import trace
-from opentelemetry.sdk.resources import Resource
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import BatchSpanProcessor
-from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
-from opentelemetry.context import _RUNTIME_CONTEXT
-from contextvars import Token
-from typing import Optional
-from datetime import date
-
-# Use one of the model constants defined earlier
-MODEL_GEMINI_2_0_FLASH = "gemini-2.0-flash"
-AGENT_MODEL = MODEL_GEMINI_2_0_FLASH # Starting with Gemini
-
-load_dotenv()
-
-langfuse_public_key = os.environ.get("LANGFUSE_PUBLIC_KEY")
-langfuse_secret_key = os.environ.get("LANGFUSE_SECRET_KEY")
-LANGFUSE_AUTH=base64.b64encode(f"{langfuse_public_key}:{langfuse_secret_key}".encode()).decode()
-
-os.environ["OTEL_EXPORTER_OTLP_ENDPOINT"] = "https://cloud.langfuse.com/api/public/otel" # EU data region
-os.environ["OTEL_EXPORTER_OTLP_HEADERS"] = f"Authorization=Basic {LANGFUSE_AUTH}"
-
-original_detach = _RUNTIME_CONTEXT.detach
-
-def safe_detach(token: Token):
-    try:
-        original_detach(token)
-    except ValueError as e:
-        logging.warning(f"[OpenTelemetry Patch] Ignored context detach error: {e}")
-
-_RUNTIME_CONTEXT.detach = safe_detach
-
-provider = trace.get_tracer_provider()
-if hasattr(provider, "add_span_processor"):  # Only works if it’s the SDK provider
-    exporter = OTLPSpanExporter()
-    provider.add_span_processor(BatchSpanProcessor(exporter))
-
-# @title Define Xero Agent
-
-xero_client_id = os.environ.get("XERO_CLIENT_ID")
-xero_client_secret = os.environ.get("XERO_CLIENT_SECRET")
-
-xero_agent = LlmAgent(
-    model=AGENT_MODEL,
-    name='xero_agent',
-    instruction='Assist the user with financial tasks using Xero tools.',
-    tools=[
-        MCPToolset(
-            connection_params=StdioServerParameters(
-                command = "node",
-                args = ["temp-xero\\dist\\index.js"],
-                # Pass the Xero API credentials as environment variables to the npx process
-                env={
-                    "XERO_CLIENT_ID": xero_client_id,
-                    "XERO_CLIENT_SECRET": xero_client_secret
-                }
-            ),
-        )
-    ],
-)
-
-# @title Define the Search Agent
-
-def list_files(limit: Optional[int] = 10) -> dict:
-    """List all documents in the Weaviate collection."""
-    print(f"--- Tool: list_files called with limit={limit} ---")
-    try:
-        client = weaviate.connect_to_local()
-        documents = client.collections.get("Document")
-        response = documents.query.fetch_objects(limit=limit)
-        found_docs = {}
-        for idx, obj in enumerate(response.objects, start=1):
-            properties = obj.properties
-            title = properties.get("title", f"Untitled Document {idx}")
-            found_docs[title] = {
-                "content": properties.get("content", "[No content provided]")
-            }
-        client.close()
-        if found_docs:
-            result = {"status": "success", "documents": found_docs}
-            print(f"--- Tool: Listed documents. Result: {json.dumps(result, indent=2)} ---")
-            return result
-        else:
-            print(f"--- Tool: No documents found in Weaviate. ---")
-            return {"status": "error", "error_message": "No documents found."}
-    except Exception as e:
-        print(f"--- Tool: Exception occurred - {str(e)} ---")
-        return {"status": "error", "error_message": f"An error occurred while listing documents: {str(e)}"}
-
-def get_file(query: Optional[str] = None, limit: Optional[int] = None) -> dict:
-    """Semantic search for documents using Weaviate near_text query."""
-    print(f"--- Tool: get_file called with query='{query}' ---")
-
-    if not query:
-        return {"status": "error", "error_message": "Please provide a search query."}
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Optional
 
-    try:
-        # Connect to local Weaviate instance
-        client = weaviate.connect_to_local()
-        documents = client.collections.get("Document")
-
-        # Perform semantic search
-        response = documents.query.near_text(
-            query=query,
-            limit=limit
-        )
-
-        # Extract results
-        found_docs = {}
-        for idx, obj in enumerate(response.objects, start=1):
-            properties = obj.properties
-            title = properties.get("title", f"Untitled Document {idx}")
-            found_docs[title] = {
-                "content": properties.get("content", "[No content provided]")
-            }
-
-        client.close()
-
-        if found_docs:
-            result = {"status": "success", "documents": found_docs}
-            print(f"--- Tool: Found matching documents. Result: {json.dumps(result, indent=2)} ---")
-            return result
-        
-        # Fallback: keyword search if semantic search fails
-        print("--- Tool: No semantic matches, trying keyword fallback ---")
-        client = weaviate.connect_to_local()
-        documents = client.collections.get("Document")
-        response = documents.query.fetch_objects(limit=100)
-        keyword_docs = {}
-        for idx, obj in enumerate(response.objects, start=1):
-            properties = obj.properties
-            content = properties.get("content", "")
-            title = properties.get("title", f"Untitled Document {idx}")
-            if query.lower() in content.lower():
-                keyword_docs[title] = {"content": content}
-        client.close()
-
-        if keyword_docs:
-            result = {"status": "success", "documents": keyword_docs, "note": "Matched by keyword fallback."}
-            print(f"--- Tool: Found keyword matches. Result: {json.dumps(result, indent=2)} ---")
-            return result
-        else:
-            print(f"--- Tool: No matching documents found in Weaviate. ---")
-            return {"status": "error", "error_message": "Sorry, no documents matched your query."}
-
-    except Exception as e:
-        print(f"--- Tool: Exception occurred - {str(e)} ---")
-        return {"status": "error", "error_message": f"An error occurred while searching: {str(e)}"}
-
-search_agent = Agent(
-    name="search_agent",
-    model=AGENT_MODEL, # Can be a string for Gemini or a LiteLlm object
-    description="Search agent that searches for specific files based on user's requirements or simply list out all files.",
-    instruction="You are a helpful assistant that helps to search for files. "
-                "The files are being stored in weaviate database and you can do semantic search on them based on the vector embeddings. "
-                "If there are no files that match the user's requirements, inform them that you can't find any files. "
-                "If there are multiple files that matches the user's requirement return all files found. "
-                "You can also list all files available in the weaviate database. ",
-    tools=[get_file, list_files], # List of tools that this agent can use
-)
-
-# @title Define the Email Agent
-
-email_agent = LlmAgent(
-    name="email_agent",
-    model=AGENT_MODEL, # Can be a string for Gemini or a LiteLlm object
-    description="Email agent that sends emails based on user's requirements.",
-    instruction="You are a helpful assistant that helps to send emails. "
-                "You can send emails based on the user's requirements. "
-                "You can make use of the toolset from agentmail to send emails. ",
-    # tools=[send_email], # List of tools that this agent can use
-    tools=[
-        MCPToolset(
-            connection_params=StdioServerParameters(
-                command="agentmail-mcp",
-                args=[f"--api-key={os.environ['AGENTMAIL_API_KEY']}"]
-            )
-        )
-    ]
-)
-
-# @title Define postgres agent
-postgres_agent = LlmAgent(
-    name="postgres_agent",
-    model=AGENT_MODEL, # Can be a string for Gemini or a LiteLlm object
-    description="Postgres agent that interacts with a PostgreSQL database.",
-    instruction="You are a data assistant for a PostgreSQL database about the K-pop group NewJeans."
-                "You must use the tools available to answer all user questions."
-                "You are not allowed to answer questions from your own knowledge or assumptions. "
-                "Use tools like 'list-members' or 'find-member-by-name' when a user mentions a member's name.",
-    tools=[
-        MCPToolset(
-            connection_params=SseServerParams(
-                url="http://127.0.0.1:5000/mcp/sse"
-            )
-        )
-    ],
-)
-
-# @title Define the NL2SQL Tool
-
-SCHEMA_HINT = """
-You are querying a PostgreSQL database with the following schema:
-
-Table: members
-- member_id (int): primary key
-- name (varchar): member's full name
-- birth_date (date): member's birthdate
-- position (varchar): member's role in the group
-- debut_date (date): when the member debuted
-
-Table: songs
-- song_id (int): primary key
-- title (varchar): title of the song
-- release_date (date): when the song was released
-- duration (int): duration of the song in seconds
-- genre (varchar): genre of the song
-
-This database contains information about NewJeans members and their songs.
-Always return relevant records in your answer.
-"""
-
-db_uri = (
-    f"postgresql://{os.getenv('POSTGRES_USER')}:{os.getenv('POSTGRES_PASSWORD')}"
-    f"@{os.getenv('POSTGRES_HOST')}:{os.getenv('POSTGRES_PORT')}/{os.getenv('POSTGRES_DB')}"
-)
-
-nl2sql = NL2SQLTool(db_uri=db_uri, schema_hint=SCHEMA_HINT)
-
-def serialize_dates(obj):
-    if isinstance(obj, dict):
-        return {k: serialize_dates(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [serialize_dates(i) for i in obj]
-    elif isinstance(obj, date):
-        return obj.isoformat()
-    else:
-        return obj
+from .registry import AGENTS, DEFAULT_AGENT, agent_names, at_shutdown, get_agent, shutdown
+
+
+def __getattr__(name: str):
+    if name in AGENTS:
+        return get_agent(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# "sse" streams partial model output as it is generated; "off" waits for whole responses
+STREAMING = os.environ.get("STREAMING", "sse") == "sse"
 
-def query_postgres_nl2sql(query: str) -> dict:
-    try:
-        result = nl2sql.execute_sql(query)
-        # serialize dates in the result
-        serialized_result = serialize_dates(result)
-
-        return {
-            "status": "success",
-            "query": query,
-            "result": serialized_result
-        }
-
-    except Exception as e:
-        return {
-            "status": "error",
-            "query": query,
-            "error_message": str(e)
-        }
-    
-def search_nj_db(query: Optional[str] = None) -> dict:
-    if not query:
-        return {"status": "error", "error_message": "Query is required"}
-    return query_postgres_nl2sql(query)
-
-nl2sql_agent = LlmAgent(
-    name="nl2sql_agent",
-    model=AGENT_MODEL,
-    description="Agent that answers questions about the NewJeans music database by converting natural language queries into SQL and returning the results. The database contains tables for members and songs.",
-    instruction=(
-        "You are an expert at translating natural language questions into SQL queries for a PostgreSQL database. "
-        "Always use the provided schema to generate your queries. "
-        "The database has two tables: 'members' (with columns member_id, name, birth_date, position, debut_date) and 'songs' (with columns song_id, title, release_date, duration, genre). "
-        "When a user asks a question, generate a SQL query that answers it, execute the query, and return the result. "
-        "If the question is ambiguous, ask the user for clarification. "
-        "Example: For 'What is Minji's birthdate?', generate: SELECT birth_date FROM members WHERE name = 'Minji';"
-    ),
-    tools=[search_nj_db]
-)
-
-# @title Define the Main Agent
-
-def reason(user_input: str) -> dict:
-    """Reason about the user's input before taking any action."""
-    print(f"--- Tool: reason called with user_input='{user_input}' ---")
-    
-    # Simulate reasoning by inspecting the input
-    reasoning = ""
-    if any(word in user_input.lower() for word in ["find", "search", "file", "document", "report"]):
-        reasoning = "It seems like the user wants to find a file. I should probably delegate this to the search agent."
-    elif any(word in user_input.lower() for word in ["email", "send", "mail", "message"]):
-        reasoning = "It seems the user wants to send an email. I should probably delegate this to the email agent."
-    else:
-        reasoning = "I'm not sure what the user wants. I should ask them to clarify their request."
 
-    result = {
-        "status": "success",
-        "reasoning": reasoning
+@dataclass
+class TurnTimings:
+    """Latency of one turn, in seconds since the message was sent."""
+    ttft: Optional[float] = None  # first model text, partial or complete
+    total: Optional[float] = None
+    events: list[tuple[float, str, str]] = field(default_factory=list)  # (offset, kind, author)
+
+
+# The most recent turns, for timing_summary()
+turn_timings: deque = deque(maxlen=1000)
+
+
+def _percentile(values: list[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def timing_summary() -> dict:
+    ttfts = [timings.ttft for timings in turn_timings if timings.ttft is not None]
+    totals = [timings.total for timings in turn_timings if timings.total is not None]
+    return {
+        "turns": len(turn_timings),
+        "ttft_p50_s": _percentile(ttfts, 0.5),
+        "ttft_p95_s": _percentile(ttfts, 0.95),
+        "total_p50_s": _percentile(totals, 0.5),
+        "total_p95_s": _percentile(totals, 0.95),
     }
-    print(f"--- Tool: Reasoning complete. Result: {result} ---")
-    return result
-
-
-root_agent = Agent(
-    name="main_agent",
-    model=AGENT_MODEL, # Can be a string for Gemini or a LiteLlm object
-    description="Main agent that is the first point of contact for users which can delegate tasks to other agents and handle basic conversations.",
-    instruction="You are a helpful assistant that engages in friendly conversations. "
-                "You follow the reAct framework where you should always reason before you act."
-                "You have access to a reasoning tool that helps you to reason about the user's input. "
-                "You can use the reasoning from the reasoning tool in additional to your own reasoning to decide what to do next. "
-                "You are aware of all other agents in your team and can delegate tasks to them if the user wants to do something that the agents in your team can do. "
-                "The agents in your team are passed in as tools. "
-                "This is to ensure that the user can only interact with you and not with the other agents directly. "
-                "You can transfer to another agent as you wish when you see that there is an agent who can handle the task better than you, you don't have to seek explicit confirmation from the user. "
-                "If the user requests for something that none of the agents in your team can do, just inform them that you can't do it. ",
-    tools=[
-        reason, # Reasoning tool
-        AgentTool(search_agent), # Wrap search_agent as a tool
-        AgentTool(email_agent),  # Wrap email_agent as a tool
-    ], # List of tools that this agent can use
-)
-
-async def call_agent_async(query: str, runner, user_id, session_id):
-    print(f"\n>>> User Query: {query}")
+
+
+def _event_text(event) -> str:
+    if not event.content or not event.content.parts:
+        return ""
+    return "".join(part.text for part in event.content.parts if part.text)
+
+
+def _event_kind(event) -> str:
+    if event.partial:
+        return "text"  # a streamed chunk of model output
+    if event.get_function_calls():
+        return "tool_call"
+    if event.get_function_responses():
+        return "tool_result"
+    if event.is_final_response():
+        return "final"
+    return "message"
+
+
+async def run_turn(runner, user_id: str, session_id: str, query: str,
+                   on_event: Optional[Callable] = None, streaming: bool = STREAMING,
+                   timings: Optional[TurnTimings] = None) -> str:
+    """Run one user message through the runner and return the final response text.
+
+    `on_event(kind, event, text)` is called for every event as it arrives:
+    "text" (a streamed chunk), "tool_call", "tool_result", "message" or
+    "final". Timings are recorded into `timings` and turn_timings.
+    """
+    from google.adk.agents.run_config import RunConfig, StreamingMode
+    from google.genai import types # For creating message Content/Parts
+
     content = types.Content(role='user', parts=[types.Part(text=query)])
+    run_config = RunConfig(streaming_mode=StreamingMode.SSE if streaming else StreamingMode.NONE)
+    timings = timings if timings is not None else TurnTimings()
     final_response_text = "Agent did not produce a final response."
-    gen = runner.run_async(user_id=user_id, session_id=session_id, new_message=content)
+    started = time.perf_counter()
+    gen = runner.run_async(user_id=user_id, session_id=session_id, new_message=content, run_config=run_config)
     try:
         async for event in gen:
+            offset = time.perf_counter() - started
+            kind = _event_kind(event)
+            text = _event_text(event)
+            timings.events.append((offset, kind, event.author))
+            if text and timings.ttft is None and event.author != "user":
+                timings.ttft = offset
+            if on_event is not None:
+                on_event(kind, event, text)
             if event.is_final_response():
-                if event.content and event.content.parts:
-                    final_response_text = event.content.parts[0].text
+                # All text parts, not just the first one
+                if text:
+                    final_response_text = text
                 elif event.actions and event.actions.escalate:
                     final_response_text = f"Agent escalated: {event.error_message or 'No specific message.'}"
-                break
+                # No break: after_agent callbacks (root_agent's routing stats, the fan-out
+                # bookkeeping) only run once the runner's generator is drained
     finally:
         await gen.aclose()
-    print(f"<<< Agent Response: {final_response_text}")
+        timings.total = time.perf_counter() - started
+        turn_timings.append(timings)
+    if runner.memory_service is not None:
+        # Only queues the new messages; the Weaviate memory service writes them in the background
+        session = await runner.session_service.get_session(app_name=runner.app_name, user_id=user_id,
+                                                           session_id=session_id)
+        if session is not None:
+            await runner.memory_service.add_session_to_memory(session)
+    return final_response_text
+
+async def call_agent_async(query: str, runner, user_id, session_id, streaming: bool = STREAMING,
+                           show_timings: bool = False):
+    print(f"\n>>> User Query: {query}")
+    timings = TurnTimings()
+    streamed = False  # whether the reply (or part of it) was already printed as it streamed
+    mid_line = False
+
+    def show(kind: str, event, text: str):
+        nonlocal streamed, mid_line
+        if kind == "text" and text:
+            if not mid_line:
+                print("<<< Agent Response: ", end="")
+            print(text, end="", flush=True)
+            streamed = mid_line = True
+        elif kind in ("tool_call", "tool_result"):
+            if mid_line:
+                print()
+                mid_line = False
+            for call in event.get_function_calls():
+                print(f"... {event.author} is calling {call.name}", flush=True)
+            for response in event.get_function_responses():
+                print(f"... {response.name} finished", flush=True)
+
+    final_response_text = await run_turn(runner, user_id, session_id, query, on_event=show,
+                                         streaming=streaming, timings=timings)
+    if mid_line:
+        print()
+    if not streamed:
+        print(f"<<< Agent Response: {final_response_text}")
+    ttft = f"{timings.ttft:.2f}s" if timings.ttft is not None else "n/a"
+    print(f"--- First token after {ttft}, turn took {timings.total:.2f}s ({len(timings.events)} events) ---")
+    if show_timings:
+        for offset, kind, author in timings.events:
+            print(f"    {offset:7.3f}s  {kind:12} {author}")
+
+def create_runner(agent_name: str = DEFAULT_AGENT, app_name: str = "cli_agent"):
+    """A Runner for the agent with this process's session and memory services."""
+    from google.adk.memory import InMemoryMemoryService
+    from google.adk.runners import Runner
+
+    if os.environ.get("SESSION_STORE", "sqlite") == "memory":
+        from google.adk.sessions import InMemorySessionService
+        session_service = InMemorySessionService()
+    else:
+        # Persistent, bounded history (session_store.py)
+        from .session_store import SqliteSessionService
+        session_service = SqliteSessionService()
+        at_shutdown(session_service.close)
+
+    agent = get_agent(agent_name)
+    if not any(getattr(tool, "name", None) == "load_memory" for tool in agent.tools):
+        # Nothing could read the memories back, so conversations are not stored at all
+        memory_service = None
+    elif os.environ.get("MEMORY_STORE", "weaviate") == "memory":
+        memory_service = InMemoryMemoryService()
+    else:
+        # Long-term memory across sessions, written in the background (memory_service.py)
+        from .memory_service import WeaviateMemoryService
+        memory_service = WeaviateMemoryService()
+        at_shutdown(memory_service.close)
+
+    return Runner(
+        agent=agent,
+        app_name=app_name,
+        session_service=session_service,
+        memory_service=memory_service,
+    )
 
-async def main():
+def _report_timings():
+    if turn_timings:
+        print(f"--- Turn latency: {timing_summary()} ---")
+
+async def main(agent_name: str = DEFAULT_AGENT, streaming: bool = STREAMING, show_timings: bool = False):
     APP_NAME = "cli_agent"
     USER_ID = "user_1"
     SESSION_ID = "session_1"
 
-    session_service = InMemorySessionService() 
+    runner = create_runner(agent_name, APP_NAME)
+    at_shutdown(_report_timings)
 
-    session = await session_service.create_session(
+    # With the persistent store, the previous conversation picks up where it left off
+    session = await runner.session_service.get_session(
         app_name=APP_NAME,
         user_id=USER_ID,
         session_id=SESSION_ID
-    )
-
-    # import weaviate
-    # weaviate_client = weaviate.connect_to_local()
-    # memory_service = WeaviateMemoryService(
-    #     weaviate_client=weaviate_client,
-    #     collection_name="adk_chat_history",
-    #     embedding_model="text-embedding-004"
-    # )
-
-    memory_service = InMemoryMemoryService() 
-
-    runner = Runner(
-        agent=xero_agent,
+    ) or await runner.session_service.create_session(
         app_name=APP_NAME,
-        session_service=session_service,
-        memory_service=memory_service, 
+        user_id=USER_ID,
+        session_id=SESSION_ID
     )
 
     print("\n--- Starting Interactive Agent Chat (Detailed Output) ---")
     print("Type your message and press Enter. Type 'exit' to quit.\n")
 
-    while True:
-        try:
-            user_input_text = input("You: ")
-            if user_input_text.lower() == 'exit':
-                print("--- Ending Chat ---")
-                break
-
-            await call_agent_async(
-                query=user_input_text,
-                runner=runner,
-                user_id=USER_ID,
-                session_id=SESSION_ID
-            )
-
-        except Exception as e:
-            print(f"An error occurred during conversation: {e}")
-            print("Please try again or type 'exit' to quit.")
+    try:
+        while True:
+            try:
+                user_input_text = input("You: ")
+                if user_input_text.lower() == 'exit':
+                    print("--- Ending Chat ---")
+                    break
+
+                await call_agent_async(
+                    query=user_input_text,
+                    runner=runner,
+                    user_id=USER_ID,
+                    session_id=SESSION_ID,
+                    streaming=streaming,
+                    show_timings=show_timings,
+                )
+
+            except Exception as e:
+                print(f"An error occurred during conversation: {e}")
+                print("Please try again or type 'exit' to quit.")
+    finally:
+        # Prints cache stats and releases the clients of whichever agents were loaded
+        await shutdown()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Chat with one of the agents from the command line.")
+    parser.add_argument("--agent", choices=agent_names(), default=DEFAULT_AGENT,
+                        help=f"Agent to run (default: {DEFAULT_AGENT}). Only its dependencies are loaded.")
+    parser.add_argument("--list", action="store_true", help="List the available agents and exit.")
+    parser.add_argument("--no-stream", action="store_true", help="Wait for whole responses instead of streaming them.")
+    parser.add_argument("--timings", action="store_true", help="Print when each event of a turn arrived.")
+    args = parser.parse_args()
+    if args.list:
+        for name, (_, description) in AGENTS.items():
+            print(f"{name:16} {description}")
+    else:
+        asyncio.run(main(args.agent, streaming=STREAMING and not args.no_stream, show_timings=args.timings))
@@ -0,0 +1,368 @@
+# @title End-to-end agent benchmark and load replay
+#
+# Replays a conversation workload against the real agent graph, without Gemini
+# or live services. The agents are built through the registry as usual, with
+# all their callbacks, caches, pools, session store and instrumentation.
+# Only the edges are replaced:
+#   - every agent's model becomes a fake_llm.ScriptedLlm: scripted tool calls
+#     and answers with a fixed, seeded latency
+#   - Weaviate, Postgres, the postgres toolbox and agentmail-mcp become the
+#     local stand-ins in standins.py
+#   - long-term memory uses the in-memory service
+#
+# Each concurrency level runs in a fresh process with its own cache
+# directory, so no level starts with caches or memory warmed by another.
+# Within a level, `concurrency` sessions converse at once, each sending its
+# turns one after another through agent.run_turn, the same way serve.py's
+# dispatcher does. The JSON report has, per level:
+#   - throughput and turn latency/TTFT p50/p95/p99
+#   - p50/p95/p99 per agent, model and tool, from instrumentation.py
+#   - resident memory
+# `--baseline` compares a run with an earlier report and exits non-zero on a
+# regression, so it can gate CI like benchmark_startup.py.
+#
+#   python -m actual.benchmark_agents --agent search_agent --concurrency 1,4,16 --json run.json
+#   python -m actual.benchmark_agents --agent root_agent --baseline run.json
+#   python -m actual.benchmark_agents --agent nl2sql_agent --workload recorded.jsonl
+#
+# Workload lines use serve.py's batch format, {"user_id", "session_id",
+# "text"}, optionally with "script": {agent name: steps} to script that turn's
+# model calls (see fake_llm.py). --save-workload writes the synthetic workload
+# out in that format, so it can be edited or replayed later.
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Optional
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_NAME = "benchmark"
+
+# Model scripts per agent (LlmAgent names; root_agent's is main_agent)
+SCRIPTS: dict[str, list[dict]] = {
+    "main_agent": [
+        {"call": "search_agent", "args": {"request": "{input}"}},
+        {"text": "Here is what the search agent found for: {input}"},
+    ],
+    "search_agent": [
+        {"call": "get_file", "args": {"query": "{input}"}},
+        {"text": "These documents match '{input}'. The most relevant one is listed first."},
+    ],
+    "email_agent": [
+        {"call": "send_email", "args": {"to": "team@example.com", "subject": "Update", "text": "{input}"}},
+        {"text": "The email has been sent."},
+    ],
+    "nl2sql_agent": [
+        {"call": "search_nj_db", "args": {"query": "SELECT title, release_date FROM songs ORDER BY release_date"}},
+        {"text": "Here are the results."},
+    ],
+    "postgres_agent": [
+        {"call": "list-songs", "args": {}},
+        {"text": "Here are the songs."},
+    ],
+}
+
+NL2SQL_QUESTIONS = [
+    ("When was Minji born?", "SELECT birth_date FROM members WHERE name = 'Minji'"),
+    ("List all songs", "SELECT title FROM songs"),
+    ("Which songs are longer than three minutes?", "SELECT title, duration FROM songs WHERE duration > 180"),
+    ("How many members are there?", "SELECT COUNT(*) FROM members"),
+    ("What is the newest song?", "SELECT title FROM songs ORDER BY release_date DESC LIMIT 1"),
+    ("Who is the youngest member?", "SELECT name FROM members ORDER BY birth_date DESC LIMIT 1"),
+    ("Average song length per genre", "SELECT genre, AVG(duration) FROM songs GROUP BY genre"),
+    ("Songs released in 2023", "SELECT title FROM songs WHERE release_date LIKE '2023%'"),
+]
+
+POSTGRES_QUESTIONS = [
+    ("List all songs", "list-songs", {}),
+    ("Who are the members?", "list-members", {}),
+    ("Tell me about Hanni", "find-member-by-name", {"name": "Hanni"}),
+    ("Is Ditto one of their songs?", "find-song-by-title", {"title": "Ditto"}),
+    ("Find the song OMG", "find-song-by-title", {"title": "OMG"}),
+]
+
+CHAT_MESSAGES = ["hello, what can you do?", "thanks!", "can you help me with something?"]
+
+
+def _skewed_choice(rng: random.Random, items: list):
+    """A few items are asked for far more often than the rest, as in real traffic (and caches)."""
+    return items[min(len(items) - 1, int(rng.paretovariate(1.2)) - 1)]
+
+
+def _synthetic_turn(agent_name: str, rng: random.Random) -> dict:
+    from .standins import TOPICS
+
+    if agent_name == "search_agent":
+        return {"text": f"find the {_skewed_choice(rng, TOPICS)}"}
+    if agent_name == "nl2sql_agent":
+        question, sql = _skewed_choice(rng, NL2SQL_QUESTIONS)
+        return {"text": question, "script": {"nl2sql_agent": [
+            {"call": "search_nj_db", "args": {"query": sql}}, {"text": f"Here is the answer to: {question}"}]}}
+    if agent_name == "postgres_agent":
+        question, tool, args = _skewed_choice(rng, POSTGRES_QUESTIONS)
+        return {"text": question, "script": {"postgres_agent": [
+            {"call": tool, "args": args}, {"text": f"Here is the answer to: {question}"}]}}
+    # root_agent: routed straight to a sub-agent, left to the model, or fanned out to both sub-agents
+    kind = rng.random()
+    if kind < 0.6:
+        return {"text": f"find the {_skewed_choice(rng, TOPICS)}"}
+    if kind < 0.8:
+        return {"text": rng.choice(CHAT_MESSAGES), "script": {"main_agent": [
+            {"text": "I can search your documents and send emails for you."}]}}
+    topic = _skewed_choice(rng, TOPICS)
+    return {"text": f"find the {topic} and email it to alice", "script": {"main_agent": [
+        {"calls": [{"call": "search_agent", "args": {"request": f"find the {topic}"}},
+                   {"call": "email_agent", "args": {"request": f"email alice about the {topic}"}}]},
+        {"text": f"I found the {topic} and emailed it to alice."}]}}
+
+
+WORKLOAD_AGENTS = ["root_agent", "search_agent", "nl2sql_agent", "postgres_agent"]
+
+
+def synthetic_workload(agent_name: str, sessions: int, turns_per_session: int, seed: int = 0) -> list[dict]:
+    rng = random.Random(seed)
+    return [
+        {"user_id": f"user_{number % 97}", "session_id": f"bench_{number}", **_synthetic_turn(agent_name, rng)}
+        for number in range(sessions)
+        for _ in range(turns_per_session)
+    ]
+
+
+def load_workload(path: str) -> list[dict]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _percentiles_ms(values: list[float]) -> Optional[dict]:
+    if not values:
+        return None
+    ordered = sorted(values)
+
+    def at(fraction: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000, 2)
+
+    return {"p50": at(0.50), "p95": at(0.95), "p99": at(0.99), "max": round(ordered[-1] * 1000, 2)}
+
+
+def _rss_mb() -> Optional[float]:
+    try:
+        with open("/proc/self/statm") as f:
+            return round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20, 1)
+    except (OSError, ValueError):
+        return None
+
+
+async def _run_level(options: dict, lines: list[dict], concurrency: int) -> dict:
+    from . import agent
+    from . import instrumentation
+    from . import registry
+    from . import standins
+    from .fake_llm import script_agents, turn_scripts
+
+    root = registry.get_agent(options["agent"])
+    script_agents(root, SCRIPTS, options["model_latency_ms"], options["jitter"], options["seed"])
+    installed = standins.install(options["weaviate_latency_ms"], options["db_latency_ms"],
+                                 options["mcp_latency_ms"], options["documents"], options["seed"])
+    runner = agent.create_runner(options["agent"], APP_NAME)
+
+    sessions: dict[tuple[str, str], list[dict]] = {}
+    for line in lines:
+        sessions.setdefault((str(line.get("user_id", "user_1")), str(line.get("session_id", "session_1"))), []).append(line)
+
+    timings: list = []
+    errors: list[str] = []
+
+    async def converse(user_id: str, session_id: str, session_lines: list[dict], record: bool = True) -> None:
+        await runner.session_service.create_session(app_name=APP_NAME, user_id=user_id, session_id=session_id)
+        for line in session_lines:
+            turn = agent.TurnTimings()
+            token = turn_scripts.set(line.get("script") or {})
+            try:
+                await agent.run_turn(runner, user_id, session_id, line["text"],
+                                     streaming=options["streaming"], timings=turn)
+            except Exception as e:
+                if record:
+                    errors.append(f"{type(e).__name__}: {e}")
+            finally:
+                turn_scripts.reset(token)
+            if record:
+                timings.append(turn)
+
+    # Warm-up: start MCP servers, compile schemas and fill pools outside the measurement
+    warm_lines = list(sessions.values())[0][:options["warmup"]]
+    if warm_lines:
+        await converse("warmup", "warmup", warm_lines, record=False)
+    instrumentation.instrumentation.hotspots.reset()
+    rss_start = _rss_mb()
+
+    queue = asyncio.Queue()
+    for key, session_lines in sessions.items():
+        queue.put_nowait((key, session_lines))
+
+    async def worker() -> None:
+        while not queue.empty():
+            (user_id, session_id), session_lines = queue.get_nowait()
+            await converse(user_id, session_id, session_lines)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    rows = {"agent": {}, "model": {}, "tool": {}}
+    for row in instrumentation.instrumentation.hotspots.stats():
+        rows[row["kind"]][row["name"]] = {key: row[key] for key in ("count", "errors", "p50_ms", "p95_ms", "p99_ms", "max_ms")}
+    result = {
+        "concurrency": concurrency,
+        "sessions": len(sessions),
+        "turns": len(timings),
+        "errors": len(errors),
+        "error_samples": sorted(set(errors))[:5],
+        "seconds": round(elapsed, 3),
+        "turns_per_s": round(len(timings) / elapsed, 2) if elapsed else None,
+        "turn_ms": _percentiles_ms([turn.total for turn in timings if turn.total is not None]),
+        "ttft_ms": _percentiles_ms([turn.ttft for turn in timings if turn.ttft is not None]),
+        "agents": rows["agent"],
+        "models": rows["model"],
+        "tools": rows["tool"],
+        "memory_mb": {
+            "rss_start": rss_start,
+            "rss_end": _rss_mb(),
+            # ru_maxrss is in KiB on Linux
+            "peak_rss": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        },
+        "standins": installed,
+    }
+    await registry.shutdown()
+    return result
+
+
+def run_level(options: dict, lines: list[dict], concurrency: int) -> dict:
+    """One concurrency level; runs in its own process. The agents' stats output goes to stderr."""
+    with contextlib.redirect_stdout(sys.stderr):
+        return asyncio.run(_run_level(options, lines, concurrency))
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        done = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return done.stdout.strip() or None
+
+
+def compare(report: dict, baseline: dict, max_regression: float) -> dict:
+    """Per-level changes in throughput and p95 turn latency against a baseline report, matched by concurrency."""
+    previous = {level["concurrency"]: level for level in baseline.get("levels", [])}
+    levels = []
+    regressions = []
+    for level in report["levels"]:
+        before = previous.get(level["concurrency"])
+        if before is None or not before.get("turn_ms") or not level.get("turn_ms"):
+            continue
+        throughput = level["turns_per_s"] / before["turns_per_s"] - 1 if before.get("turns_per_s") else None
+        p95 = level["turn_ms"]["p95"] / before["turn_ms"]["p95"] - 1 if before["turn_ms"]["p95"] else None
+        levels.append({"concurrency": level["concurrency"], "throughput_change": throughput, "p95_change": p95})
+        if throughput is not None and throughput < -max_regression:
+            regressions.append(f"throughput at concurrency {level['concurrency']} fell {-throughput:.0%}")
+        if p95 is not None and p95 > max_regression:
+            regressions.append(f"p95 turn latency at concurrency {level['concurrency']} rose {p95:.0%}")
+    return {"baseline_revision": baseline.get("revision"), "max_regression": max_regression,
+            "levels": levels, "regressions": regressions}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark an agent end to end with a scripted model and local service stand-ins.")
+    parser.add_argument("--agent", choices=WORKLOAD_AGENTS, default="root_agent")
+    parser.add_argument("--workload", default=None, help="JSONL of recorded turns to replay instead of a synthetic workload")
+    parser.add_argument("--save-workload", default=None, help="Write the workload that was run to this JSONL file")
+    parser.add_argument("--sessions", type=int, default=64, help="Synthetic workload: sessions")
+    parser.add_argument("--turns", type=int, default=4, help="Synthetic workload: turns per session")
+    parser.add_argument("--concurrency", default="1,4,16,64", help="Comma-separated concurrent sessions per level")
+    parser.add_argument("--warmup", type=int, default=2, help="Turns run before measuring each level")
+    parser.add_argument("--model-latency-ms", type=float, default=300.0, help="Scripted model latency per call")
+    parser.add_argument("--jitter", type=float, default=0.2, help="+/- fraction of the model latency, seeded")
+    parser.add_argument("--weaviate-latency-ms", type=float, default=5.0)
+    parser.add_argument("--db-latency-ms", type=float, default=2.0)
+    parser.add_argument("--mcp-latency-ms", type=float, default=10.0)
+    parser.add_argument("--documents", type=int, default=200, help="Documents in the Weaviate stand-in")
+    parser.add_argument("--no-stream", action="store_true", help="Request whole model responses instead of SSE")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", dest="json_path", default=None, help="Write the report here instead of stdout")
+    parser.add_argument("--baseline", default=None, help="Earlier report to compare with")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="Relative throughput drop or p95 rise versus --baseline that fails the run")
+    args = parser.parse_args()
+
+    lines = load_workload(args.workload) if args.workload else synthetic_workload(args.agent, args.sessions, args.turns, args.seed)
+    if args.save_workload:
+        with open(args.save_workload, "w") as f:
+            for line in lines:
+                f.write(json.dumps(line) + "\n")
+    options = {
+        "agent": args.agent,
+        "model_latency_ms": args.model_latency_ms,
+        "jitter": args.jitter,
+        "weaviate_latency_ms": args.weaviate_latency_ms,
+        "db_latency_ms": args.db_latency_ms,
+        "mcp_latency_ms": args.mcp_latency_ms,
+        "documents": args.documents,
+        "streaming": not args.no_stream,
+        "warmup": args.warmup,
+        "seed": args.seed,
+    }
+    # Read by the agent modules at import, i.e. in each level's process
+    os.environ.setdefault("MEMORY_STORE", "memory")
+    os.environ.setdefault("AGENTMAIL_API_KEY", "benchmark")
+    os.environ.setdefault("HOTSPOT_SAMPLES", "1000000")
+
+    report = {
+        "benchmark": "agents",
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "options": options,
+        "workload": {"source": args.workload or "synthetic", "sessions": len({(line.get("user_id"), line.get("session_id")) for line in lines}),
+                     "turns": len(lines)},
+        "levels": [],
+    }
+    for concurrency in [int(value) for value in args.concurrency.split(",") if value.strip()]:
+        # A fresh process and cache directory per level: sessions.db, SQL/search caches and memory all start cold
+        os.environ["AGENT_CACHE_DIR"] = tempfile.mkdtemp(prefix="agent-bench-")
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+            level = pool.submit(run_level, options, lines, concurrency).result()
+        report["levels"].append(level)
+        turn_ms = level["turn_ms"] or {}
+        print(f"concurrency {concurrency:4}: {level['turns_per_s']} turns/s, turn p50 {turn_ms.get('p50')} ms, "
+              f"p95 {turn_ms.get('p95')} ms, p99 {turn_ms.get('p99')} ms, {level['errors']} errors, "
+              f"peak RSS {level['memory_mb']['peak_rss']} MB", file=sys.stderr)
+
+    failed = any(level["errors"] for level in report["levels"])
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["comparison"] = compare(report, json.load(f), args.max_regression)
+        for regression in report["comparison"]["regressions"]:
+            print(f"Regression: {regression}", file=sys.stderr)
+        failed = failed or bool(report["comparison"]["regressions"])
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
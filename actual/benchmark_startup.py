@@ -0,0 +1,91 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Measures how long `from actual import agent` takes in a fresh interpreter (and, with
+# --agent, how long building one agent takes on top of it), and exits non-zero
+# when the median goes over budget, so it can gate CI. Each run is a separate
+# process because a warm import is free.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+parser = argparse.ArgumentParser(description="Check agent.py import time (and optionally one agent's build time) against a budget.")
+parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters to time")
+parser.add_argument("--budget", type=float, default=0.5, help="Max median seconds for `from actual import agent`")
+parser.add_argument("--agent", default=None, help="Also time building this agent through the registry")
+parser.add_argument("--agent-budget", type=float, default=None, help="Max median seconds for building --agent")
+parser.add_argument("--top", type=int, default=10, help="Slowest imports to list when over budget")
+parser.add_argument("--json", dest="json_path", default=None, help="Also write the results to this file")
+args = parser.parse_args()
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+from actual import agent
+imported = time.perf_counter()
+name = sys.argv[1] if len(sys.argv) > 1 else None
+if name:
+    agent.get_agent(name)
+print(json.dumps({"import": imported - started, "build": time.perf_counter() - imported if name else None,
+                  "modules": len(sys.modules)}))
+"""
+
+
+def probe(importtime: bool = False) -> tuple[dict, str]:
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", PROBE]
+    if args.agent:
+        command.append(args.agent)
+    done = subprocess.run(command, cwd=os.path.dirname(HERE), capture_output=True, text=True)
+    if done.returncode != 0:
+        sys.exit(f"Probe failed:\n{done.stderr}")
+    return json.loads(done.stdout.strip().splitlines()[-1]), done.stderr
+
+
+def slowest_imports(stderr: str, top: int) -> list[tuple[int, str]]:
+    """Top two levels of `-X importtime` output, by cumulative microseconds."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Nested imports are indented by two spaces per level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth <= 1:
+            rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+samples = [probe()[0] for _ in range(args.runs)]
+result = {
+    "runs": args.runs,
+    "import_median_s": statistics.median(sample["import"] for sample in samples),
+    "import_budget_s": args.budget,
+    "modules_loaded": samples[-1]["modules"],
+}
+if args.agent:
+    result.update(agent=args.agent, build_median_s=statistics.median(sample["build"] for sample in samples),
+                  build_budget_s=args.agent_budget)
+
+print(f"import agent: {result['import_median_s'] * 1000:.0f} ms median over {args.runs} runs "
+      f"(budget {args.budget * 1000:.0f} ms, {result['modules_loaded']} modules loaded)")
+if args.agent:
+    print(f"build {args.agent}: {result['build_median_s'] * 1000:.0f} ms median")
+
+over = result["import_median_s"] > args.budget
+if args.agent and args.agent_budget is not None:
+    over = over or result["build_median_s"] > args.agent_budget
+result["within_budget"] = not over
+
+if over:
+    print("Over budget. Slowest imports (cumulative):")
+    for microseconds, name in slowest_imports(probe(importtime=True)[1], args.top):
+        print(f"  {microseconds / 1000:8.1f} ms  {name}")
+
+if args.json_path:
+    with open(args.json_path, "w") as f:
+        json.dump(result, f, indent=2)
+
+sys.exit(1 if over else 0)
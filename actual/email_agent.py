@@ -0,0 +1,46 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+
+from google.adk.agents import LlmAgent
+from google.adk.tools.mcp_tool.mcp_toolset import StdioServerParameters
+
+from .mcp_pool import PooledMCPToolset, close_pools, report_pools
+from .registry import AGENT_MODEL, at_shutdown
+
+# @title Define the Email Agent
+
+email_agent = LlmAgent(
+    name="email_agent",
+    model=AGENT_MODEL, # Can be a string for Gemini or a LiteLlm object
+    description="Email agent that sends emails based on user's requirements.",
+    instruction="You are a helpful assistant that helps to send emails. "
+                "You can send emails based on the user's requirements. "
+                "You can make use of the toolset from agentmail to send emails. ",
+    # tools=[send_email], # List of tools that this agent can use
+    tools=[
+        PooledMCPToolset(
+            "agentmail",
+            connection_params=StdioServerParameters(
+                command="agentmail-mcp",
+                args=[f"--api-key={os.environ['AGENTMAIL_API_KEY']}"]
+            )
+        )
+    ]
+)
+
+at_shutdown(close_pools)
+at_shutdown(report_pools)
@@ -0,0 +1,208 @@
+# @title Local embedding layer
+#
+# Embeds text through Ollama ourselves instead of letting Weaviate's
+# text2vec_ollama module do it per object and per query. Vectors are kept in a
+# persistent content-hash -> vector store: a memory-mapped float32 matrix plus
+# an append-only index of hashes, so identical text (duplicate documents,
+# repeated queries) is only ever embedded once, across runs. Misses are
+# de-duplicated and sent to Ollama in batches.
+#
+# Ingestion uses the "documents" namespace, the agents "queries" and
+# "memories". A store can be shared by several processes (serve.py --workers,
+# uvicorn workers): appends hold an exclusive lock on a `.lock` file and first
+# read the index lines other processes added since, so every process places
+# new vectors after the last row on disk and maps each hash to the same row.
+
+import contextlib
+import hashlib
+import os
+import threading
+from typing import Optional, Sequence
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+import numpy as np
+import requests
+
+from .search_cache import CACHE_DIR
+
+OLLAMA_URL = os.environ.get("OLLAMA_URL", "http://localhost:11434")
+OLLAMA_EMBED_MODEL = os.environ.get("OLLAMA_EMBED_MODEL", "nomic-embed-text")
+EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", "64"))
+
+# "local" makes get_file query with near_vector and populate.py push precomputed vectors
+EMBEDDINGS_MODE = os.environ.get("EMBEDDINGS", "weaviate")
+
+
+def document_text(title: str, content: str) -> str:
+    """Text embedded for a stored object (kept in one place so ingest and re-embeds agree)."""
+    return f"{title}\n{content}"
+
+
+def text_hash(text: str, model: str = OLLAMA_EMBED_MODEL) -> str:
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+@contextlib.contextmanager
+def _file_lock(path: str):
+    """Exclusive lock between processes, held for the duration of the block."""
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class EmbeddingStore:
+    """Persistent hash -> vector map backed by a memory-mapped matrix."""
+
+    def __init__(self, name: str, directory: str = os.path.join(CACHE_DIR, "embeddings")):
+        os.makedirs(directory, exist_ok=True)
+        self.vectors_path = os.path.join(directory, f"{name}.f32")
+        self.index_path = os.path.join(directory, f"{name}.index")
+        self.lock_path = os.path.join(directory, f"{name}.lock")
+        self._lock = threading.Lock()
+        self._rows: dict[str, int] = {}
+        self._matrix: Optional[np.memmap] = None
+        self._index_read = 0  # bytes of the index file already loaded into _rows
+        self._row_count = 0  # index lines (rows) so far; the next vector goes in this row
+        self.dim = 0
+        self._refresh()
+
+    def _refresh(self) -> None:
+        """Load index lines appended since the last read, by this process or any other."""
+        try:
+            with open(self.index_path, "rb") as f:
+                f.seek(self._index_read)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        complete = data.rfind(b"\n") + 1  # A line is only complete once its newline is written
+        lines = data[:complete].decode().splitlines()
+        self._index_read += complete
+        if not self.dim and lines:
+            header = lines.pop(0).split()
+            self.dim = int(header[1]) if len(header) == 2 else 0
+        if not self.dim or not lines:
+            return
+        start = self._row_count
+        if self._matrix is None or start + len(lines) > self._matrix.shape[0]:
+            self._open(start + len(lines))
+        for offset, line in enumerate(lines):
+            self._rows[line.strip()] = start + offset
+        self._row_count += len(lines)
+
+    def _open(self, capacity: int) -> None:
+        mode = "r+" if os.path.exists(self.vectors_path) else "w+"
+        if mode == "r+":
+            capacity = max(capacity, os.path.getsize(self.vectors_path) // (4 * self.dim))
+        self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode=mode, shape=(capacity, self.dim))
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        # Lock-free: put_many() swaps in a grown matrix with one assignment before it indexes
+        # new rows, so the matrix read after the row always covers it
+        row = self._rows.get(key)
+        matrix = self._matrix
+        if row is None or matrix is None:
+            return None
+        return np.array(matrix[row])
+
+    def put_many(self, items: Sequence[tuple[str, Sequence[float]]]) -> None:
+        with self._lock, _file_lock(self.lock_path):
+            # Other processes may have appended since; new rows go after theirs
+            self._refresh()
+            items = [(key, vector) for key, vector in items if key not in self._rows]
+            if not items:
+                return
+            if not self.dim:
+                self.dim = len(items[0][1])
+                header = f"dim {self.dim}\n"
+                with open(self.index_path, "w") as f:
+                    f.write(header)
+                self._index_read = len(header)
+            start = self._row_count
+            needed = start + len(items)
+            if self._matrix is None or needed > self._matrix.shape[0]:
+                # Grow geometrically so appends stay amortized O(1)
+                if self._matrix is not None:
+                    self._matrix.flush()
+                self._open(max(needed, 2 * start, 1024))
+            for offset, (_, vector) in enumerate(items):
+                self._matrix[start + offset] = vector
+            self._matrix.flush()
+            # Vectors are on disk before their index lines, so a crash never indexes garbage
+            lines = "".join(f"{key}\n" for key, _ in items)
+            with open(self.index_path, "a") as f:
+                f.write(lines)
+            self._index_read += len(lines.encode())
+            for offset, (key, _) in enumerate(items):
+                self._rows[key] = start + offset
+            self._row_count = needed
+
+
+class Embedder:
+    """Batched Ollama embeddings in front of an EmbeddingStore."""
+
+    def __init__(self, store: EmbeddingStore, model: str = OLLAMA_EMBED_MODEL, url: str = OLLAMA_URL,
+                 batch_size: int = EMBED_BATCH_SIZE):
+        self.store = store
+        self.model = model
+        self.url = url.rstrip("/")
+        self.batch_size = batch_size
+        self._session = requests.Session()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _call_ollama(self, texts: list[str]) -> list[list[float]]:
+        response = self._session.post(f"{self.url}/api/embed", json={"model": self.model, "input": texts}, timeout=120)
+        response.raise_for_status()
+        return response.json()["embeddings"]
+
+    def embed(self, texts: Sequence[str]) -> list[np.ndarray]:
+        keys = [text_hash(text, self.model) for text in texts]
+        found = {key: self.store.get(key) for key in set(keys)}
+        missing = {key: text for key, text in zip(keys, texts) if found[key] is None}
+        with self._lock:
+            self.hits += len(texts) - sum(1 for key in keys if key in missing)
+            self.misses += len(missing)
+        pending = list(missing.items())
+        for start in range(0, len(pending), self.batch_size):
+            group = pending[start:start + self.batch_size]
+            vectors = self._call_ollama([text for _, text in group])
+            self.store.put_many([(key, vector) for (key, _), vector in zip(group, vectors)])
+            for (key, _), vector in zip(group, vectors):
+                found[key] = np.asarray(vector, dtype=np.float32)
+        return [found[key] for key in keys]
+
+    def embed_one(self, text: str) -> np.ndarray:
+        return self.embed([text])[0]
+
+
+_query_embedder: Optional[Embedder] = None
+_query_lock = threading.Lock()
+
+
+def query_embedder() -> Embedder:
+    """Process-wide embedder for search queries."""
+    global _query_embedder
+    with _query_lock:
+        if _query_embedder is None:
+            _query_embedder = Embedder(EmbeddingStore("queries"))
+        return _query_embedder
@@ -0,0 +1,132 @@
+# @title Deterministic scripted model for benchmarks
+#
+# ScriptedLlm stands in for Gemini so the real agent graph (callbacks, tools,
+# sub-agents, session store) can be driven without network calls. Each agent
+# gets its own instance and a script: a list of steps, one per model call in a
+# turn. A step is
+#   {"call": name, "args": {...}}        one function call
+#   {"calls": [{"call": ..., "args": ...}, ...]}   several calls in one response
+#   {"text": "..."}                       the final answer
+# The step is picked by counting the function responses since the turn's
+# user message, so the n-th model call of a turn always plays step n, and the
+# last step repeats if the flow asks for more. "{input}" in any string is
+# replaced by the user's message (for a sub-agent, the AgentTool request).
+# A turn can override agents' scripts by setting `turn_scripts` to
+# {agent name: steps} around the call; the ContextVar follows the turn into
+# sub-agents and fan-out tasks.
+#
+# Latency is `latency_ms` per call, scaled by a jitter factor drawn from a
+# generator seeded with the agent, input and step, so repeated runs sleep
+# exactly the same. Streaming requests get the answer in chunks, the first
+# one after `ttft_fraction` of the call's latency. Token usage is reported
+# with the chars/4 estimate used elsewhere in the repo.
+
+import asyncio
+import json
+import random
+from contextvars import ContextVar
+from typing import Any, AsyncGenerator, Optional
+
+from google.adk.models import BaseLlm, LlmRequest, LlmResponse
+from google.genai import types
+
+turn_scripts: ContextVar[dict[str, list[dict]]] = ContextVar("turn_scripts", default={})
+
+DEFAULT_REPLY = "Done: {input}"
+STREAM_CHUNKS = 4
+
+
+def _fill(value: Any, text: str) -> Any:
+    if isinstance(value, str):
+        return value.replace("{input}", text)
+    if isinstance(value, dict):
+        return {key: _fill(item, text) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_fill(item, text) for item in value]
+    return value
+
+
+def _turn_position(llm_request: LlmRequest) -> tuple[str, int]:
+    """The turn's user message and how many tool rounds the turn has had so far."""
+    rounds = 0
+    for content in reversed(llm_request.contents or []):
+        parts = content.parts or []
+        if any(part.function_response for part in parts):
+            rounds += 1
+            continue
+        if content.role == "user":
+            return " ".join(part.text for part in parts if part.text), rounds
+    return "", rounds
+
+
+class ScriptedLlm(BaseLlm):
+    """A model that plays a fixed script of tool calls and answers, with configurable latency."""
+
+    agent_name: str = ""
+    script: list[dict] = []
+    latency_ms: float = 0.0
+    jitter: float = 0.0  # +/- fraction of latency_ms
+    ttft_fraction: float = 0.3
+    seed: int = 0
+
+    def _latency(self, text: str, step: int) -> float:
+        if not self.latency_ms:
+            return 0.0
+        rng = random.Random(f"{self.seed}:{self.agent_name}:{text}:{step}")
+        return self.latency_ms / 1000 * rng.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _usage(self, llm_request: LlmRequest, output: str) -> types.GenerateContentResponseUsageMetadata:
+        prompt_chars = len(str(llm_request.config.system_instruction or "")) if llm_request.config else 0
+        prompt_chars += sum(len(part.text or "") for content in llm_request.contents or [] for part in content.parts or [])
+        return types.GenerateContentResponseUsageMetadata(
+            prompt_token_count=prompt_chars // 4, candidates_token_count=len(output) // 4)
+
+    async def generate_content_async(self, llm_request: LlmRequest, stream: bool = False) -> AsyncGenerator[LlmResponse, None]:
+        text, step_index = _turn_position(llm_request)
+        script = turn_scripts.get().get(self.agent_name, self.script) or [{"text": DEFAULT_REPLY}]
+        step = _fill(script[min(step_index, len(script) - 1)], text)
+        latency = self._latency(text, step_index)
+
+        if "text" not in step:
+            calls = step.get("calls") or [step]
+            parts = [types.Part(function_call=types.FunctionCall(name=call["call"], args=call.get("args") or {}))
+                     for call in calls]
+            await asyncio.sleep(latency)
+            yield LlmResponse(content=types.Content(role="model", parts=parts),
+                              usage_metadata=self._usage(llm_request, json.dumps(calls)))
+            return
+
+        reply = step["text"]
+        if stream:
+            await asyncio.sleep(latency * self.ttft_fraction)
+            size = max(1, -(-len(reply) // STREAM_CHUNKS))
+            chunks = [reply[i:i + size] for i in range(0, len(reply), size)]
+            for i, chunk in enumerate(chunks):
+                if i:
+                    await asyncio.sleep(latency * (1 - self.ttft_fraction) / max(1, len(chunks) - 1))
+                yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=chunk)]), partial=True)
+        else:
+            await asyncio.sleep(latency)
+        yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=reply)]),
+                          usage_metadata=self._usage(llm_request, reply))
+
+
+def script_agents(agent, scripts: dict[str, list[dict]], latency_ms: float = 0.0, jitter: float = 0.0,
+                  seed: int = 0, _seen: Optional[set] = None) -> list[str]:
+    """Give `agent` and every agent reachable from it a ScriptedLlm; returns the agent names."""
+    seen = _seen if _seen is not None else set()
+    if id(agent) in seen:
+        return []
+    seen.add(id(agent))
+    names = []
+    if hasattr(agent, "model"):
+        agent.model = ScriptedLlm(model=f"scripted-{agent.name}", agent_name=agent.name,
+                                  script=scripts.get(agent.name, []), latency_ms=latency_ms, jitter=jitter, seed=seed)
+        names.append(agent.name)
+        for tool in agent.tools:
+            sub_agent = getattr(tool, "agent", None)
+            if sub_agent is not None:
+                names += script_agents(sub_agent, scripts, latency_ms, jitter, seed, seen)
+    for sub_agent in agent.sub_agents:
+        names += script_agents(sub_agent, scripts, latency_ms, jitter, seed, seen)
+    return names
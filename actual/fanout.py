@@ -0,0 +1,142 @@
+# @title Parallel fan-out of independent tool calls
+#
+# When the model asks for several sub-agents in one turn ("find the Q3 report
+# and email it, and ..."), ADK executes the function calls one after another,
+# so the turn takes the sum of every sub-agent's time. ParallelFanOut hooks
+# into the agent's callbacks. As soon as a model response containing several
+# calls to fan-out tools arrives (after_model_callback), all of them are
+# started concurrently, bounded by a semaphore and each with its own timeout.
+# ADK then walks the calls in order as usual, and before_tool_callback hands
+# each one the result of its already-running task instead of starting it
+# again. Results therefore come back in the order the model asked for them,
+# and the turn takes about as long as the slowest call.
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Optional
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import LlmResponse
+from google.adk.tools.base_tool import BaseTool
+from google.adk.tools.tool_context import ToolContext
+
+FANOUT_CONCURRENCY = int(os.environ.get("FANOUT_CONCURRENCY", "4"))
+FANOUT_TIMEOUT = float(os.environ.get("FANOUT_TIMEOUT", "120"))
+
+
+def _call_key(invocation_id: str, name: str, args: Optional[dict]) -> tuple[str, str, str]:
+    return invocation_id, name, json.dumps(args or {}, sort_keys=True, default=str)
+
+
+class ParallelFanOut:
+    """Runs independent calls to `tools` from one model response concurrently."""
+
+    def __init__(self, tools: list[BaseTool], max_concurrency: int = FANOUT_CONCURRENCY,
+                 timeout: float = FANOUT_TIMEOUT):
+        self.tools = {tool.name: tool for tool in tools}
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        # (invocation id, tool name, args) -> started tasks, oldest first (the model may repeat a call)
+        self._started: dict[tuple[str, str, str], list[asyncio.Task]] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.calls = 0
+        self.timeouts = 0
+        self.call_seconds = 0.0  # sum of individual call durations
+        self.wall_seconds = 0.0  # time the batches actually took
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    async def _run(self, tool: BaseTool, args: dict, tool_context: ToolContext) -> tuple[dict, float]:
+        async with self._get_semaphore():
+            started = time.perf_counter()
+            try:
+                result = await asyncio.wait_for(tool.run_async(args=args, tool_context=tool_context), self.timeout)
+                response = result if isinstance(result, dict) else {"result": result}
+            except asyncio.TimeoutError:
+                with self._lock:
+                    self.timeouts += 1
+                response = {"status": "error", "error_message": f"{tool.name} timed out after {self.timeout} seconds."}
+            except Exception as e:
+                logging.warning(f"[FanOut] {tool.name} failed: {e}")
+                response = {"status": "error", "error_message": f"{tool.name} failed: {e}"}
+            return response, time.perf_counter() - started
+
+    async def after_model(self, callback_context: CallbackContext, llm_response: LlmResponse) -> Optional[LlmResponse]:
+        """Start every fan-out call of a multi-call response at once."""
+        if llm_response.partial or not llm_response.content or not llm_response.content.parts:
+            return None
+        calls = [part.function_call for part in llm_response.content.parts
+                 if part.function_call and part.function_call.name in self.tools]
+        if len(calls) < 2:
+            return None
+        invocation_id = callback_context.invocation_id
+        batch_started = time.perf_counter()
+        tasks = []
+        for call in calls:
+            args = dict(call.args or {})
+            # A private context: its state changes are copied into the real call's context on pickup
+            tool_context = ToolContext(callback_context._invocation_context)
+            task = asyncio.create_task(self._run(self.tools[call.name], args, tool_context))
+            task.tool_context = tool_context
+            self._started.setdefault(_call_key(invocation_id, call.name, args), []).append(task)
+            tasks.append(task)
+        logging.info(f"[FanOut] Running {len(tasks)} calls concurrently: {[call.name for call in calls]}")
+
+        def _finished(_):
+            if all(task.done() for task in tasks):
+                durations = [task.result()[1] for task in tasks if not task.cancelled()]
+                with self._lock:
+                    self.batches += 1
+                    self.calls += len(tasks)
+                    self.call_seconds += sum(durations)
+                    self.wall_seconds += time.perf_counter() - batch_started
+
+        for task in tasks:
+            task.add_done_callback(_finished)
+        return None
+
+    async def before_tool(self, tool: BaseTool, args: dict[str, Any], tool_context: ToolContext) -> Optional[dict]:
+        """Hand a call the result of its pre-started task, if there is one."""
+        key = _call_key(tool_context.invocation_id, tool.name, args)
+        pending = self._started.get(key)
+        if not pending:
+            return None
+        task = pending.pop(0)
+        if not pending:
+            del self._started[key]
+        response, _ = await task
+        state_delta = task.tool_context.actions.state_delta
+        if state_delta:
+            tool_context.state.update(state_delta)
+        return response
+
+    def finish(self, callback_context: CallbackContext) -> None:
+        """Cancel calls the flow never picked up (e.g. the turn was aborted)."""
+        invocation_id = callback_context.invocation_id
+        for key in [key for key in self._started if key[0] == invocation_id]:
+            for task in self._started.pop(key):
+                task.cancel()
+        return None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "calls": self.calls,
+                "timeouts": self.timeouts,
+                "sequential_s": self.call_seconds,
+                "parallel_s": self.wall_seconds,
+                "saved_s": self.call_seconds - self.wall_seconds,
+            }
@@ -0,0 +1,64 @@
+# @title Vector index profiles for the Document collection
+#
+# Named HNSW / quantization settings that trade recall for latency and memory.
+# weaviate/set_up.py applies one with --profile, and
+# weaviate/benchmark_index.py measures recall@k, QPS and Weaviate's resident
+# memory for each of them so the choice is based on numbers.
+
+from typing import Optional
+
+import weaviate.classes.config as wvcc
+
+# None means "leave it to Weaviate"; ef=-1 turns on dynamic ef (bounded by dynamic_ef_min/max)
+INDEX_PROFILES = {
+    "default": {},
+    "low-latency": {
+        "ef": 48,
+        "ef_construction": 96,
+        "max_connections": 16,
+    },
+    "balanced": {
+        "ef": -1,
+        "dynamic_ef_min": 100,
+        "dynamic_ef_max": 400,
+        "ef_construction": 256,
+        "max_connections": 32,
+    },
+    "high-recall": {
+        "ef": 512,
+        "ef_construction": 512,
+        "max_connections": 64,
+    },
+    "memory-saving": {
+        "ef": 128,
+        "ef_construction": 128,
+        "max_connections": 16,
+        "quantizer": "pq",
+    },
+    "binary": {
+        "ef": 128,
+        "ef_construction": 128,
+        "max_connections": 24,
+        "quantizer": "bq",
+        "rescore_limit": 256,
+    },
+}
+
+DEFAULT_PROFILE = "default"
+
+
+def vector_index_config(profile: str = DEFAULT_PROFILE, pq_training_limit: Optional[int] = None):
+    """Return the `vector_index_config` for a named profile (None keeps Weaviate's defaults)."""
+    if profile not in INDEX_PROFILES:
+        raise ValueError(f"Unknown index profile '{profile}'. Choose one of: {', '.join(INDEX_PROFILES)}")
+    settings = dict(INDEX_PROFILES[profile])
+    if not settings:
+        return None
+
+    quantizer = settings.pop("quantizer", None)
+    rescore_limit = settings.pop("rescore_limit", None)
+    if quantizer == "pq":
+        settings["quantizer"] = wvcc.Configure.VectorIndex.Quantizer.pq(training_limit=pq_training_limit)
+    elif quantizer == "bq":
+        settings["quantizer"] = wvcc.Configure.VectorIndex.Quantizer.bq(cache=True, rescore_limit=rescore_limit)
+    return wvcc.Configure.VectorIndex.hnsw(**settings)
@@ -0,0 +1,336 @@
+# @title Streaming ingestion for the Document collection
+#
+# Used by weaviate/populate.py. Sources (directories, JSONL and CSV files) are
+# read lazily one record at a time, long content is split into overlapping
+# chunks, and records are written in segments: each segment goes through a
+# Weaviate-managed batch (dynamic, or rate limited to protect the Ollama
+# vectorizer), failed objects are retried on their own, and only then is the
+# segment recorded in the checkpoint file. An interrupted load resumes at the
+# last completed segment; deterministic object ids make the replayed segment
+# overwrite instead of duplicate. Objects that still fail after the retries
+# are reported in IngestStats.failed_objects, and their source's checkpoint
+# stops advancing, so the next run writes them again instead of skipping them.
+#
+# In sync mode every object also carries a hash of its record, so a re-run
+# only re-embeds records that are new or changed and deletes the objects of
+# records that disappeared from the sources.
+#
+# With an Embedder, vectors are computed locally (deduplicated and cached by
+# content hash) and pushed with each object, so Weaviate's vectorizer is skipped.
+
+import csv
+import hashlib
+import json
+import os
+import sys
+import time
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Optional
+
+from weaviate.classes.query import Filter
+from weaviate.util import generate_uuid5
+
+from .embeddings import Embedder, document_text
+
+TEXT_EXTENSIONS = (".txt", ".md", ".rst", ".html", ".csv", ".json", ".py")
+
+# Large CSV cells (whole documents) exceed the csv module's default field limit
+csv.field_size_limit(min(sys.maxsize, 2**31 - 1))
+
+
+@dataclass
+class Record:
+    """One source document before chunking."""
+    key: str      # Stable identifier of the record within its source, e.g. "docs.jsonl:42"
+    title: str
+    content: str
+
+
+def read_directory(path: str, extensions: Iterable[str] = TEXT_EXTENSIONS) -> Iterator[Record]:
+    """Yield one record per text file under `path`, in a stable (sorted) order."""
+    extensions = tuple(extensions)
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            if not name.lower().endswith(extensions):
+                continue
+            file_path = os.path.join(root, name)
+            with open(file_path, encoding="utf-8", errors="replace") as f:
+                content = f.read()
+            yield Record(
+                key=os.path.relpath(file_path, path).replace(os.sep, "/"),
+                title=os.path.splitext(name)[0],
+                content=content,
+            )
+
+
+def read_jsonl(path: str, title_field: str = "title", content_field: str = "content") -> Iterator[Record]:
+    """Yield one record per non-empty JSON line."""
+    name = os.path.basename(path)
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            yield Record(
+                key=str(row.get("id") or f"{name}:{line_no}"),
+                title=str(row.get(title_field) or f"{name} #{line_no}"),
+                content=str(row.get(content_field) or ""),
+            )
+
+
+def read_csv(path: str, title_field: str = "title", content_field: str = "content") -> Iterator[Record]:
+    """Yield one record per CSV row (the first row is the header)."""
+    name = os.path.basename(path)
+    with open(path, encoding="utf-8", newline="") as f:
+        for row_no, row in enumerate(csv.DictReader(f), start=1):
+            yield Record(
+                key=str(row.get("id") or f"{name}:{row_no}"),
+                title=str(row.get(title_field) or f"{name} #{row_no}"),
+                content=str(row.get(content_field) or ""),
+            )
+
+
+def read_source(path: str, title_field: str = "title", content_field: str = "content") -> Iterator[Record]:
+    """Pick a reader from the path: a directory, *.jsonl or *.csv."""
+    if os.path.isdir(path):
+        return read_directory(path)
+    if path.endswith(".jsonl"):
+        return read_jsonl(path, title_field, content_field)
+    if path.endswith(".csv"):
+        return read_csv(path, title_field, content_field)
+    raise ValueError(f"Unsupported source (expected a directory, .jsonl or .csv): {path}")
+
+
+def chunk_text(text: str, max_chars: int = 2000, overlap: int = 200) -> list[str]:
+    """Split `text` into chunks of at most `max_chars`, cutting at whitespace where possible."""
+    if len(text) <= max_chars:
+        return [text]
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + max_chars, len(text))
+        if end < len(text):
+            # Prefer a paragraph break, then any whitespace, in the second half of the window
+            cut = text.rfind("\n\n", start + max_chars // 2, end)
+            if cut == -1:
+                cut = text.rfind(" ", start + max_chars // 2, end)
+            if cut != -1:
+                end = cut
+        chunks.append(text[start:end].strip())
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return [chunk for chunk in chunks if chunk]
+
+
+class Checkpoint:
+    """Per-source count of records that are durably stored, persisted as JSON."""
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self.done: dict[str, int] = {}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.done = json.load(f)
+
+    def get(self, source: str) -> int:
+        return self.done.get(source, 0)
+
+    def update(self, source: str, records_done: int) -> None:
+        self.done[source] = records_done
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.done, f)
+        os.replace(tmp_path, self.path)
+
+
+def content_hash(record: Record) -> str:
+    return hashlib.sha256(f"{record.title}\0{record.content}".encode("utf-8")).hexdigest()
+
+
+def object_uuid(source_key: str, chunk_index: int) -> str:
+    """Deterministic object id, so re-loading a record replaces it instead of duplicating it."""
+    return generate_uuid5(f"{source_key}#{chunk_index}")
+
+
+def record_objects(source_key: str, record: Record, record_hash: str, chunk_chars: int,
+                   overlap: int) -> list[tuple[str, dict]]:
+    """Return (uuid, properties) for every chunk of a record."""
+    return [
+        (object_uuid(source_key, chunk_index), {
+            "title": record.title,
+            "content": chunk,
+            "source": source_key,
+            "chunk_index": chunk_index,
+            "content_hash": record_hash,
+            "doc_size": len(record.content),
+        })
+        for chunk_index, chunk in enumerate(chunk_text(record.content, chunk_chars, overlap))
+    ]
+
+
+def stored_records(collection, source_names: list[str]) -> dict[str, tuple[Optional[str], int]]:
+    """Map source key -> (content hash, chunk count) for what is already stored from these sources."""
+    prefixes = tuple(f"{name}::" for name in source_names)
+    stored: dict[str, tuple[Optional[str], int]] = {}
+    counts: dict[str, int] = {}
+    for obj in collection.iterator(return_properties=["source", "content_hash", "chunk_index"]):
+        source_key = obj.properties.get("source") or ""
+        if not source_key.startswith(prefixes):
+            continue
+        _, chunks = stored.get(source_key, (None, 0))
+        stored[source_key] = (obj.properties.get("content_hash"),
+                              max(chunks, (obj.properties.get("chunk_index") or 0) + 1))
+        counts[source_key] = counts.get(source_key, 0) + 1
+    # A record with a chunk missing (it failed to import) has no valid hash, so sync rewrites it
+    return {key: (record_hash if counts[key] == chunks else None, chunks)
+            for key, (record_hash, chunks) in stored.items()}
+
+
+def delete_objects(collection, uuids: list[str], group_size: int = 1000) -> int:
+    deleted = 0
+    for start in range(0, len(uuids), group_size):
+        result = collection.data.delete_many(where=Filter.by_id().contains_any(uuids[start:start + group_size]))
+        deleted += result.successful
+    return deleted
+
+
+class IngestStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.records = 0
+        self.objects = 0
+        self.failed = 0
+        self.failed_objects: list[dict] = []  # {"uuid", "source", "chunk_index", "error"} per object given up on
+        self.unchanged = 0
+        self.deleted = 0
+        self.batch_latencies: list[float] = []
+
+    def report(self) -> str:
+        elapsed = time.perf_counter() - self.started
+        latencies = sorted(self.batch_latencies)
+        p50 = latencies[len(latencies) // 2] if latencies else 0.0
+        worst = latencies[-1] if latencies else 0.0
+        return (f"{self.records} docs / {self.objects} objects in {elapsed:.1f}s "
+                f"({self.records / elapsed if elapsed else 0:.1f} docs/s, "
+                f"{self.objects / elapsed if elapsed else 0:.1f} objects/s), "
+                f"segment latency p50={p50:.2f}s max={worst:.2f}s, failed={self.failed}, "
+                f"unchanged={self.unchanged}, deleted={self.deleted}")
+
+
+def _write_segment(collection, objects: list[tuple[str, dict]], requests_per_minute: Optional[int],
+                   max_retries: int, embedder: Optional[Embedder] = None) -> list:
+    """Write one segment and retry only the objects that failed. Returns what still failed."""
+    if embedder is not None:
+        vectors = embedder.embed([document_text(p["title"], p["content"]) for _, p in objects])
+        pending = [(uuid, properties, vector.tolist()) for (uuid, properties), vector in zip(objects, vectors)]
+    else:
+        pending = [(uuid, properties, None) for uuid, properties in objects]
+    for attempt in range(max_retries + 1):
+        batcher = (collection.batch.rate_limit(requests_per_minute=requests_per_minute)
+                   if requests_per_minute else collection.batch.dynamic())
+        with batcher as batch:
+            for uuid, properties, vector in pending:
+                batch.add_object(properties=properties, uuid=uuid, vector=vector)
+        failed = collection.batch.failed_objects
+        if not failed:
+            return []
+        if attempt == max_retries:
+            return failed
+        print(f"  {len(failed)} objects failed ({failed[0].message}); retrying them (attempt {attempt + 1}/{max_retries})")
+        time.sleep(2 ** attempt)
+        pending = [(str(error.object_.uuid), error.object_.properties, error.object_.vector) for error in failed]
+    return []
+
+
+def ingest(collection, sources: list[str], checkpoint: Checkpoint, segment_size: int = 500,
+           chunk_chars: int = 2000, overlap: int = 200, requests_per_minute: Optional[int] = None,
+           max_retries: int = 3, title_field: str = "title", content_field: str = "content",
+           sync: bool = False, embedder: Optional[Embedder] = None,
+           source_names: Optional[list[str]] = None) -> IngestStats:
+    """Stream every source into `collection`, checkpointing after each completed segment.
+
+    Object ids, checkpoint entries and sync prefixes are keyed by each source's
+    name: its resolved absolute path unless `source_names` gives one per source,
+    so the same data keeps its ids whatever the working directory.
+
+    With sync=True, records whose content hash matches what is stored are skipped,
+    and objects of records no longer present in the sources are deleted.
+    With an embedder, objects are written with precomputed vectors.
+    """
+    stats = IngestStats()
+    if source_names is None:
+        source_names = [os.path.realpath(source) for source in sources]
+    elif len(source_names) != len(sources):
+        raise ValueError(f"Got {len(source_names)} source names for {len(sources)} sources")
+    stored = stored_records(collection, source_names) if sync else {}
+    stale: list[str] = []
+    for source, source_name in zip(sources, source_names):
+        skip = 0 if sync else checkpoint.get(source_name)
+        if skip:
+            print(f"Resuming {source} after {skip} records")
+        records_done = 0
+        segment: list[tuple[str, dict]] = []
+        segment_records = 0
+        source_failed = False
+
+        def flush():
+            nonlocal segment, segment_records, source_failed
+            started = time.perf_counter()
+            failed = _write_segment(collection, segment, requests_per_minute, max_retries, embedder)
+            latency = time.perf_counter() - started
+            stats.batch_latencies.append(latency)
+            stats.records += segment_records
+            stats.objects += len(segment) - len(failed)
+            stats.failed += len(failed)
+            if failed:
+                print(f"  {len(failed)} objects still failing after retries, first error: {failed[0].message}")
+                stats.failed_objects.extend(
+                    {"uuid": str(error.object_.uuid), "source": error.object_.properties.get("source"),
+                     "chunk_index": error.object_.properties.get("chunk_index"), "error": error.message}
+                    for error in failed)
+                source_failed = True
+            if not sync:
+                if source_failed:
+                    # The checkpoint is a count of records from the start; it cannot skip past a failed one
+                    print(f"  {source}: checkpoint stays at {checkpoint.get(source_name)} records because objects failed")
+                else:
+                    checkpoint.update(source_name, records_done)
+            print(f"  {source}: {records_done} records done, segment of {len(segment)} objects in {latency:.2f}s "
+                  f"({len(segment) / latency if latency else 0:.1f} objects/s)")
+            segment = []
+            segment_records = 0
+
+        for record in read_source(source, title_field, content_field):
+            records_done += 1
+            if records_done <= skip:
+                continue
+            source_key = f"{source_name}::{record.key}"
+            record_hash = content_hash(record)
+            objects = record_objects(source_key, record, record_hash, chunk_chars, overlap)
+            if sync:
+                stored_hash, stored_chunks = stored.pop(source_key, (None, 0))
+                if stored_hash == record_hash and stored_chunks == len(objects):
+                    stats.unchanged += 1
+                    continue
+                # The record shrank: drop the chunks past its new end
+                stale.extend(object_uuid(source_key, i) for i in range(len(objects), stored_chunks))
+            segment.extend(objects)
+            segment_records += 1
+            if segment_records >= segment_size:
+                flush()
+        if segment:
+            flush()
+
+    if sync:
+        # Whatever was not seen in this run has been removed from the sources
+        for source_key, (_, chunks) in stored.items():
+            stale.extend(object_uuid(source_key, i) for i in range(chunks))
+        if stale:
+            stats.deleted = delete_objects(collection, stale)
+            print(f"  Deleted {stats.deleted} stale objects")
+    return stats
@@ -0,0 +1,423 @@
+# @title Per-tool and per-agent instrumentation
+#
+# ADK already opens spans for each invocation, agent run and model call, but
+# only its tool_call span times the tool itself. That span leaves out answers
+# served by before_tool callbacks (search/SQL caches, pre-started fan-out
+# calls), and none of ADK's spans record payload sizes or token counts. The
+# tools themselves printed their full results to stdout on every call.
+#
+# instrument(agent) appends a set of callbacks to an agent and to every
+# sub-agent reachable through AgentTools:
+#   - a "tool [name]" span per tool call, covering everything from the first
+#     before_tool callback to the last after_tool callback, with argument and
+#     result sizes (bytes and estimated tokens) and the error status
+#   - the model's token usage, request size and latency, set on ADK's call_llm span
+#   - per-agent totals (duration, model calls, tokens, tool calls) on ADK's
+#     agent_run span, which is what a sub-agent call looks like in a trace
+#   - the same numbers as OpenTelemetry histograms, exported by tracing.py
+#   - an in-process hot-spot table (count, total, p50/p95/p99 per tool, model and
+#     agent), printed at shutdown, so slow spots show up even with no exporter
+#
+# The callbacks only ever return None, so they never change a turn's outcome.
+# Tool logging goes through `logging` at DEBUG/INFO (LOG_LEVEL, default
+# WARNING) with payloads wrapped in Truncated(), which serialises nothing
+# unless the record is actually emitted. `python -m actual.instrumentation
+# --overhead` measures the cost of the layer under concurrent load.
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Optional
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import LlmRequest, LlmResponse
+from google.adk.tools.base_tool import BaseTool
+from google.adk.tools.tool_context import ToolContext
+from opentelemetry import metrics, trace
+from opentelemetry.trace import Status, StatusCode
+
+from .registry import at_shutdown
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "WARNING").upper()
+# Longest payload written to a log record
+LOG_MAX_CHARS = int(os.environ.get("LOG_MAX_CHARS", "500"))
+# Samples kept per tool/model/agent for the shutdown percentiles
+HOTSPOT_SAMPLES = int(os.environ.get("HOTSPOT_SAMPLES", "2048"))
+HOTSPOT_TOP = int(os.environ.get("HOTSPOT_TOP", "10"))
+# Spans and timers whose closing callback never ran (the tool raised, the turn was aborted)
+MAX_OPEN_SPANS = 10000
+
+
+def setup_logging() -> None:
+    """Configure the root logger from LOG_LEVEL; does nothing if logging is already configured."""
+    logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)s %(message)s")
+
+
+class Truncated:
+    """Lazy log argument: JSON-encodes and shortens `value` only if the record is emitted."""
+
+    __slots__ = ("value", "limit")
+
+    def __init__(self, value: Any, limit: int = LOG_MAX_CHARS):
+        self.value = value
+        self.limit = limit
+
+    def __str__(self) -> str:
+        text = self.value if isinstance(self.value, str) else json.dumps(self.value, default=str, ensure_ascii=False)
+        if len(text) <= self.limit:
+            return text
+        return f"{text[:self.limit]}... ({len(text)} chars)"
+
+
+def payload_size(value: Any) -> int:
+    """Size in bytes of a tool argument or result, as it would be sent to the model."""
+    if value is None:
+        return 0
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    return len(json.dumps(value, default=str, ensure_ascii=False))
+
+
+def _percentile(values: list[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class HotSpots:
+    """Running count/total per (kind, name) plus a window of recent durations for percentiles."""
+
+    def __init__(self, samples: int = HOTSPOT_SAMPLES):
+        self.samples = samples
+        self._lock = threading.Lock()
+        self._entries: dict[tuple[str, str], list] = {}  # -> [count, total seconds, errors, recent durations]
+
+    def record(self, kind: str, name: str, seconds: float, error: bool = False) -> None:
+        with self._lock:
+            entry = self._entries.get((kind, name))
+            if entry is None:
+                entry = self._entries[(kind, name)] = [0, 0.0, 0, deque(maxlen=self.samples)]
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] += error
+            entry[3].append(seconds)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> list[dict]:
+        """Every tool, model and agent seen, the most total time first."""
+        with self._lock:
+            rows = [(kind, name, count, total, errors, list(recent))
+                    for (kind, name), (count, total, errors, recent) in self._entries.items()]
+        return [
+            {
+                "kind": kind,
+                "name": name,
+                "count": count,
+                "errors": errors,
+                "total_s": round(total, 4),
+                "p50_ms": round(_percentile(recent, 0.50) * 1000, 2),
+                "p95_ms": round(_percentile(recent, 0.95) * 1000, 2),
+                "p99_ms": round(_percentile(recent, 0.99) * 1000, 2),
+                "max_ms": round(max(recent) * 1000, 2),
+            }
+            for kind, name, count, total, errors, recent in sorted(rows, key=lambda row: row[3], reverse=True)
+        ]
+
+
+def _is_error(response: Any) -> bool:
+    return isinstance(response, dict) and (response.get("status") == "error" or "error" in response)
+
+
+def _request_chars(llm_request: LlmRequest) -> int:
+    return sum(len(part.text or "") for content in llm_request.contents or [] for part in content.parts or [])
+
+
+def _metrics_exported() -> bool:
+    # Only the SDK provider installed by tracing.setup_tracing has an exporter behind it
+    return hasattr(metrics.get_meter_provider(), "force_flush")
+
+
+def _bounded_put(table: OrderedDict, key, value, on_evict=None) -> None:
+    table[key] = value
+    while len(table) > MAX_OPEN_SPANS:
+        _, stale = table.popitem(last=False)
+        if on_evict:
+            on_evict(stale)
+
+
+def _abandon_span(entry) -> None:
+    span = entry[0]
+    span.set_status(Status(StatusCode.ERROR, "no after_tool callback (the tool raised or the turn was aborted)"))
+    span.end()
+
+
+class Instrumentation:
+    """The callbacks instrument() attaches, and the histograms they record into."""
+
+    def __init__(self):
+        self.tracer = trace.get_tracer("agents.instrumentation")
+        meter = metrics.get_meter("agents.instrumentation")
+        self.tool_duration = meter.create_histogram("agent.tool.duration", unit="ms", description="Tool call latency, including cache hits")
+        self.tool_payload = meter.create_histogram("agent.tool.payload", unit="By", description="Tool argument and result sizes")
+        self.llm_duration = meter.create_histogram("agent.llm.duration", unit="ms", description="Model call latency")
+        self.llm_tokens = meter.create_histogram("agent.llm.tokens", unit="{token}", description="Prompt and output tokens per model call")
+        self.agent_duration = meter.create_histogram("agent.run.duration", unit="ms", description="Agent (and sub-agent) run latency")
+        self.hotspots = HotSpots()
+        # (invocation id, function call id) -> (span, start)
+        self._tools: OrderedDict[tuple, tuple] = OrderedDict()
+        # (invocation id, agent name) -> (start, request chars)
+        self._models: OrderedDict[tuple, tuple] = OrderedDict()
+        # (invocation id, agent name) -> [span, start, model calls, input tokens, output tokens, tool calls]
+        self._agents: OrderedDict[tuple, list] = OrderedDict()
+
+    def before_agent(self, callback_context: CallbackContext) -> None:
+        key = (callback_context.invocation_id, callback_context.agent_name)
+        # Runs inside ADK's agent_run span
+        _bounded_put(self._agents, key, [trace.get_current_span(), time.perf_counter(), 0, 0, 0, 0])
+        return None
+
+    def after_agent(self, callback_context: CallbackContext) -> None:
+        entry = self._agents.pop((callback_context.invocation_id, callback_context.agent_name), None)
+        if entry is None:
+            return None
+        span, started, model_calls, input_tokens, output_tokens, tool_calls = entry
+        seconds = time.perf_counter() - started
+        attributes = {"agent.name": callback_context.agent_name}
+        self.agent_duration.record(seconds * 1000, attributes)
+        self.hotspots.record("agent", callback_context.agent_name, seconds)
+        if span.is_recording():
+            span.set_attributes({
+                "agent.duration_ms": seconds * 1000,
+                "agent.llm_calls": model_calls,
+                "agent.input_tokens": input_tokens,
+                "agent.output_tokens": output_tokens,
+                "agent.tool_calls": tool_calls,
+            })
+        return None
+
+    def before_model(self, callback_context: CallbackContext, llm_request: LlmRequest) -> None:
+        key = (callback_context.invocation_id, callback_context.agent_name)
+        _bounded_put(self._models, key, (time.perf_counter(), _request_chars(llm_request)))
+        return None
+
+    def after_model(self, callback_context: CallbackContext, llm_response: LlmResponse) -> None:
+        if llm_response.partial:
+            return None
+        key = (callback_context.invocation_id, callback_context.agent_name)
+        started = self._models.pop(key, None)
+        if started is None:
+            return None
+        started, request_chars = started
+        seconds = time.perf_counter() - started
+        usage = llm_response.usage_metadata
+        input_tokens = (usage.prompt_token_count or 0) if usage else 0
+        output_tokens = (usage.candidates_token_count or 0) if usage else 0
+        error = llm_response.error_code is not None
+        attributes = {"agent.name": callback_context.agent_name}
+        self.llm_duration.record(seconds * 1000, attributes)
+        self.llm_tokens.record(input_tokens, {**attributes, "token.type": "input"})
+        self.llm_tokens.record(output_tokens, {**attributes, "token.type": "output"})
+        self.hotspots.record("model", callback_context.agent_name, seconds, error)
+        agent = self._agents.get(key)
+        if agent is not None:
+            agent[2] += 1
+            agent[3] += input_tokens
+            agent[4] += output_tokens
+        # Runs inside ADK's call_llm span
+        span = trace.get_current_span()
+        if span.is_recording():
+            span.set_attributes({
+                "llm.duration_ms": seconds * 1000,
+                "llm.request_chars": request_chars,
+                "llm.input_tokens": input_tokens,
+                "llm.output_tokens": output_tokens,
+            })
+        return None
+
+    def before_tool(self, tool: BaseTool, args: dict[str, Any], tool_context: ToolContext) -> None:
+        span = self.tracer.start_span(f"tool [{tool.name}]", attributes={
+            "tool.name": tool.name,
+            "agent.name": tool_context.agent_name,
+        })
+        _bounded_put(self._tools, (tool_context.invocation_id, tool_context.function_call_id),
+                     (span, time.perf_counter()), _abandon_span)
+        return None
+
+    def after_tool(self, tool: BaseTool, args: dict[str, Any], tool_context: ToolContext, tool_response: Any) -> None:
+        entry = self._tools.pop((tool_context.invocation_id, tool_context.function_call_id), None)
+        if entry is None:
+            return None
+        span, started = entry
+        seconds = time.perf_counter() - started
+        error = _is_error(tool_response)
+        attributes = {"tool.name": tool.name, "agent.name": tool_context.agent_name}
+        self.tool_duration.record(seconds * 1000, {**attributes, "tool.error": error})
+        self.hotspots.record("tool", tool.name, seconds, error)
+        agent = self._agents.get((tool_context.invocation_id, tool_context.agent_name))
+        if agent is not None:
+            agent[5] += 1
+        recording = span.is_recording()
+        if not recording and not _metrics_exported():
+            # Sizing means serialising the whole result; skip it when nothing would see the number
+            span.end()
+            return None
+        request_bytes = payload_size(args)
+        response_bytes = payload_size(tool_response)
+        self.tool_payload.record(request_bytes, {**attributes, "payload.direction": "request"})
+        self.tool_payload.record(response_bytes, {**attributes, "payload.direction": "response"})
+        if recording:
+            span.set_attributes({
+                "tool.request_bytes": request_bytes,
+                "tool.response_bytes": response_bytes,
+                # The result is fed back into the prompt; chars/4 like the search token budget
+                "tool.response_tokens_est": response_bytes // 4,
+            })
+            if error:
+                span.set_status(Status(StatusCode.ERROR, str(tool_response.get("error_message") or tool_response.get("error"))[:200]))
+        span.end()
+        return None
+
+
+instrumentation = Instrumentation()
+_instrumented: set[int] = set()
+
+
+def _as_list(callbacks) -> list:
+    if not callbacks:
+        return []
+    return list(callbacks) if isinstance(callbacks, list) else [callbacks]
+
+
+def instrument(agent) -> None:
+    """Attach the instrumentation callbacks to `agent` and every agent reachable from it; idempotent.
+
+    The before_tool/model hooks run first so their timers cover the agent's
+    own callbacks (cache lookups, fan-out waits); the after hooks also run
+    first because ADK stops at the first after callback that returns a value.
+    A before_model callback that answers without calling the model (the intent
+    router) skips the model hooks, which is right: no model call happened.
+    """
+    if id(agent) in _instrumented:
+        return
+    _instrumented.add(id(agent))
+    agent.before_agent_callback = [instrumentation.before_agent, *_as_list(agent.before_agent_callback)]
+    agent.after_agent_callback = [*_as_list(agent.after_agent_callback), instrumentation.after_agent]
+    if hasattr(agent, "before_tool_callback"):
+        # before_model comes last so short-circuiting callbacks ahead of it skip the timer
+        agent.before_model_callback = [*_as_list(agent.before_model_callback), instrumentation.before_model]
+        agent.after_model_callback = [instrumentation.after_model, *_as_list(agent.after_model_callback)]
+        agent.before_tool_callback = [instrumentation.before_tool, *_as_list(agent.before_tool_callback)]
+        agent.after_tool_callback = [instrumentation.after_tool, *_as_list(agent.after_tool_callback)]
+        for tool in agent.tools:
+            sub_agent = getattr(tool, "agent", None)
+            if sub_agent is not None:
+                instrument(sub_agent)
+    for sub_agent in agent.sub_agents:
+        instrument(sub_agent)
+
+
+def _report_hotspots():
+    rows = instrumentation.hotspots.stats()
+    if rows:
+        print(f"--- Hot spots (top {min(HOTSPOT_TOP, len(rows))} by total time) ---")
+        for row in rows[:HOTSPOT_TOP]:
+            print(f"    {row}")
+
+at_shutdown(_report_hotspots)
+
+
+async def measure_overhead(turns: int = 200, calls_per_turn: int = 5, concurrency: int = 20,
+                           payload_chars: int = 2000, rounds: int = 3) -> dict:
+    """Run the same scripted turns through a plain and an instrumented agent and compare wall time.
+
+    The model answers instantly and the tool returns a canned payload, so the
+    difference is the cost of the instrumentation and the configured exporter
+    alone, at full CPU load, which is the worst case: with real model and
+    tool latency the relative overhead is far smaller.
+    """
+    from google.adk.agents import LlmAgent
+    from google.adk.models import BaseLlm
+    from google.adk.runners import Runner
+    from google.adk.sessions import InMemorySessionService
+    from google.genai import types
+
+    payload = "x" * payload_chars
+
+    def lookup(key: str) -> dict:
+        """Return the document stored under key."""
+        return {"status": "success", "key": key, "content": payload}
+
+    class ScriptedLlm(BaseLlm):
+        async def generate_content_async(self, llm_request, stream=False):
+            last = llm_request.contents[-1].parts[0] if llm_request.contents else None
+            usage = types.GenerateContentResponseUsageMetadata(prompt_token_count=100, candidates_token_count=10)
+            if last is not None and last.function_response is None:
+                parts = [types.Part(function_call=types.FunctionCall(name="lookup", args={"key": f"k{i}"}))
+                         for i in range(calls_per_turn)]
+            else:
+                parts = [types.Part(text="done")]
+            yield LlmResponse(content=types.Content(role="model", parts=parts), usage_metadata=usage)
+
+    def build(instrumented: bool) -> Runner:
+        agent = LlmAgent(name="overhead_bench", model=ScriptedLlm(model="scripted"), tools=[lookup])
+        if instrumented:
+            instrument(agent)
+        return Runner(agent=agent, app_name="overhead", session_service=InMemorySessionService())
+
+    async def run(runner: Runner) -> float:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def turn():
+            async with semaphore:
+                session = await runner.session_service.create_session(app_name="overhead", user_id="bench")
+                message = types.Content(role="user", parts=[types.Part(text="look it up")])
+                async for _ in runner.run_async(user_id="bench", session_id=session.id, new_message=message):
+                    pass
+
+        started = time.perf_counter()
+        await asyncio.gather(*(turn() for _ in range(turns)))
+        return time.perf_counter() - started
+
+    runners = {False: build(False), True: build(True)}
+    await run(runners[False])  # warm-up: imports, pydantic schemas
+    # Alternate the two and keep each one's best round, so GC and scheduler noise cancels out
+    best = {False: float("inf"), True: float("inf")}
+    for _ in range(rounds):
+        for instrumented, runner in runners.items():
+            best[instrumented] = min(best[instrumented], await run(runner))
+    plain, instrumented = best[False], best[True]
+    tool_calls = turns * calls_per_turn
+    return {
+        "turns": turns,
+        "rounds": rounds,
+        "tool_calls": tool_calls,
+        "concurrency": concurrency,
+        "plain_s": round(plain, 3),
+        "instrumented_s": round(instrumented, 3),
+        "overhead_pct": round((instrumented - plain) / plain * 100, 1),
+        "overhead_us_per_tool_call": round((instrumented - plain) / tool_calls * 1e6, 1),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the instrumentation overhead with a scripted model.")
+    parser.add_argument("--overhead", action="store_true", help="Run the overhead benchmark")
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--calls", type=int, default=5, help="Tool calls per turn")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+    if args.overhead:
+        from . import tracing
+        tracing.setup_tracing()
+        print(json.dumps({"exporter": tracing.TRACE_EXPORTER,
+                          **asyncio.run(measure_overhead(args.turns, args.calls, args.concurrency, rounds=args.rounds))}))
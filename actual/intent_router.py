@@ -0,0 +1,253 @@
+# @title Deterministic intent router in front of root_agent
+#
+# root_agent spent at least two Gemini turns on every request, one to call
+# `reason` (itself a keyword match) and one to pick an AgentTool, before any
+# sub-agent did work. IntentRouter classifies the message before the model is
+# called: each route's patterns are compiled into a single regex, and when the
+# match is confident and no other route matched at all, root_agent's
+# before_model_callback calls the sub-agent's AgentTool directly and returns
+# its answer as the turn's reply. With EMBEDDINGS=local, messages that no pattern matches are also
+# scored against per-route example utterances. Anything uncertain, including
+# requests that need more than one sub-agent, falls back to the LLM.
+#
+# A routed sub-agent sees only the message itself, not the conversation, so
+# later turns that refer back to it ("email it to alice", "find the report")
+# are left to the LLM as well, which can spell out what is meant.
+#
+# While falling back, the router records its own best guess and compares it
+# with the AgentTool the model picks. That agreement rate is the
+# routing-accuracy metric, and the model time measured on fallback turns gives
+# the latency saved per routed message.
+
+import argparse
+import json
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import numpy as np
+
+ROUTER_ENABLED = os.environ.get("ROUTER", "on") != "off"
+# Minimum confidence to skip the LLM
+ROUTER_MIN_CONFIDENCE = float(os.environ.get("ROUTER_MIN_CONFIDENCE", "0.8"))
+# Embedding classifier: minimum cosine similarity to the best route, and margin over the runner-up
+ROUTER_MIN_SIMILARITY = float(os.environ.get("ROUTER_MIN_SIMILARITY", "0.75"))
+ROUTER_MIN_MARGIN = float(os.environ.get("ROUTER_MIN_MARGIN", "0.05"))
+
+# Route -> (pattern, weight). A route's confidence is 1 - prod(1 - weight) over its matched patterns.
+ROUTE_PATTERNS: dict[str, list[tuple[str, float]]] = {
+    "search_agent": [
+        (r"\b(find|search|look(ing)? (up|for)|locate|pull up)\b.{0,40}\b(files?|documents?|docs?|reports?|notes?|pdfs?)\b", 0.9),
+        (r"\b(search|look up)\b", 0.5),
+        (r"\b(files?|documents?|reports?)\b", 0.4),
+        (r"\bfind\b", 0.4),
+    ],
+    "email_agent": [
+        (r"\b(send|write|draft|compose|reply to|forward)\b.{0,30}\b(e-?mails?|mails?|messages?)\b", 0.9),
+        (r"\be-?mail\b.{0,40}\b(to|about|saying)\b", 0.8),
+        (r"\b(e-?mails?|inbox|mail)\b", 0.5),
+        (r"\bsend\b", 0.3),
+    ],
+}
+
+# Words that point back into the conversation: pronouns, "the same", "what about ...", or a bare "the report"
+BACK_REFERENCE = (r"\b(it|its|that|this|these|those|they|them|their|he|him|his|she|her|hers|same|again|above|"
+                  r"earlier|previous|last one|what about|how about|the (files?|documents?|docs?|reports?|notes?|"
+                  r"pdfs?|e-?mails?|mails?|messages?|ones?))\b")
+_back_reference = re.compile(BACK_REFERENCE, re.IGNORECASE)
+
+
+def refers_back(text: str) -> bool:
+    """Whether a message only makes sense together with the turns before it."""
+    return _back_reference.search(text) is not None
+
+# Example utterances for the optional embedding classifier
+ROUTE_EXAMPLES: dict[str, list[str]] = {
+    "search_agent": [
+        "find the quarterly report",
+        "search my documents for the onboarding guide",
+        "where is the file about the marketing plan",
+        "look up notes on the product launch",
+    ],
+    "email_agent": [
+        "send an email to alice about the meeting",
+        "email bob that the invoice is paid",
+        "write a message to the team saying I am out tomorrow",
+        "reply to the latest mail from support",
+    ],
+}
+
+
+@dataclass
+class Route:
+    agent: Optional[str]  # None when the router defers to the LLM
+    confidence: float
+    method: str  # "pattern", "embedding" or "none"
+    guess: Optional[str] = None  # best candidate even when deferring, for accuracy tracking
+
+
+class IntentRouter:
+    def __init__(self, patterns: dict[str, list[tuple[str, float]]] = ROUTE_PATTERNS,
+                 min_confidence: float = ROUTER_MIN_CONFIDENCE, examples: Optional[dict[str, list[str]]] = None,
+                 embedder: Optional[Callable] = None):
+        self._groups: dict[str, tuple[str, float]] = {}
+        # One pass over the message per route, for all of that route's patterns. Routes are kept
+        # apart so a match for one route cannot swallow the words another route would match.
+        self._patterns: list[re.Pattern] = []
+        for route, route_patterns in patterns.items():
+            alternatives = []
+            for pattern, weight in route_patterns:
+                group = f"p{len(self._groups)}"
+                self._groups[group] = (route, weight)
+                alternatives.append(f"(?P<{group}>{pattern})")
+            self._patterns.append(re.compile("|".join(alternatives), re.IGNORECASE))
+        self.routes = list(patterns)
+        self.min_confidence = min_confidence
+        self.examples = examples
+        self.embedder = embedder  # factory, so the embedding store is only opened on first use
+        self._centroids: Optional[dict[str, np.ndarray]] = None
+
+    def _pattern_scores(self, text: str) -> dict[str, float]:
+        misses = {route: 1.0 for route in self.routes}
+        # Patterns are listed strongest first, so where matches overlap the strongest one is kept
+        matched_groups = {match.lastgroup for pattern in self._patterns for match in pattern.finditer(text)}
+        for group in matched_groups:
+            route, weight = self._groups[group]
+            misses[route] *= 1 - weight
+        return {route: 1 - miss for route, miss in misses.items() if miss < 1}
+
+    def _embedding_route(self, text: str) -> Optional[tuple[str, float, float]]:
+        if self.embedder is None or not self.examples:
+            return None
+        try:
+            embedder = self.embedder()
+            if self._centroids is None:
+                centroids = {}
+                for route, examples in self.examples.items():
+                    centroid = np.mean(embedder.embed(examples), axis=0)
+                    centroids[route] = centroid / np.linalg.norm(centroid)
+                self._centroids = centroids
+            vector = np.asarray(embedder.embed_one(text), dtype=np.float32)
+        except Exception:
+            # Best effort: without Ollama the pattern router still works
+            return None
+        vector /= np.linalg.norm(vector) or 1.0
+        scored = sorted(((float(centroid @ vector), route) for route, centroid in self._centroids.items()), reverse=True)
+        best, route = scored[0]
+        margin = best - scored[1][0] if len(scored) > 1 else best
+        return route, best, margin
+
+    def route(self, text: str, follow_up: bool = False) -> Route:
+        """Pick the sub-agent for `text`; `follow_up` marks a message that continues a conversation."""
+        route = self._route(text)
+        if route.agent and follow_up and refers_back(text):
+            # The sub-agent would get the message without the turns it refers to
+            return Route(None, route.confidence, route.method, route.guess)
+        return route
+
+    def _route(self, text: str) -> Route:
+        scores = self._pattern_scores(text)
+        if scores:
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+            best, confidence = ranked[0]
+            # Any second route means the request may need several agents, or a judgement call
+            if confidence >= self.min_confidence and len(ranked) == 1:
+                return Route(best, confidence, "pattern", best)
+            return Route(None, confidence, "pattern", best)
+        embedded = self._embedding_route(text)
+        if embedded:
+            route, similarity, margin = embedded
+            if similarity >= ROUTER_MIN_SIMILARITY and margin >= ROUTER_MIN_MARGIN:
+                return Route(route, similarity, "embedding", route)
+            return Route(None, similarity, "embedding", route)
+        return Route(None, 0.0, "none")
+
+
+class RouterStats:
+    """Routing decisions, shadow accuracy against the LLM's own choices, and model time saved."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.routed: dict[str, int] = {}
+        self.fallbacks = 0
+        self.compared = 0
+        self.agreed = 0
+        self.llm_turns = 0
+        self.llm_seconds = 0.0
+        self.routing_seconds = 0.0
+
+    def record_route(self, route: Route, seconds: float) -> None:
+        with self._lock:
+            self.routing_seconds += seconds
+            if route.agent:
+                key = f"{route.agent}:{route.method}"
+                self.routed[key] = self.routed.get(key, 0) + 1
+            else:
+                self.fallbacks += 1
+
+    def record_llm_choice(self, guess: Optional[str], chosen: Optional[str]) -> None:
+        """Compare the router's guess on a fallback turn with the AgentTool the model actually called.
+
+        A turn the model handled without delegating counts as a disagreement.
+        """
+        if guess is None:
+            return
+        with self._lock:
+            self.compared += 1
+            self.agreed += guess == chosen
+
+    def record_llm_turn(self, seconds: float) -> None:
+        with self._lock:
+            self.llm_turns += 1
+            self.llm_seconds += seconds
+
+    def stats(self) -> dict:
+        with self._lock:
+            routed = sum(self.routed.values())
+            decisions = routed + self.fallbacks
+            avg_llm_turn = self.llm_seconds / self.llm_turns if self.llm_turns else None
+            return {
+                "routed": dict(self.routed),
+                "fallbacks": self.fallbacks,
+                "routed_rate": routed / decisions if decisions else 0.0,
+                "shadow_accuracy": self.agreed / self.compared if self.compared else None,
+                "shadow_compared": self.compared,
+                "avg_llm_turn_s": avg_llm_turn,
+                "estimated_latency_saved_s": routed * avg_llm_turn if avg_llm_turn else None,
+                "routing_overhead_s": self.routing_seconds,
+            }
+
+
+def evaluate(router: IntentRouter, labeled: list[dict]) -> dict:
+    """Accuracy on {"text", "agent", "follow_up"?} examples; agent null means the LLM should decide."""
+    correct = routed = 0
+    started = time.perf_counter()
+    for example in labeled:
+        route = router.route(example["text"], follow_up=example.get("follow_up", False))
+        routed += route.agent is not None
+        correct += route.agent == example.get("agent")
+    elapsed = time.perf_counter() - started
+    return {
+        "examples": len(labeled),
+        "accuracy": correct / len(labeled) if labeled else None,
+        "routed": routed,
+        "avg_route_us": elapsed / len(labeled) * 1e6 if labeled else None,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Route messages, or score the router on labeled JSONL.")
+    parser.add_argument("messages", nargs="*", help="Messages to route")
+    parser.add_argument("--follow-up", action="store_true", help="Route the messages as later turns of a conversation")
+    parser.add_argument("--eval", dest="eval_path", default=None,
+                        help='JSONL of {"text": ..., "agent": ...}; agent null means "leave it to the LLM"')
+    args = parser.parse_args()
+    router = IntentRouter()
+    for message in args.messages:
+        print(json.dumps({"text": message, **router.route(message, follow_up=args.follow_up).__dict__}))
+    if args.eval_path:
+        with open(args.eval_path) as f:
+            print(json.dumps(evaluate(router, [json.loads(line) for line in f if line.strip()])))
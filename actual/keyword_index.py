@@ -0,0 +1,104 @@
+# @title Local BM25 keyword index
+#
+# Offline companion to Weaviate's server-side BM25/hybrid search. The index is
+# built by streaming the Document collection through the cursor iterator (see
+# weaviate/build_keyword_index.py), so building it never holds the whole corpus
+# in memory, and only ids, titles and short previews are kept next to the
+# postings. get_file falls back to it when Weaviate cannot be reached.
+
+import heapq
+import math
+import os
+import pickle
+import re
+from collections import Counter
+from typing import Iterable, Optional
+
+from .search_cache import CACHE_DIR
+
+KEYWORD_INDEX_FILE = os.environ.get("KEYWORD_INDEX_FILE", os.path.join(CACHE_DIR, "keyword_index.pkl"))
+
+PREVIEW_CHARS = 300
+
+_token = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list[str]:
+    return _token.findall(text.lower())
+
+
+class KeywordIndex:
+    """Inverted index with Okapi BM25 scoring."""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: dict[str, list[tuple[int, int]]] = {}
+        self.doc_lengths: list[int] = []
+        self.docs: list[dict] = []  # id, title and preview per indexed document
+        self.total_length = 0
+
+    def add(self, doc_id: str, title: str, content: str) -> None:
+        idx = len(self.docs)
+        terms = Counter(tokenize(f"{title} {content}"))
+        for term, tf in terms.items():
+            self.postings.setdefault(term, []).append((idx, tf))
+        length = sum(terms.values())
+        self.doc_lengths.append(length)
+        self.total_length += length
+        self.docs.append({"id": doc_id, "title": title, "preview": content[:PREVIEW_CHARS]})
+
+    def search(self, query: str, limit: int = 10) -> list[dict]:
+        n = len(self.docs)
+        if not n:
+            return []
+        avg_length = self.total_length / n
+        scores: dict[int, float] = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for idx, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[idx] / avg_length)
+                scores[idx] = scores.get(idx, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        best = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        return [dict(self.docs[idx], score=score) for idx, score in best]
+
+    def save(self, path: str = KEYWORD_INDEX_FILE) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def build(cls, objects: Iterable) -> "KeywordIndex":
+        """Build from Weaviate objects, e.g. `collection.iterator(return_properties=[...])`.
+
+        Chunks are indexed individually under their document id (the `source` property).
+        """
+        index = cls()
+        for obj in objects:
+            properties = obj.properties
+            index.add(properties.get("source") or str(obj.uuid), properties.get("title") or "",
+                      properties.get("content") or "")
+        return index
+
+
+_loaded: Optional[KeywordIndex] = None
+_loaded_mtime = 0.0
+
+
+def load_index(path: str = KEYWORD_INDEX_FILE) -> Optional[KeywordIndex]:
+    """Return the on-disk index (reloaded when rebuilt), or None if it was never built."""
+    global _loaded, _loaded_mtime
+    try:
+        mtime = os.stat(path).st_mtime
+    except FileNotFoundError:
+        return None
+    if _loaded is None or mtime != _loaded_mtime:
+        with open(path, "rb") as f:
+            _loaded = pickle.load(f)
+        _loaded_mtime = mtime
+    return _loaded
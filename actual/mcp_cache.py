@@ -0,0 +1,160 @@
+# @title Read-through cache and request coalescing for MCP tools
+#
+# postgres_agent and xero_agent call remote MCP tools whose reads are
+# idempotent, yet every session paid a full MCP round trip for them (and, for
+# Xero, a slice of its API rate limit). CachedMCPToolset wraps any toolset and
+# serves read tools through a TTL cache, with TTLs per server and tool declared
+# in mcp_cache.yaml. Identical calls already in flight are coalesced onto one
+# request (single flight). Tools without a configured TTL, i.e. every write,
+# pass straight through to the server, and once one succeeds the server's
+# cached reads are dropped: after create-song, list-songs must not keep
+# answering with the old list until its TTL runs out.
+#
+# mcp_stub_server.py is a local stdio MCP server for exercising this without
+# the toolbox or Xero.
+
+import asyncio
+import fnmatch
+import json
+import logging
+import os
+from typing import Any, Hashable, Optional
+
+import yaml
+from google.adk.agents.readonly_context import ReadonlyContext
+from google.adk.tools.base_tool import BaseTool
+from google.adk.tools.base_toolset import BaseToolset
+from google.adk.tools.tool_context import ToolContext
+from google.genai import types
+
+from .search_cache import ResultCache
+
+MCP_CACHE_CONFIG = os.environ.get(
+    "MCP_CACHE_CONFIG",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "mcp_cache.yaml"),
+)
+MCP_CACHE_SIZE = int(os.environ.get("MCP_CACHE_SIZE", "512"))
+
+
+def load_cache_config(path: str = MCP_CACHE_CONFIG) -> dict[str, dict[str, float]]:
+    """Return {server: {tool name or pattern: ttl seconds}} from the YAML config."""
+    try:
+        with open(path) as f:
+            config = yaml.safe_load(f) or {}
+    except FileNotFoundError:
+        logging.warning(f"[MCP cache] {path} not found; MCP tools will not be cached")
+        return {}
+    return {server: {str(name): float(ttl) for name, ttl in (tools or {}).items()}
+            for server, tools in (config.get("servers") or {}).items()}
+
+
+def ttl_for(tool_name: str, ttls: dict[str, float]) -> float:
+    """TTL for a tool: exact name first, then the first matching pattern; 0 means uncached."""
+    if tool_name in ttls:
+        return ttls[tool_name]
+    for pattern, ttl in ttls.items():
+        if fnmatch.fnmatchcase(tool_name, pattern):
+            return ttl
+    return 0.0
+
+
+def _is_error(result: Any) -> bool:
+    if isinstance(result, dict):
+        return bool(result.get("isError")) or result.get("status") == "error"
+    return bool(getattr(result, "isError", False))
+
+
+class CachedTool(BaseTool):
+    """Delegates to an MCP tool, answering repeated calls from the toolset's cache."""
+
+    def __init__(self, tool: BaseTool, ttl: float, owner: "CachedMCPToolset"):
+        super().__init__(name=tool.name, description=tool.description, is_long_running=tool.is_long_running)
+        self.tool = tool
+        self.ttl = ttl
+        self.owner = owner
+
+    def _get_declaration(self) -> Optional[types.FunctionDeclaration]:
+        return self.tool._get_declaration()
+
+    async def run_async(self, *, args: dict[str, Any], tool_context: ToolContext) -> Any:
+        key = (self.name, json.dumps(args or {}, sort_keys=True, default=str))
+        cached = self.owner.cache.get(key)
+        if cached is not None:
+            return cached
+        return await self.owner.single_flight(key, self.ttl, self.tool.run_async(args=args, tool_context=tool_context))
+
+
+class WriteThroughTool(BaseTool):
+    """Delegates to an uncached MCP tool; a successful call drops the toolset's cached reads."""
+
+    def __init__(self, tool: BaseTool, owner: "CachedMCPToolset"):
+        super().__init__(name=tool.name, description=tool.description, is_long_running=tool.is_long_running)
+        self.tool = tool
+        self.owner = owner
+
+    def _get_declaration(self) -> Optional[types.FunctionDeclaration]:
+        return self.tool._get_declaration()
+
+    async def run_async(self, *, args: dict[str, Any], tool_context: ToolContext) -> Any:
+        result = await self.tool.run_async(args=args, tool_context=tool_context)
+        if not _is_error(result):
+            self.owner.invalidate()
+        return result
+
+
+class CachedMCPToolset(BaseToolset):
+    """Wraps a toolset (usually an MCPToolset) with per-tool TTL caching and single-flight calls."""
+
+    def __init__(self, toolset: BaseToolset, server: str, ttls: Optional[dict[str, float]] = None,
+                 cache_size: int = MCP_CACHE_SIZE):
+        self.toolset = toolset
+        self.server = server
+        self.ttls = load_cache_config().get(server, {}) if ttls is None else ttls
+        # MCP results do not depend on the Weaviate collection, so entries are unversioned
+        self.cache = ResultCache(max_size=cache_size, version=None)
+        self._in_flight: dict[Hashable, asyncio.Task] = {}
+        self._generation = 0  # bumped by every write, so reads that started before it are not cached
+        self.coalesced = 0
+        self.invalidations = 0
+
+    async def get_tools(self, readonly_context: Optional[ReadonlyContext] = None) -> list[BaseTool]:
+        tools = []
+        for tool in await self.toolset.get_tools(readonly_context):
+            ttl = ttl_for(tool.name, self.ttls)
+            tools.append(CachedTool(tool, ttl, self) if ttl > 0 else WriteThroughTool(tool, self))
+        return tools
+
+    def invalidate(self) -> None:
+        """Forget every cached read of this server, e.g. after a write."""
+        self._generation += 1
+        self.invalidations += 1
+        self.cache.invalidate()
+        # Reads already in flight may predate the write; later identical calls must not join them
+        self._in_flight.clear()
+
+    async def single_flight(self, key: Hashable, ttl: float, call) -> Any:
+        """Run `call` unless an identical one is in flight, in which case share its result."""
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._call_and_cache(key, ttl, call))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._in_flight.pop(key) if self._in_flight.get(key) is done else None)
+        else:
+            call.close()  # never awaited; close it to avoid a "coroutine was never awaited" warning
+            self.coalesced += 1
+        # Shielded so one caller being cancelled does not fail the others waiting on the same call
+        return await asyncio.shield(task)
+
+    async def _call_and_cache(self, key: Hashable, ttl: float, call) -> Any:
+        generation = self._generation
+        result = await call
+        if not _is_error(result) and generation == self._generation:
+            self.cache.put(key, result, ttl=ttl)
+        return result
+
+    def stats(self) -> dict:
+        return dict(self.cache.stats(), server=self.server, coalesced=self.coalesced,
+                    invalidations=self.invalidations)
+
+    async def close(self) -> None:
+        await self.toolset.close()
@@ -0,0 +1,324 @@
+# @title Warm, shared MCP server processes
+#
+# Every MCPToolset(StdioServerParameters(...)) used to own its own stdio
+# subprocess: `node temp-xero/dist/index.js` and `agentmail-mcp` were
+# cold-started (and their tools listed) per toolset, nothing was shared across
+# runners or sessions, and nothing restarted a server that died.
+#
+# McpServerPool keeps a configurable number of warm server processes (or SSE
+# connections) per server, started lazily the first time an agent needs the
+# server's tools. MCP sessions multiplex concurrent requests by id, so all
+# callers share the pool's sessions round-robin. The list_tools schema is
+# fetched once per pool. A background task pings every server and restarts
+# the ones that crashed or stopped answering, and a call that hits a closed
+# connection restarts its server. Only reads are then retried once, i.e. the
+# tools mcp_cache.yaml gives a TTL for that server: a write (send_email,
+# create-*) may already have been applied when the connection dropped, and
+# sending it again would apply it twice. Cold starts are paid once per process
+# lifetime rather than per toolset.
+#
+# Pools are process-wide and keyed by name (`get_pool()`); PooledMCPToolset is
+# the drop-in replacement for MCPToolset that agents use.
+
+import asyncio
+import itertools
+import logging
+import os
+import sys
+import time
+from contextlib import AsyncExitStack
+from datetime import timedelta
+from typing import Any, Optional, Union
+
+import anyio
+from google.adk.agents.readonly_context import ReadonlyContext
+from google.adk.tools.base_tool import BaseTool
+from google.adk.tools.base_toolset import BaseToolset
+from google.adk.tools.mcp_tool.mcp_session_manager import SseServerParams
+from google.adk.tools.openapi_tool.openapi_spec_parser.rest_api_tool import to_gemini_schema
+from google.adk.tools.tool_context import ToolContext
+from google.genai import types
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.sse import sse_client
+from mcp.client.stdio import stdio_client
+from mcp.types import ListToolsResult
+
+from .mcp_cache import load_cache_config, ttl_for
+
+MCP_POOL_SIZE = int(os.environ.get("MCP_POOL_SIZE", "1"))
+MCP_START_TIMEOUT = float(os.environ.get("MCP_START_TIMEOUT", "60"))
+MCP_CALL_TIMEOUT = float(os.environ.get("MCP_CALL_TIMEOUT", "60"))
+MCP_HEALTH_INTERVAL = float(os.environ.get("MCP_HEALTH_INTERVAL", "30"))
+MCP_PING_TIMEOUT = float(os.environ.get("MCP_PING_TIMEOUT", "5"))
+
+# Raised by the MCP client when the server process or connection has gone away
+CONNECTION_ERRORS = (anyio.ClosedResourceError, anyio.BrokenResourceError, anyio.EndOfStream, ConnectionError)
+
+ConnectionParams = Union[StdioServerParameters, SseServerParams]
+
+
+class _Server:
+    """One server process (or SSE connection) and its MCP session.
+
+    The transport and session are entered and exited inside a single owner
+    task, as the anyio-based MCP clients require.
+    """
+
+    def __init__(self, pool: "McpServerPool", index: int):
+        self.pool = pool
+        self.index = index
+        self.session: Optional[ClientSession] = None
+        self.started_at = 0.0
+        self.generation = 0  # bumped on every (re)start
+        self._task: Optional[asyncio.Task] = None
+        self._stop: Optional[asyncio.Event] = None
+
+    @property
+    def alive(self) -> bool:
+        return self.session is not None and self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        ready = loop.create_future()
+        self._stop = asyncio.Event()
+        self._task = asyncio.create_task(self._run(ready), name=f"mcp-{self.pool.name}-{self.index}")
+        started = time.perf_counter()
+        await asyncio.wait_for(ready, MCP_START_TIMEOUT)
+        self.started_at = time.time()
+        self.generation += 1
+        logging.info(f"[MCP] {self.pool.name}#{self.index} started in {time.perf_counter() - started:.2f}s")
+
+    async def _run(self, ready: asyncio.Future) -> None:
+        try:
+            async with AsyncExitStack() as stack:
+                transports = await stack.enter_async_context(self.pool.client())
+                session = await stack.enter_async_context(ClientSession(*transports))
+                await session.initialize()
+                self.session = session
+                ready.set_result(None)
+                await self._stop.wait()
+        except Exception as e:
+            if not ready.done():
+                ready.set_exception(e)
+            else:
+                logging.warning(f"[MCP] {self.pool.name}#{self.index} exited: {e}")
+        finally:
+            self.session = None
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._stop.set()
+        try:
+            await asyncio.wait_for(self._task, 5)
+        except (asyncio.TimeoutError, Exception):
+            self._task.cancel()
+        self._task = None
+
+    async def ping(self) -> bool:
+        if not self.alive:
+            return False
+        try:
+            await asyncio.wait_for(self.session.send_ping(), MCP_PING_TIMEOUT)
+            return True
+        except Exception:
+            return False
+
+
+class McpServerPool:
+    """A fixed number of warm, shared sessions to one MCP server."""
+
+    def __init__(self, name: str, connection_params: ConnectionParams, size: int = MCP_POOL_SIZE,
+                 health_interval: float = MCP_HEALTH_INTERVAL, read_tools: Optional[dict[str, float]] = None):
+        self.name = name
+        # Idempotent tools, safe to send again after a dropped connection: the cached reads
+        self.read_tools = load_cache_config().get(name, {}) if read_tools is None else read_tools
+        self.connection_params = connection_params
+        self.size = max(1, size)
+        self.health_interval = health_interval
+        self._servers: list[_Server] = []
+        self._next = itertools.count()
+        self._tools: Optional[ListToolsResult] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._health_task: Optional[asyncio.Task] = None
+        self.starts = 0
+        self.restarts = 0
+        self.calls = 0
+        self.retries = 0
+
+    def client(self):
+        params = self.connection_params
+        if isinstance(params, StdioServerParameters):
+            return stdio_client(server=params, errlog=sys.stderr)
+        return sse_client(url=params.url, headers=params.headers, timeout=params.timeout,
+                          sse_read_timeout=params.sse_read_timeout)
+
+    async def _ensure_started(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Sessions belong to the loop that opened them; a new loop starts from scratch
+            self._loop = loop
+            self._lock = asyncio.Lock()
+            self._servers = []
+            self._health_task = None
+        if self._servers:
+            return
+        async with self._lock:
+            if self._servers:
+                return
+            servers = [_Server(self, index) for index in range(self.size)]
+            await asyncio.gather(*(server.start() for server in servers))
+            self.starts += len(servers)
+            self._servers = servers
+            if self.health_interval > 0:
+                self._health_task = asyncio.create_task(self._health_loop(), name=f"mcp-{self.name}-health")
+
+    async def _restart(self, server: _Server, generation: int) -> None:
+        async with self._lock:
+            if server.generation != generation:
+                return  # Someone else already restarted it
+            logging.warning(f"[MCP] Restarting {self.name}#{server.index}")
+            await server.stop()
+            await server.start()
+            self.restarts += 1
+
+    async def _server(self) -> _Server:
+        await self._ensure_started()
+        for _ in range(len(self._servers)):
+            server = self._servers[next(self._next) % len(self._servers)]
+            if server.alive:
+                return server
+        server = self._servers[0]
+        await self._restart(server, server.generation)
+        return server
+
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.health_interval)
+            for server in list(self._servers):
+                generation = server.generation
+                if not await server.ping():
+                    try:
+                        await self._restart(server, generation)
+                    except Exception as e:
+                        logging.error(f"[MCP] Could not restart {self.name}#{server.index}: {e}")
+
+    def _session(self, server: _Server) -> ClientSession:
+        session = server.session
+        if session is None:
+            raise ConnectionError(f"MCP server {self.name}#{server.index} is not running")
+        return session
+
+    async def list_tools(self) -> ListToolsResult:
+        """The server's tool schema, fetched once and reused across sessions and restarts."""
+        if self._tools is None:
+            server = await self._server()
+            self._tools = await self._session(server).list_tools()
+        return self._tools
+
+    async def call_tool(self, name: str, arguments: dict[str, Any]) -> Any:
+        self.calls += 1
+        server = await self._server()
+        generation = server.generation
+        try:
+            return await self._session(server).call_tool(name, arguments=arguments,
+                                                         read_timeout_seconds=timedelta(seconds=MCP_CALL_TIMEOUT))
+        except CONNECTION_ERRORS as e:
+            logging.warning(f"[MCP] {self.name}#{server.index} connection lost during {name}: {e}")
+            try:
+                await self._restart(server, generation)
+            except Exception as restart_error:
+                raise ConnectionError(f"MCP server {self.name}#{server.index} could not be restarted: "
+                                      f"{restart_error}") from e
+            if ttl_for(name, self.read_tools) <= 0:
+                raise ConnectionError(f"Connection to MCP server {self.name} lost during {name}; not retried "
+                                      "because the call may already have been applied") from e
+            self.retries += 1
+            return await self._session(server).call_tool(name, arguments=arguments,
+                                                         read_timeout_seconds=timedelta(seconds=MCP_CALL_TIMEOUT))
+
+    async def warm_up(self) -> None:
+        """Start the servers and fetch the tool schema now instead of on first use."""
+        await self.list_tools()
+
+    def stats(self) -> dict:
+        return {
+            "server": self.name,
+            "size": self.size,
+            "alive": sum(1 for server in self._servers if server.alive),
+            "starts": self.starts,
+            "restarts": self.restarts,
+            "calls": self.calls,
+            "retries": self.retries,
+        }
+
+    async def close(self) -> None:
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        for server in self._servers:
+            await server.stop()
+        self._servers = []
+
+
+_pools: dict[str, McpServerPool] = {}
+
+
+def get_pool(name: str, connection_params: ConnectionParams, size: int = MCP_POOL_SIZE) -> McpServerPool:
+    """Process-wide pool for the named server; created on first request, started on first use."""
+    pool = _pools.get(name)
+    if pool is None:
+        pool = _pools[name] = McpServerPool(name, connection_params, size=size)
+    return pool
+
+
+def pool_stats() -> list[dict]:
+    return [pool.stats() for pool in _pools.values()]
+
+
+def report_pools() -> None:
+    for stats in pool_stats():
+        print(f"--- MCP server pool stats: {stats} ---")
+
+
+async def close_pools() -> None:
+    for pool in _pools.values():
+        await pool.close()
+
+
+class PooledMCPTool(BaseTool):
+    """An MCP tool whose calls go through a shared McpServerPool."""
+
+    def __init__(self, mcp_tool, pool: McpServerPool):
+        super().__init__(name=mcp_tool.name, description=mcp_tool.description or "")
+        self.mcp_tool = mcp_tool
+        self.pool = pool
+
+    def _get_declaration(self) -> types.FunctionDeclaration:
+        return types.FunctionDeclaration(name=self.name, description=self.description,
+                                         parameters=to_gemini_schema(self.mcp_tool.inputSchema))
+
+    async def run_async(self, *, args: dict[str, Any], tool_context: ToolContext) -> Any:
+        return await self.pool.call_tool(self.name, args)
+
+
+class PooledMCPToolset(BaseToolset):
+    """Drop-in replacement for MCPToolset backed by a shared, warm server pool."""
+
+    def __init__(self, name: str, connection_params: ConnectionParams, size: int = MCP_POOL_SIZE,
+                 tool_filter: Optional[list[str]] = None):
+        self.pool = get_pool(name, connection_params, size)
+        self.tool_filter = tool_filter
+        self._tools: Optional[list[PooledMCPTool]] = None
+
+    async def get_tools(self, readonly_context: Optional[ReadonlyContext] = None) -> list[BaseTool]:
+        if self._tools is None:
+            listed = await self.pool.list_tools()
+            self._tools = [PooledMCPTool(tool, self.pool) for tool in listed.tools
+                           if self.tool_filter is None or tool.name in self.tool_filter]
+        return self._tools
+
+    async def close(self) -> None:
+        # The pool is shared with other toolsets; close_pools() shuts it down
+        pass
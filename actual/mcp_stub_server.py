@@ -0,0 +1,75 @@
+# @title Local stub MCP server
+#
+# A small stdio MCP server with the same shape as the toolbox tools (reads plus
+# one write), so MCP-side features such as CachedMCPToolset can be exercised
+# without Postgres, the toolbox or Xero:
+#
+#   MCPToolset(connection_params=StdioServerParameters(
+#       command=sys.executable, args=["mcp_stub_server.py", "--latency", "0.2"]))
+#
+# `--server agentmail` serves an email-sending tool in place of agentmail-mcp
+# instead (benchmark_agents.py uses both).
+#
+# Every tool reports how many times the server has executed a call, which makes
+# cache hits and coalesced calls visible from the client side.
+
+import argparse
+import asyncio
+import itertools
+
+from mcp.server.fastmcp import FastMCP
+
+parser = argparse.ArgumentParser(description="Stub MCP server for local testing.")
+parser.add_argument("--latency", type=float, default=0.0, help="Seconds each tool call takes.")
+parser.add_argument("--server", choices=["toolbox", "agentmail"], default="toolbox", help="Which tools to serve.")
+args = parser.parse_args()
+
+server = FastMCP("stub")
+executions = itertools.count(1)
+
+SONGS = ["Attention", "Hype Boy", "Cookie", "Ditto", "OMG", "Super Shy"]
+MEMBERS = ["Minji", "Hanni", "Danielle", "Haerin", "Hyein"]
+
+
+async def _respond(payload: dict) -> dict:
+    await asyncio.sleep(args.latency)
+    return dict(payload, executions=next(executions))
+
+
+async def list_songs() -> dict:
+    return await _respond({"songs": SONGS})
+
+
+async def find_song_by_title(title: str) -> dict:
+    return await _respond({"songs": [song for song in SONGS if title.lower() in song.lower()]})
+
+
+async def create_song(title: str) -> dict:
+    SONGS.append(title)
+    return await _respond({"created": title})
+
+
+async def list_members() -> dict:
+    return await _respond({"members": MEMBERS})
+
+
+async def find_member_by_name(name: str) -> dict:
+    return await _respond({"members": [member for member in MEMBERS if name.lower() in member.lower()]})
+
+
+async def send_email(to: str, subject: str, text: str) -> dict:
+    return await _respond({"sent": True, "to": to, "subject": subject, "chars": len(text)})
+
+
+if args.server == "agentmail":
+    server.add_tool(send_email, name="send_email", description="Send an email.")
+else:
+    server.add_tool(list_songs, name="list-songs", description="List all songs.")
+    server.add_tool(find_song_by_title, name="find-song-by-title", description="Find a song by its title.")
+    server.add_tool(create_song, name="create-song", description="Add a song.")
+    server.add_tool(list_members, name="list-members", description="List all members.")
+    server.add_tool(find_member_by_name, name="find-member-by-name", description="Find a member by name.")
+
+
+if __name__ == "__main__":
+    server.run("stdio")
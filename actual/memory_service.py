@@ -0,0 +1,355 @@
+# @title Long-term memory in Weaviate
+#
+# main() used InMemoryMemoryService, so nothing an agent heard in one session
+# could be recalled in another, or after a restart. WeaviateMemoryService
+# keeps the user's messages and the agents' replies in a multi-tenant
+# "ChatMemory" collection next to the Document collection.
+#
+# Writes: add_session_to_memory() only picks out the session's new messages
+# and puts them on a queue; it never touches the network. A background thread
+# sends them to Weaviate in batches, every MEMORY_BATCH_SIZE items or
+# MEMORY_FLUSH_SECONDS, so memory writes add no latency to a turn. If the
+# queue is full (Weaviate down or too slow), new items are dropped and
+# counted rather than blocking. Object ids are derived from the event id, so
+# re-adding a session never duplicates memories.
+#
+# Recall: every (app, user) pair is its own tenant, so a recall only searches
+# that user's shard of the vector index. Filtering by user and app is
+# structural, and recall time does not grow with the total number of stored
+# memories. Each recall runs with a MEMORY_RECALL_TIMEOUT latency budget. Past
+# it, the agent gets no memories instead of a slow turn.
+#
+# Pruning: the same thread periodically deletes memories older than
+# MEMORY_TTL_DAYS from every active tenant.
+
+import hashlib
+import logging
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from uuid import UUID
+
+import weaviate.classes.config as wvcc
+from google.adk.events import Event
+from google.adk.memory import BaseMemoryService
+from google.adk.memory.base_memory_service import SearchMemoryResponse
+from google.adk.memory.memory_entry import MemoryEntry
+from google.adk.sessions import Session
+from google.genai import types
+from weaviate.classes.query import Filter, MetadataQuery
+from weaviate.classes.tenants import TenantActivityStatus
+from weaviate.util import generate_uuid5
+
+from .embeddings import EMBEDDINGS_MODE, Embedder, EmbeddingStore
+from .index_profiles import vector_index_config
+from .offload import run_blocking
+from .weaviate_pool import CONNECTION_ERRORS, get_client, reset_client
+
+MEMORY_COLLECTION = os.environ.get("MEMORY_COLLECTION", "ChatMemory")
+MEMORY_INDEX_PROFILE = os.environ.get("MEMORY_INDEX_PROFILE", "low-latency")
+MEMORY_BATCH_SIZE = int(os.environ.get("MEMORY_BATCH_SIZE", "100"))
+MEMORY_FLUSH_SECONDS = float(os.environ.get("MEMORY_FLUSH_SECONDS", "2"))
+MEMORY_QUEUE_SIZE = int(os.environ.get("MEMORY_QUEUE_SIZE", "10000"))
+MEMORY_RECALL_LIMIT = int(os.environ.get("MEMORY_RECALL_LIMIT", "5"))
+MEMORY_RECALL_TIMEOUT = float(os.environ.get("MEMORY_RECALL_TIMEOUT", "0.5"))
+MEMORY_TTL_DAYS = float(os.environ.get("MEMORY_TTL_DAYS", "90"))
+MEMORY_PRUNE_INTERVAL = float(os.environ.get("MEMORY_PRUNE_INTERVAL", "3600"))
+
+# Memory text longer than this is cut before it is stored (and embedded)
+MEMORY_MAX_CHARS = 2000
+# Sessions whose last written event is remembered, so re-adding a session only queues what is new
+TRACKED_SESSIONS = 10000
+
+
+def tenant_name(app_name: str, user_id: str) -> str:
+    """Weaviate tenant names are limited to [A-Za-z0-9_-], 64 characters; hash to stay within that."""
+    return "m" + hashlib.sha1(f"{app_name}\0{user_id}".encode("utf-8")).hexdigest()
+
+
+def ensure_collection(client) -> None:
+    """Create the ChatMemory collection on first use."""
+    if client.collections.exists(MEMORY_COLLECTION):
+        return
+    if EMBEDDINGS_MODE == "local":
+        vectorizer = wvcc.Configure.Vectorizer.none()
+    else:
+        vectorizer = wvcc.Configure.Vectorizer.text2vec_ollama(
+            api_endpoint="http://host.docker.internal:11434",
+            model="nomic-embed-text",
+        )
+    keyword = dict(data_type=wvcc.DataType.TEXT, skip_vectorization=True, tokenization=wvcc.Tokenization.FIELD)
+    client.collections.create(
+        name=MEMORY_COLLECTION,
+        description="Messages from earlier agent sessions, one tenant per app and user",
+        vectorizer_config=vectorizer,
+        vector_index_config=vector_index_config(MEMORY_INDEX_PROFILE),
+        multi_tenancy_config=wvcc.Configure.multi_tenancy(
+            enabled=True, auto_tenant_creation=True, auto_tenant_activation=True),
+        properties=[
+            wvcc.Property(name="text", data_type=wvcc.DataType.TEXT, description="What was said"),
+            wvcc.Property(name="author", **keyword),
+            wvcc.Property(name="app_name", **keyword),
+            wvcc.Property(name="user_id", **keyword),
+            wvcc.Property(name="session_id", **keyword),
+            wvcc.Property(name="timestamp", data_type=wvcc.DataType.DATE, index_range_filters=True),
+        ],
+    )
+    logging.info(f"[Memory] Created the {MEMORY_COLLECTION} collection")
+
+
+@dataclass
+class _Memory:
+    tenant: str
+    uuid: UUID
+    properties: dict
+
+
+def _memorable_text(event: Event) -> Optional[str]:
+    """Text worth remembering: user messages and final agent replies, not tool traffic or summaries."""
+    if not event.content or not event.content.parts or event.partial:
+        return None
+    if event.get_function_calls() or event.get_function_responses():
+        return None
+    if event.custom_metadata and event.custom_metadata.get("summary"):
+        return None
+    text = "".join(part.text for part in event.content.parts if part.text).strip()
+    return text[:MEMORY_MAX_CHARS] or None
+
+
+class WeaviateMemoryService(BaseMemoryService):
+    """Memory service with background batched writes, per-user tenants and a recall latency budget."""
+
+    def __init__(self, batch_size: int = MEMORY_BATCH_SIZE, flush_seconds: float = MEMORY_FLUSH_SECONDS,
+                 queue_size: int = MEMORY_QUEUE_SIZE, recall_limit: int = MEMORY_RECALL_LIMIT,
+                 recall_timeout: float = MEMORY_RECALL_TIMEOUT, ttl_days: float = MEMORY_TTL_DAYS,
+                 prune_interval: float = MEMORY_PRUNE_INTERVAL):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.recall_limit = recall_limit
+        self.recall_timeout = recall_timeout
+        self.ttl_days = ttl_days
+        self.prune_interval = prune_interval
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._written: OrderedDict[tuple[str, str, str], float] = OrderedDict()
+        self._writer: Optional[threading.Thread] = None
+        self._writer_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._embedder: Optional[Embedder] = None
+        self._collection_ready = False
+        self._last_prune = time.monotonic()
+        self.queued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+        self.pruned = 0
+        self.recalls = 0
+        self.recall_timeouts = 0
+        self.recall_seconds = 0.0
+
+    def _embed(self, texts: list[str]) -> list[list[float]]:
+        if self._embedder is None:
+            # Opened lazily on the writer thread; other processes may append to the store too (file lock)
+            self._embedder = Embedder(EmbeddingStore("memories"))
+        return [vector.tolist() for vector in self._embedder.embed(texts)]
+
+    # Writes
+
+    async def add_session_to_memory(self, session: Session) -> None:
+        """Queue the session's new messages for the background writer; returns immediately."""
+        key = (session.app_name, session.user_id, session.id)
+        written_until = self._written.get(key, 0.0)
+        tenant = tenant_name(session.app_name, session.user_id)
+        newest = written_until
+        for event in session.events:
+            if event.timestamp <= written_until:
+                continue
+            newest = max(newest, event.timestamp)
+            text = _memorable_text(event)
+            if text is None:
+                continue
+            memory = _Memory(
+                tenant=tenant,
+                uuid=generate_uuid5(f"{session.app_name}/{session.user_id}/{session.id}/{event.id}"),
+                properties={
+                    "text": text,
+                    "author": event.author,
+                    "app_name": session.app_name,
+                    "user_id": session.user_id,
+                    "session_id": session.id,
+                    "timestamp": datetime.fromtimestamp(event.timestamp, timezone.utc),
+                },
+            )
+            try:
+                self._queue.put_nowait(memory)
+                self.queued += 1
+            except queue.Full:
+                self.dropped += 1
+        self._written[key] = newest
+        self._written.move_to_end(key)
+        while len(self._written) > TRACKED_SESSIONS:
+            self._written.popitem(last=False)
+        self._start_writer()
+
+    def _start_writer(self) -> None:
+        if self._writer is not None:
+            return
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="memory-writer", daemon=True)
+                self._writer.start()
+
+    def _take_batch(self) -> list[_Memory]:
+        try:
+            batch = [self._queue.get(timeout=self.flush_seconds)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_seconds
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_loop(self) -> None:
+        while not (self._stop.is_set() and self._queue.empty()):
+            batch = self._take_batch()
+            if batch:
+                self._write_batch(batch)
+            if self.prune_interval > 0 and time.monotonic() - self._last_prune >= self.prune_interval:
+                self._last_prune = time.monotonic()
+                try:
+                    self.prune()
+                except Exception as e:
+                    logging.warning(f"[Memory] Pruning failed: {e}")
+
+    def _send(self, batch: list[_Memory]) -> int:
+        client = get_client()
+        if not self._collection_ready:
+            ensure_collection(client)
+            self._collection_ready = True
+        vectors = self._embed([memory.properties["text"] for memory in batch]) if EMBEDDINGS_MODE == "local" else None
+        with client.batch.fixed_size(batch_size=len(batch)) as writer:
+            for index, memory in enumerate(batch):
+                writer.add_object(collection=MEMORY_COLLECTION, properties=memory.properties, uuid=memory.uuid,
+                                  vector=vectors[index] if vectors else None, tenant=memory.tenant)
+        return len(client.batch.failed_objects)
+
+    def _write_batch(self, batch: list[_Memory]) -> None:
+        try:
+            try:
+                failed = self._send(batch)
+            except CONNECTION_ERRORS as e:
+                logging.warning(f"[Memory] Connection lost ({e}), retrying with a fresh client")
+                reset_client()
+                failed = self._send(batch)
+        except Exception as e:
+            logging.warning(f"[Memory] Dropped a batch of {len(batch)} memories: {e}")
+            self.failed += len(batch)
+            return
+        self.batches += 1
+        self.written += len(batch) - failed
+        self.failed += failed
+
+    def flush(self, timeout: float = 10.0) -> None:
+        """Wait until everything queued so far has been sent (or `timeout` passes)."""
+        deadline = time.monotonic() + timeout
+        while not self._queue.empty() and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    # Recall
+
+    def _recall(self, app_name: str, user_id: str, query: str) -> list:
+        client = get_client()
+        if not client.collections.exists(MEMORY_COLLECTION):
+            return []
+        memories = client.collections.get(MEMORY_COLLECTION).with_tenant(tenant_name(app_name, user_id))
+        if EMBEDDINGS_MODE == "local":
+            from .embeddings import query_embedder
+            response = memories.query.near_vector(
+                near_vector=query_embedder().embed_one(query).tolist(),
+                limit=self.recall_limit,
+                return_metadata=MetadataQuery(distance=True),
+            )
+        else:
+            response = memories.query.near_text(
+                query=query,
+                limit=self.recall_limit,
+                return_metadata=MetadataQuery(distance=True),
+            )
+        return response.objects
+
+    async def search_memory(self, *, app_name: str, user_id: str, query: str) -> SearchMemoryResponse:
+        started = time.perf_counter()
+        self.recalls += 1
+        try:
+            objects = await run_blocking(self._recall, app_name, user_id, query, timeout=self.recall_timeout)
+        except TimeoutError:
+            self.recall_timeouts += 1
+            logging.warning(f"[Memory] Recall over its {self.recall_timeout}s budget; answering without memories")
+            return SearchMemoryResponse()
+        except Exception as e:
+            # A user with no memories yet has no tenant, which Weaviate reports as an error
+            logging.info(f"[Memory] Recall failed: {e}")
+            return SearchMemoryResponse()
+        finally:
+            self.recall_seconds += time.perf_counter() - started
+        return SearchMemoryResponse(memories=[
+            MemoryEntry(
+                content=types.Content(role="user" if obj.properties["author"] == "user" else "model",
+                                      parts=[types.Part(text=obj.properties["text"])]),
+                author=obj.properties["author"],
+                timestamp=obj.properties["timestamp"].isoformat() if obj.properties.get("timestamp") else None,
+            )
+            for obj in objects
+        ])
+
+    # Pruning
+
+    def prune(self) -> int:
+        """Delete memories older than ttl_days from every active tenant; returns how many were deleted."""
+        client = get_client()
+        if not client.collections.exists(MEMORY_COLLECTION):
+            return 0
+        collection = client.collections.get(MEMORY_COLLECTION)
+        cutoff = datetime.now(timezone.utc) - timedelta(days=self.ttl_days)
+        deleted = 0
+        for name, tenant in collection.tenants.get().items():
+            # Offloaded or inactive tenants are skipped rather than woken up just to be pruned
+            if tenant.activity_status not in (TenantActivityStatus.ACTIVE, TenantActivityStatus.HOT):
+                continue
+            result = collection.with_tenant(name).data.delete_many(
+                where=Filter.by_property("timestamp").less_than(cutoff))
+            deleted += result.successful
+        self.pruned += deleted
+        if deleted:
+            logging.info(f"[Memory] Pruned {deleted} memories older than {self.ttl_days} days")
+        return deleted
+
+    def stats(self) -> dict:
+        return {
+            "queued": self.queued,
+            "backlog": self._queue.qsize(),
+            "written": self.written,
+            "batches": self.batches,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "pruned": self.pruned,
+            "recalls": self.recalls,
+            "recall_timeouts": self.recall_timeouts,
+            "recall_avg_ms": self.recall_seconds / self.recalls * 1000 if self.recalls else None,
+        }
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Send what is still queued (up to `timeout`) and stop the writer."""
+        self._stop.set()
+        if self._writer is not None:
+            self._writer.join(timeout)
+            self._writer = None
+        print(f"--- Memory service stats: {self.stats()} ---")
@@ -0,0 +1,156 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import logging
+from typing import Optional
+
+from google.adk.agents import LlmAgent
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import LlmRequest, LlmResponse
+from google.adk.tools.base_tool import BaseTool
+from google.adk.tools.tool_context import ToolContext
+from google.genai import types
+
+from .intent_router import refers_back
+from .offload import async_tool, run_blocking, shutdown_offload
+from .registry import AGENT_MODEL, at_shutdown
+from .sql_cache import question_cache, sql_result_cache
+from .sql_pool import sql_pool
+
+# @title Define the NL2SQL Tool
+
+SCHEMA_HINT = """
+You are querying a PostgreSQL database with the following schema:
+
+Table: members
+- member_id (int): primary key
+- name (varchar): member's full name
+- birth_date (date): member's birthdate
+- position (varchar): member's role in the group
+- debut_date (date): when the member debuted
+
+Table: songs
+- song_id (int): primary key
+- title (varchar): title of the song
+- release_date (date): when the song was released
+- duration (int): duration of the song in seconds
+- genre (varchar): genre of the song
+
+This database contains information about NewJeans members and their songs.
+Always return relevant records in your answer.
+"""
+
+def query_postgres_nl2sql(query: str) -> dict:
+    cached = sql_result_cache.get(query)
+    if cached is not None:
+        return cached
+    try:
+        # Pooled, read-only connection with a statement timeout and prepared-statement reuse.
+        # Rows come back capped and already JSON-friendly, as column names plus row arrays.
+        columns, rows, truncated = sql_pool.execute(query)
+        result = {
+            "status": "success",
+            "query": query,
+            "columns": columns,
+            "rows": rows,
+            "row_count": len(rows),
+        }
+        if truncated:
+            result["truncated"] = (f"Only the first {len(rows)} rows are shown. "
+                                   "Use WHERE, aggregates or LIMIT to narrow the query if more are needed.")
+        sql_result_cache.put(query, result)
+        return result
+
+    except Exception as e:
+        return {
+            "status": "error",
+            "query": query,
+            "error_message": str(e)
+        }
+
+def search_nj_db(query: Optional[str] = None) -> dict:
+    if not query:
+        return {"status": "error", "error_message": "Query is required"}
+    return query_postgres_nl2sql(query)
+
+def _question_text(callback_context: CallbackContext) -> Optional[str]:
+    content = callback_context.user_content
+    if not content or not content.parts:
+        return None
+    text = " ".join(part.text for part in content.parts if part.text)
+    return text or None
+
+
+async def reuse_cached_sql(callback_context: CallbackContext, llm_request: LlmRequest) -> Optional[LlmResponse]:
+    """Skip the SQL generation turn for questions that were already answered with validated SQL."""
+    last = llm_request.contents[-1] if llm_request.contents else None
+    # Only the first model call of a turn generates SQL; later calls summarize tool results
+    if not last or last.role != "user" or any(part.function_response for part in last.parts or []):
+        return None
+    question = _question_text(callback_context)
+    # A question that refers back ("when was she born?") depends on the conversation,
+    # so its SQL must neither be answered from nor stored in the cache shared by all sessions
+    if not question or refers_back(question):
+        return None
+    sql = await run_blocking(question_cache.get, question)
+    if not sql:
+        return None
+    logging.info(f"[NL2SQL] Reusing cached SQL for {question!r}: {sql}")
+    return LlmResponse(content=types.Content(
+        role="model",
+        parts=[types.Part(function_call=types.FunctionCall(name="search_nj_db", args={"query": sql}))],
+    ))
+
+
+async def remember_sql(tool: BaseTool, args: dict, tool_context: ToolContext, tool_response: dict) -> Optional[dict]:
+    """Record SQL that ran successfully as the answer to the question being asked."""
+    question = _question_text(tool_context)
+    if tool.name != "search_nj_db" or not question or not isinstance(tool_response, dict):
+        return None
+    if refers_back(question):
+        return None
+    if tool_response.get("status") == "success":
+        await run_blocking(question_cache.put, question, args.get("query", ""))
+    else:
+        # Cached SQL that stopped working (e.g. after a schema change) must not be replayed
+        question_cache.discard(question)
+    return None
+
+
+nl2sql_agent = LlmAgent(
+    name="nl2sql_agent",
+    model=AGENT_MODEL,
+    description="Agent that answers questions about the NewJeans music database by converting natural language queries into SQL and returning the results. The database contains tables for members and songs.",
+    instruction=(
+        "You are an expert at translating natural language questions into SQL queries for a PostgreSQL database. "
+        "Always use the provided schema to generate your queries. "
+        "The database has two tables: 'members' (with columns member_id, name, birth_date, position, debut_date) and 'songs' (with columns song_id, title, release_date, duration, genre). "
+        "When a user asks a question, generate a SQL query that answers it, execute the query, and return the result. "
+        "Results come back as column names plus rows, capped in size; prefer aggregates and filters over selecting whole tables. "
+        "If the question is ambiguous, ask the user for clarification. "
+        "Example: For 'What is Minji's birthdate?', generate: SELECT birth_date FROM members WHERE name = 'Minji';"
+    ),
+    tools=[async_tool(search_nj_db)],
+    before_model_callback=reuse_cached_sql,
+    after_tool_callback=remember_sql,
+)
+
+def _shutdown():
+    print(f"--- NL2SQL question cache stats: {question_cache.stats()} ---")
+    print(f"--- NL2SQL result cache stats: {sql_result_cache.stats()} ---")
+    sql_pool.close()
+
+at_shutdown(shutdown_offload)
+at_shutdown(_shutdown)
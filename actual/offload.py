@@ -0,0 +1,50 @@
+# @title Run blocking tools off the event loop
+#
+# get_file, list_files and the NL2SQL tool do blocking network I/O. ADK runs
+# tools inside Runner.run_async, so a plain sync tool stalls the event loop and
+# every other session sharing it. async_tool() wraps such a function as a
+# coroutine tool (same name, signature and docstring, so the model sees the
+# same declaration) that runs the call on a bounded thread pool with a timeout.
+#
+# On timeout or cancellation the awaiting session moves on immediately; the
+# worker thread finishes its call in the background (the Weaviate and Postgres
+# clients enforce their own request/statement timeouts), and the pool size
+# bounds how many such calls can pile up.
+
+import asyncio
+import functools
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+TOOL_THREADS = int(os.environ.get("TOOL_THREADS", "16"))
+TOOL_TIMEOUT = float(os.environ.get("TOOL_TIMEOUT", "30"))
+
+_executor = ThreadPoolExecutor(max_workers=TOOL_THREADS, thread_name_prefix="tool-io")
+
+
+async def run_blocking(func: Callable, *args, timeout: Optional[float] = TOOL_TIMEOUT, **kwargs):
+    """Await `func(*args, **kwargs)` on the tool thread pool, raising TimeoutError after `timeout`."""
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+    return await asyncio.wait_for(future, timeout)
+
+
+def async_tool(func: Callable, timeout: Optional[float] = TOOL_TIMEOUT) -> Callable:
+    """Wrap a blocking tool function as an awaitable ADK tool."""
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        try:
+            return await run_blocking(func, *args, timeout=timeout, **kwargs)
+        except asyncio.TimeoutError:
+            logging.warning(f"[Tool] {func.__name__} timed out after {timeout}s")
+            return {"status": "error", "error_message": f"{func.__name__} timed out after {timeout} seconds."}
+
+    return wrapper
+
+
+def shutdown_offload() -> None:
+    """Stop accepting work; running calls are left to finish on their own."""
+    _executor.shutdown(wait=False, cancel_futures=True)
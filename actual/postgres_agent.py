@@ -0,0 +1,52 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from google.adk.agents import LlmAgent
+from google.adk.tools.mcp_tool.mcp_toolset import SseServerParams
+
+from .mcp_cache import CachedMCPToolset
+from .mcp_pool import PooledMCPToolset, close_pools, report_pools
+from .registry import AGENT_MODEL, at_shutdown
+
+# @title Define postgres agent
+postgres_agent = LlmAgent(
+    name="postgres_agent",
+    model=AGENT_MODEL, # Can be a string for Gemini or a LiteLlm object
+    description="Postgres agent that interacts with a PostgreSQL database.",
+    instruction="You are a data assistant for a PostgreSQL database about the K-pop group NewJeans."
+                "You must use the tools available to answer all user questions."
+                "You are not allowed to answer questions from your own knowledge or assumptions. "
+                "Use tools like 'list-members' or 'find-member-by-name' when a user mentions a member's name.",
+    tools=[
+        CachedMCPToolset(
+            PooledMCPToolset(
+                "postgres-toolbox",
+                connection_params=SseServerParams(
+                    url="http://127.0.0.1:5000/mcp/sse"
+                )
+            ),
+            server="postgres-toolbox",
+        )
+    ],
+)
+
+def _report_cache():
+    for toolset in postgres_agent.tools:
+        if isinstance(toolset, CachedMCPToolset):
+            print(f"--- MCP cache stats: {toolset.stats()} ---")
+
+at_shutdown(close_pools)
+at_shutdown(report_pools)
+at_shutdown(_report_cache)
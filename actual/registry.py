@@ -0,0 +1,77 @@
+# @title Lazy agent registry
+#
+# Importing agent.py used to construct every agent, and with them every heavy
+# dependency (weaviate, psycopg2, MCP toolsets, the OpenTelemetry exporter),
+# even though a run only talks to one of them, and it failed outright when an
+# unrelated agent's env vars were missing. Agents are now declared here by
+# module name only; an agent's module (and everything it imports) is loaded the
+# first time that agent is requested, e.g. `python -m actual.agent --agent
+# search_agent`. This module itself must stay cheap to import: no ADK, no
+# clients. benchmark_startup.py enforces that with a time budget.
+
+import importlib
+import inspect
+import logging
+from typing import Any, Callable
+
+from dotenv import load_dotenv
+
+# Use one of the model constants defined earlier
+MODEL_GEMINI_2_0_FLASH = "gemini-2.0-flash"
+AGENT_MODEL = MODEL_GEMINI_2_0_FLASH # Starting with Gemini
+
+load_dotenv()
+
+# Agent name -> (module defining it, short description). Each module defines
+# a module-level attribute with the agent's name.
+AGENTS: dict[str, tuple[str, str]] = {
+    "root_agent": ("root_agent", "Main agent that delegates to search_agent and email_agent"),
+    "xero_agent": ("xero_agent", "Xero accounting tools over MCP"),
+    "search_agent": ("search_agent", "Weaviate document search"),
+    "email_agent": ("email_agent", "Sends emails through AgentMail over MCP"),
+    "postgres_agent": ("postgres_agent", "NewJeans database through the MCP toolbox"),
+    "nl2sql_agent": ("nl2sql_agent", "NewJeans database through generated SQL"),
+}
+
+DEFAULT_AGENT = "xero_agent"
+
+_loaded: dict[str, Any] = {}
+_shutdown_hooks: list[Callable] = []
+
+
+def agent_names() -> list[str]:
+    return list(AGENTS)
+
+
+def get_agent(name: str):
+    """Import the agent's module on first use and return the agent."""
+    agent = _loaded.get(name)
+    if agent is None:
+        if name not in AGENTS:
+            raise KeyError(f"Unknown agent {name!r}; choose one of {', '.join(AGENTS)}")
+        from . import tracing
+        tracing.setup_tracing()
+        from . import instrumentation
+        instrumentation.setup_logging()
+        module_name, _ = AGENTS[name]
+        agent = _loaded[name] = getattr(importlib.import_module(f".{module_name}", __package__), name)
+        instrumentation.instrument(agent)
+    return agent
+
+
+def at_shutdown(hook: Callable) -> None:
+    """Register a cleanup (sync or async) to run when the program exits; agent modules call this on import."""
+    if hook not in _shutdown_hooks:
+        _shutdown_hooks.append(hook)
+
+
+async def shutdown() -> None:
+    """Run shutdown hooks, most recently registered first, for the agents that were actually loaded."""
+    for hook in reversed(_shutdown_hooks):
+        try:
+            result = hook()
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            logging.warning(f"[Shutdown] {getattr(hook, '__name__', hook)} failed: {e}")
+    _shutdown_hooks.clear()
@@ -0,0 +1,190 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import logging
+import time
+from typing import Optional
+
+from google.adk.agents import Agent
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import LlmRequest, LlmResponse
+from google.adk.tools import load_memory
+from google.adk.tools.agent_tool import AgentTool
+from google.genai import types
+
+from .email_agent import email_agent
+from .embeddings import EMBEDDINGS_MODE, query_embedder
+from .fanout import ParallelFanOut
+from .instrumentation import Truncated
+from .intent_router import ROUTE_EXAMPLES, ROUTER_ENABLED, IntentRouter, RouterStats
+from .offload import run_blocking
+from .registry import AGENT_MODEL, at_shutdown
+from .search_agent import search_agent
+
+# @title Define the Main Agent
+
+def reason(user_input: str) -> dict:
+    """Reason about the user's input before taking any action."""
+    logging.debug("[Root] reason called with user_input=%s", Truncated(user_input))
+    
+    # Simulate reasoning by inspecting the input
+    reasoning = ""
+    if any(word in user_input.lower() for word in ["find", "search", "file", "document", "report"]):
+        reasoning = "It seems like the user wants to find a file. I should probably delegate this to the search agent."
+    elif any(word in user_input.lower() for word in ["email", "send", "mail", "message"]):
+        reasoning = "It seems the user wants to send an email. I should probably delegate this to the email agent."
+    else:
+        reasoning = "I'm not sure what the user wants. I should ask them to clarify their request."
+
+    result = {
+        "status": "success",
+        "reasoning": reasoning
+    }
+    logging.debug("[Root] Reasoning complete: %s", Truncated(result))
+    return result
+
+
+# @title Fast-path routing
+
+router = IntentRouter(examples=ROUTE_EXAMPLES, embedder=query_embedder if EMBEDDINGS_MODE == "local" else None)
+router_stats = RouterStats()
+
+# Per-invocation routing state: the sub-agent a turn was routed to, or, for
+# turns left to the model, the router's guess and the model time spent so far
+_routed: dict[str, str] = {}
+_fallbacks: dict[str, dict] = {}
+_model_started: dict[str, float] = {}
+
+
+def _has_earlier_turns(callback_context: CallbackContext) -> bool:
+    invocation_id = callback_context.invocation_id
+    return any(event.invocation_id != invocation_id for event in callback_context._invocation_context.session.events)
+
+
+def _turn_text(llm_request: LlmRequest) -> Optional[str]:
+    """The user's message if this is the first model call of the turn, else None."""
+    last = llm_request.contents[-1] if llm_request.contents else None
+    if not last or last.role != "user" or any(part.function_response for part in last.parts or []):
+        return None
+    return " ".join(part.text for part in last.parts or [] if part.text) or None
+
+
+async def route_before_llm(callback_context: CallbackContext, llm_request: LlmRequest) -> Optional[LlmResponse]:
+    """Answer confident delegations without the model: call the sub-agent, then relay its reply."""
+    invocation_id = callback_context.invocation_id
+    if invocation_id in _routed:
+        # Second model call of a routed turn: the sub-agent has answered, pass its reply through
+        agent_name = _routed.pop(invocation_id)
+        for part in llm_request.contents[-1].parts or []:
+            if part.function_response and part.function_response.name == agent_name:
+                reply = (part.function_response.response or {}).get("result")
+                return LlmResponse(content=types.Content(role="model", parts=[types.Part(text=str(reply))]))
+        return None
+
+    text = _turn_text(llm_request)
+    if text and ROUTER_ENABLED and invocation_id not in _fallbacks:
+        started = time.perf_counter()
+        # The embedding classifier may call Ollama; keep that off the event loop
+        follow_up = _has_earlier_turns(callback_context)
+        route = await run_blocking(router.route, text, follow_up) if router.embedder else router.route(text, follow_up)
+        router_stats.record_route(route, time.perf_counter() - started)
+        if route.agent and route.agent in llm_request.tools_dict:
+            logging.info(f"[Router] {route.agent} ({route.method}, {route.confidence:.2f}): {text!r}")
+            _routed[invocation_id] = route.agent
+            return LlmResponse(content=types.Content(role="model", parts=[
+                types.Part(function_call=types.FunctionCall(name=route.agent, args={"request": text}))
+            ]))
+        _fallbacks[invocation_id] = {"guess": route.guess, "chosen": None, "model_seconds": 0.0}
+
+    _model_started[invocation_id] = time.perf_counter()
+    return None
+
+
+def observe_llm_choice(callback_context: CallbackContext, llm_response: LlmResponse) -> Optional[LlmResponse]:
+    """On turns left to the model, time the model and note which sub-agent it delegated to."""
+    if llm_response.partial:
+        return None  # Streamed chunk; the complete response follows
+    invocation_id = callback_context.invocation_id
+    started = _model_started.pop(invocation_id, None)
+    fallback = _fallbacks.get(invocation_id)
+    if fallback is None:
+        return None
+    if started is not None:
+        fallback["model_seconds"] += time.perf_counter() - started
+    if fallback["chosen"] is None and llm_response.content:
+        for part in llm_response.content.parts or []:
+            if part.function_call and part.function_call.name in (search_agent.name, email_agent.name):
+                fallback["chosen"] = part.function_call.name
+    return None
+
+
+def finish_turn(callback_context: CallbackContext) -> None:
+    invocation_id = callback_context.invocation_id
+    _routed.pop(invocation_id, None)
+    _model_started.pop(invocation_id, None)
+    fallback = _fallbacks.pop(invocation_id, None)
+    if fallback is not None:
+        router_stats.record_llm_choice(fallback["guess"], fallback["chosen"])
+        router_stats.record_llm_turn(fallback["model_seconds"])
+    return None
+
+
+def _report_router():
+    print(f"--- Intent router stats: {router_stats.stats()} ---")
+
+at_shutdown(_report_router)
+
+# @title Parallel delegation
+
+delegates = [
+    AgentTool(search_agent), # Wrap search_agent as a tool
+    AgentTool(email_agent),  # Wrap email_agent as a tool
+]
+# Several sub-agent calls in one model response run concurrently instead of one after another
+fanout = ParallelFanOut(delegates)
+
+
+def _report_fanout():
+    print(f"--- Parallel delegation stats: {fanout.stats()} ---")
+
+at_shutdown(_report_fanout)
+
+
+root_agent = Agent(
+    name="main_agent",
+    model=AGENT_MODEL, # Can be a string for Gemini or a LiteLlm object
+    description="Main agent that is the first point of contact for users which can delegate tasks to other agents and handle basic conversations.",
+    instruction="You are a helpful assistant that engages in friendly conversations. "
+                "You follow the reAct framework where you should always reason before you act."
+                "You have access to a reasoning tool that helps you to reason about the user's input. "
+                "You can use the reasoning from the reasoning tool in additional to your own reasoning to decide what to do next. "
+                "You are aware of all other agents in your team and can delegate tasks to them if the user wants to do something that the agents in your team can do. "
+                "The agents in your team are passed in as tools. "
+                "This is to ensure that the user can only interact with you and not with the other agents directly. "
+                "You can transfer to another agent as you wish when you see that there is an agent who can handle the task better than you, you don't have to seek explicit confirmation from the user. "
+                "If the user requests for something that none of the agents in your team can do, just inform them that you can't do it. "
+                "When a request needs several agents for parts that do not depend on each other, call all of them in the same turn; they run in parallel. "
+                "If the user refers to something from an earlier conversation, use load_memory to recall it. ",
+    tools=[
+        reason, # Reasoning tool
+        load_memory, # Recall from earlier sessions (memory_service.py)
+        *delegates,
+    ], # List of tools that this agent can use
+    # Obvious delegations skip the reason / pick-an-agent / summarize model turns
+    before_model_callback=route_before_llm,
+    after_model_callback=[observe_llm_choice, fanout.after_model],
+    before_tool_callback=fanout.before_tool,
+    after_agent_callback=[finish_turn, fanout.finish],
+)
@@ -0,0 +1,377 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from google.adk.agents import Agent
+from weaviate.classes.query import Filter, MetadataQuery, Sort
+
+from .embeddings import query_embedder, EMBEDDINGS_MODE
+from .instrumentation import Truncated
+from .keyword_index import load_index
+from .offload import async_tool, shutdown_offload
+from .registry import AGENT_MODEL, at_shutdown
+from .search_cache import search_cache, normalize_query
+from .snippets import extract_snippet, estimate_tokens, fit_to_budget, SEARCH_TOKEN_BUDGET
+from .weaviate_pool import with_collection, close_client, CONNECTION_ERRORS
+
+# @title Define the Search Agent
+
+# "vector" runs near_text with a BM25 fallback; "hybrid" fuses both server-side
+SEARCH_MODE = os.environ.get("SEARCH_MODE", "vector")
+SEARCH_HYBRID_ALPHA = float(os.environ.get("SEARCH_HYBRID_ALPHA", "0.5"))
+
+# Hits per search, and properties fetched for them (never the vectors)
+SEARCH_LIMIT = 10
+SEARCH_PROPERTIES = ["title", "content", "source", "chunk_index"]
+
+# search_files: queries per call, concurrent searches, and the reciprocal rank fusion constant
+SEARCH_BATCH_MAX_QUERIES = 10
+SEARCH_BATCH_CONCURRENCY = 8
+RRF_K = 60
+
+# get_document reads at most this many chunks per call
+DOCUMENT_CHUNKS_PER_CALL = 20
+
+# list_files page sizes and snippet length, kept small so pages fit in the model context
+LIST_PAGE_SIZE = 10
+LIST_MAX_PAGE_SIZE = 100
+LIST_SNIPPET_CHARS = 200
+
+def list_files(limit: Optional[int] = 10, cursor: Optional[str] = None, include_snippet: bool = False) -> dict:
+    """List documents in the Weaviate collection one page at a time.
+
+    Each entry carries the document id (usable with get_document), title and
+    content size, plus a short snippet when include_snippet is true. Pass the
+    returned next_cursor back as cursor to fetch the following page;
+    next_cursor is null on the last page.
+    """
+    logging.debug("[Search] list_files called with limit=%s cursor=%s", limit, cursor)
+    limit = max(1, min(limit or LIST_PAGE_SIZE, LIST_MAX_PAGE_SIZE))
+    cache_key = ("list_files", limit, cursor, include_snippet)
+    cached = search_cache.get(cache_key)
+    if cached is not None:
+        logging.debug("[Search] list_files served from cache")
+        return cached
+    try:
+        # Weaviate's cursor API pages by object id, so deep pages cost the same as the first
+        response = with_collection(lambda documents: documents.query.fetch_objects(
+            limit=limit,
+            after=cursor,
+            return_properties=["title", "content", "source", "chunk_index", "doc_size"]
+        ))
+        found_docs = []
+        for obj in response.objects:
+            properties = obj.properties
+            # Long documents are stored as several chunks; list each document once
+            if properties.get("chunk_index"):
+                continue
+            content = properties.get("content") or ""
+            entry = {
+                "id": properties.get("source") or str(obj.uuid),
+                "title": properties.get("title") or "Untitled Document",
+                "size": properties.get("doc_size") or len(content),
+            }
+            if include_snippet:
+                entry["snippet"] = content[:LIST_SNIPPET_CHARS]
+            found_docs.append(entry)
+        if response.objects:
+            # The cursor is the last object id of the raw page, which may have been a skipped chunk
+            next_cursor = str(response.objects[-1].uuid) if len(response.objects) == limit else None
+            result = {"status": "success", "documents": found_docs, "next_cursor": next_cursor}
+            logging.debug("[Search] Listed %d documents, next_cursor=%s", len(found_docs), next_cursor)
+        else:
+            logging.info("[Search] No documents found in Weaviate")
+            result = {"status": "error", "error_message": "No documents found."}
+        search_cache.put(cache_key, result)
+        return result
+    except Exception as e:
+        logging.warning(f"[Search] Tool failed: {e}")
+        return {"status": "error", "error_message": f"An error occurred while listing documents: {str(e)}"}
+
+def _chunk_hit(obj, query: str) -> dict:
+    """Compact view of one matching chunk: ids, score and a highlighted snippet."""
+    properties = obj.properties
+    hit = {
+        "id": str(obj.uuid),
+        "doc_id": properties.get("source") or str(obj.uuid),
+        "title": properties.get("title") or "Untitled Document",
+        "chunk_index": properties.get("chunk_index") or 0,
+        "snippet": extract_snippet(properties.get("content") or "", query),
+    }
+    if obj.metadata.distance is not None:
+        hit["distance"] = round(obj.metadata.distance, 4)
+    if obj.metadata.score is not None:
+        hit["score"] = round(obj.metadata.score, 4)
+    return hit
+
+def _search_params(limit: Optional[int], alpha: Optional[float]) -> tuple[int, Optional[float]]:
+    """Effective (limit, alpha) of a search, so equivalent calls share one cache entry."""
+    if alpha is None and SEARCH_MODE == "hybrid":
+        alpha = SEARCH_HYBRID_ALPHA
+    if alpha is not None:
+        alpha = round(min(max(float(alpha), 0.0), 1.0), 3)
+    return int(limit or SEARCH_LIMIT), alpha
+
+def search_chunks(query: str, limit: Optional[int] = None, alpha: Optional[float] = None) -> tuple[list[dict], Optional[str]]:
+    """Run one search against the Document collection. Returns (chunk hits, note)."""
+    limit = limit or SEARCH_LIMIT
+    # In local embedding mode the query vector comes from the persistent cache, not the vectorizer
+    query_vector = query_embedder().embed_one(query).tolist() if EMBEDDINGS_MODE == "local" else None
+    if alpha is None and query_vector is not None:
+        response = with_collection(lambda documents: documents.query.near_vector(
+            near_vector=query_vector,
+            limit=limit,
+            return_properties=SEARCH_PROPERTIES,
+            return_metadata=MetadataQuery(distance=True)
+        ))
+    elif alpha is None:
+        # Perform semantic search on the shared client
+        response = with_collection(lambda documents: documents.query.near_text(
+            query=query,
+            limit=limit,
+            return_properties=SEARCH_PROPERTIES,
+            return_metadata=MetadataQuery(distance=True)
+        ))
+    else:
+        # Server-side fusion of BM25 and vector scores
+        response = with_collection(lambda documents: documents.query.hybrid(
+            query=query,
+            alpha=alpha,
+            vector=query_vector,
+            limit=limit,
+            return_properties=SEARCH_PROPERTIES,
+            return_metadata=MetadataQuery(score=True)
+        ))
+    hits = [_chunk_hit(obj, query) for obj in response.objects]
+    if hits:
+        return hits, None
+
+    # Fallback: server-side BM25 keyword search over the whole collection
+    logging.debug("[Search] No semantic matches, trying keyword fallback")
+    response = with_collection(lambda documents: documents.query.bm25(
+        query=query,
+        limit=limit,
+        return_properties=SEARCH_PROPERTIES,
+        return_metadata=MetadataQuery(score=True)
+    ))
+    return [_chunk_hit(obj, query) for obj in response.objects], "Matched by keyword fallback."
+
+def get_file(query: Optional[str] = None, limit: Optional[int] = None, alpha: Optional[float] = None) -> dict:
+    """Search for documents in Weaviate.
+
+    Returns the best matching chunks with highlighted snippets, their document
+    ids and distances/scores, trimmed to a token budget. Use get_document with a
+    doc_id to read a full document. By default this is a semantic near_text
+    search. Pass alpha (0.0 = pure BM25 keyword scoring, 1.0 = pure vector
+    scoring) to run a hybrid search instead.
+    """
+    logging.debug("[Search] get_file called with query=%r alpha=%s", query, alpha)
+
+    if not query:
+        return {"status": "error", "error_message": "Please provide a search query."}
+
+    limit, alpha = _search_params(limit, alpha)
+    # Repeated searches skip both the query embedding and the vector search
+    cache_key = ("get_file", normalize_query(query), limit, alpha)
+    cached = search_cache.get(cache_key)
+    if cached is not None:
+        logging.debug("[Search] get_file served from cache")
+        return cached
+
+    try:
+        hits, note = search_chunks(query, limit, alpha)
+        if hits:
+            kept, truncated = fit_to_budget(hits)
+            result = {"status": "success", "results": kept}
+            if note:
+                result["note"] = note
+            if truncated:
+                result["truncated"] = f"{len(hits) - len(kept)} lower-ranked results omitted to stay within the token budget."
+            logging.debug("[Search] Found matching documents: %s", Truncated(result))
+        else:
+            logging.debug("[Search] No matching documents found in Weaviate")
+            result = {"status": "error", "error_message": "Sorry, no documents matched your query."}
+        search_cache.put(cache_key, result)
+        return result
+
+    except CONNECTION_ERRORS as e:
+        # Weaviate is unreachable: answer from the local keyword index if one was built
+        index = load_index()
+        if index is None:
+            logging.warning(f"[Search] Tool failed: {e}")
+            return {"status": "error", "error_message": f"An error occurred while searching: {str(e)}"}
+        hits = [
+            {"doc_id": hit["id"], "title": hit["title"], "snippet": extract_snippet(hit["preview"], query), "score": round(hit["score"], 4)}
+            for hit in index.search(query, limit=limit)
+        ]
+        if not hits:
+            return {"status": "error", "error_message": "Sorry, no documents matched your query."}
+        kept, _ = fit_to_budget(hits)
+        result = {"status": "success", "results": kept, "note": "Weaviate unavailable, matched by the local keyword index (previews only)."}
+        logging.debug("[Search] Found offline keyword matches: %s", Truncated(result))
+        return result
+
+    except Exception as e:
+        logging.warning(f"[Search] Tool failed: {e}")
+        return {"status": "error", "error_message": f"An error occurred while searching: {str(e)}"}
+
+def search_files(queries: list[str], limit: Optional[int] = None, alpha: Optional[float] = None) -> dict:
+    """Run several searches at once, e.g. different phrasings of the same need.
+
+    The queries run concurrently. Hits are de-duplicated by object id and fused
+    into one ranking with reciprocal rank fusion (fused), and each query's own
+    ranking is returned as a list of ids (per_query). Prefer this over calling
+    get_file several times in a row.
+    """
+    logging.debug("[Search] search_files called with %d queries", len(queries or []))
+    queries = [query for query in (queries or []) if query and query.strip()][:SEARCH_BATCH_MAX_QUERIES]
+    if not queries:
+        return {"status": "error", "error_message": "Please provide at least one search query."}
+    limit, alpha = _search_params(limit, alpha)
+
+    def run(query: str) -> list[dict]:
+        cache_key = ("search_chunks", normalize_query(query), limit, alpha)
+        hits = search_cache.get(cache_key)
+        if hits is None:
+            hits, _ = search_chunks(query, limit, alpha)
+            search_cache.put(cache_key, hits)
+        return hits
+
+    per_query = {}
+    fused: dict[str, dict] = {}
+    with ThreadPoolExecutor(max_workers=min(len(queries), SEARCH_BATCH_CONCURRENCY)) as pool:
+        futures = [pool.submit(run, query) for query in queries]
+        # Collect in submission order so the output is deterministic
+        for query, future in zip(queries, futures):
+            try:
+                hits = future.result()
+            except Exception as e:
+                per_query[query] = {"error": str(e)}
+                continue
+            per_query[query] = [hit["id"] for hit in hits]
+            for rank, hit in enumerate(hits, start=1):
+                entry = fused.setdefault(hit["id"], dict(hit, rrf_score=0.0, matched_queries=[]))
+                entry["rrf_score"] += 1.0 / (RRF_K + rank)
+                entry["matched_queries"].append(query)
+
+    if not fused:
+        errors = [value["error"] for value in per_query.values() if isinstance(value, dict)]
+        if errors:
+            return {"status": "error", "error_message": f"An error occurred while searching: {errors[0]}", "per_query": per_query}
+        return {"status": "error", "error_message": "Sorry, no documents matched your queries.", "per_query": per_query}
+
+    ranking = sorted(fused.values(), key=lambda entry: entry["rrf_score"], reverse=True)
+    for entry in ranking:
+        entry["rrf_score"] = round(entry["rrf_score"], 5)
+    kept, truncated = fit_to_budget(ranking)
+    result = {"status": "success", "fused": kept, "per_query": per_query}
+    if truncated:
+        result["truncated"] = f"{len(ranking) - len(kept)} lower-ranked results omitted to stay within the token budget."
+    logging.debug("[Search] search_files fused %d unique hits from %d queries", len(ranking), len(queries))
+    return result
+
+def _merge_chunks(chunks: list[str]) -> str:
+    """Join consecutive chunks, dropping the text each one repeats from the previous (ingest overlap)."""
+    merged = chunks[0] if chunks else ""
+    for chunk in chunks[1:]:
+        overlap = 0
+        for size in range(min(len(merged), len(chunk), 1000), 8, -1):
+            if merged.endswith(chunk[:size]):
+                overlap = size
+                break
+        merged += chunk[overlap:] if overlap else "\n" + chunk
+    return merged
+
+def get_document(doc_id: str, start_chunk: int = 0) -> dict:
+    """Fetch the full text of one document (by the doc_id returned from get_file).
+
+    Long documents are returned in parts that fit the token budget; pass the
+    returned next_chunk as start_chunk to continue reading.
+    """
+    logging.debug("[Search] get_document called with doc_id=%r start_chunk=%s", doc_id, start_chunk)
+    cache_key = ("get_document", doc_id, start_chunk)
+    cached = search_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    try:
+        response = with_collection(lambda documents: documents.query.fetch_objects(
+            filters=Filter.by_property("source").equal(doc_id) & Filter.by_property("chunk_index").greater_or_equal(start_chunk),
+            sort=Sort.by_property("chunk_index"),
+            limit=DOCUMENT_CHUNKS_PER_CALL,
+            return_properties=SEARCH_PROPERTIES
+        ))
+        objects = response.objects
+        if not objects and start_chunk == 0:
+            # Objects loaded before chunking have no source; their doc_id is the object id
+            obj = with_collection(lambda documents: documents.query.fetch_object_by_id(doc_id))
+            objects = [obj] if obj is not None else []
+        if not objects:
+            return {"status": "error", "error_message": f"No document found with doc_id '{doc_id}'."}
+
+        chunks = []
+        used = 0
+        next_chunk = None
+        for obj in objects:
+            content = obj.properties.get("content") or ""
+            if chunks and used + estimate_tokens(content) > SEARCH_TOKEN_BUDGET * 2:
+                next_chunk = obj.properties.get("chunk_index")
+                break
+            chunks.append(content)
+            used += estimate_tokens(content)
+        if next_chunk is None and len(objects) == DOCUMENT_CHUNKS_PER_CALL:
+            next_chunk = (objects[-1].properties.get("chunk_index") or 0) + 1
+
+        result = {
+            "status": "success",
+            "doc_id": doc_id,
+            "title": objects[0].properties.get("title") or "Untitled Document",
+            "content": _merge_chunks(chunks),
+            "next_chunk": next_chunk,
+        }
+        logging.debug("[Search] Fetched %d chunks of %r, next_chunk=%s", len(chunks), doc_id, next_chunk)
+        search_cache.put(cache_key, result)
+        return result
+    except Exception as e:
+        logging.warning(f"[Search] Tool failed: {e}")
+        return {"status": "error", "error_message": f"An error occurred while fetching the document: {str(e)}"}
+
+search_agent = Agent(
+    name="search_agent",
+    model=AGENT_MODEL, # Can be a string for Gemini or a LiteLlm object
+    description="Search agent that searches for specific files based on user's requirements or simply list out all files.",
+    instruction="You are a helpful assistant that helps to search for files. "
+                "The files are being stored in weaviate database and you can do semantic search on them based on the vector embeddings. "
+                "For exact names, codes or keywords, call get_file with a lower alpha (e.g. 0.2) to weight keyword matching higher. "
+                "When several phrasings or related searches are needed, call search_files once with all of them instead of calling get_file repeatedly. "
+                "get_file returns snippets of the best matching passages; call get_document with a doc_id only when the user needs the full text. "
+                "If there are no files that match the user's requirements, inform them that you can't find any files. "
+                "If there are multiple files that matches the user's requirement return all files found. "
+                "You can also list all files available in the weaviate database. "
+                "list_files returns one page at a time; pass its next_cursor back as cursor to see more. ",
+    # Blocking Weaviate calls run on the tool thread pool so they never stall the event loop
+    tools=[async_tool(get_file), async_tool(search_files), async_tool(get_document), async_tool(list_files)], # List of tools that this agent can use
+)
+
+def _shutdown():
+    logging.info("[Search] Cache stats: %s", search_cache.stats())
+    # Release the shared Weaviate connection used by the search tools
+    close_client()
+
+at_shutdown(shutdown_offload)
+at_shutdown(_shutdown)
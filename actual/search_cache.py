@@ -0,0 +1,108 @@
+# @title Result cache for the search tools
+#
+# Repeated natural-language searches used to re-embed the query through Ollama
+# and re-run the vector search every time. ResultCache keeps recent tool results
+# in memory with LRU + TTL eviction. Every entry is tagged with the collection
+# version recorded in a marker file; the ingestion scripts bump that marker
+# (`bump_collection_version()`), so anything cached before a re-index is dropped
+# on the next lookup, even across processes.
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+CACHE_DIR = os.environ.get(
+    "AGENT_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache"),
+)
+COLLECTION_VERSION_FILE = os.path.join(CACHE_DIR, "document_collection.version")
+
+SEARCH_CACHE_SIZE = int(os.environ.get("SEARCH_CACHE_SIZE", "1024"))
+SEARCH_CACHE_TTL = float(os.environ.get("SEARCH_CACHE_TTL", "600"))
+
+_whitespace = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """Lower-case and collapse whitespace so trivially different phrasings share an entry."""
+    return _whitespace.sub(" ", query).strip().lower()
+
+
+def collection_version() -> int:
+    """Return the current collection version (the marker file's mtime, 0 if never bumped)."""
+    try:
+        return os.stat(COLLECTION_VERSION_FILE).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+
+def bump_collection_version() -> None:
+    """Mark the Document collection as changed; called after (re)creating or loading it."""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(COLLECTION_VERSION_FILE, "w") as f:
+        f.write(f"{time.time_ns()}\n")
+
+
+class ResultCache:
+    """Bounded LRU cache with a TTL, hit/miss counters and collection-version invalidation.
+
+    `version` defaults to the Document collection version; pass `version=None`
+    for results that do not depend on the collection.
+    """
+
+    def __init__(self, max_size: int = SEARCH_CACHE_SIZE, ttl: float = SEARCH_CACHE_TTL,
+                 version: Optional[Callable[[], Hashable]] = collection_version):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.version = version
+        self._entries: "OrderedDict[Hashable, tuple[float, int, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        version = self.version() if self.version else None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, entry_version, value = entry
+                if expires_at > now and entry_version == version:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        version = self.version() if self.version else None
+        with self._lock:
+            self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+# Shared by get_file and list_files
+search_cache = ResultCache()
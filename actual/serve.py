@@ -0,0 +1,438 @@
+# @title Concurrent multi-session serving
+#
+# agent.py's main() serves one hard-coded user and session through a blocking
+# input() loop. This module serves many sessions concurrently on one Runner,
+# either over HTTP/WebSocket or as a JSONL batch driver.
+#
+# SessionDispatcher sits between the front ends and the Runner:
+#   * Each session gets a FIFO queue, drained by one worker task at a time, so
+#     a session's messages run in the order they arrived and never overlap.
+#     Different sessions run concurrently.
+#   * A semaphore bounds the turns in flight across all sessions (SERVE_CONCURRENCY).
+#   * Backpressure: once SERVE_MAX_PENDING messages are queued or running, or a
+#     single session has SERVE_SESSION_QUEUE waiting, new messages are rejected
+#     with Overloaded (HTTP 429 + Retry-After) instead of piling up in memory.
+#     The batch driver waits for capacity instead.
+#   * drain() stops accepting work, lets queued and running turns finish within
+#     a deadline, then cancels what is left.
+#
+# Scaling across processes: `--workers N` runs N server or batch processes,
+# and sessions are partitioned between them by crc32 of "user_id/session_id",
+# so each session is handled by exactly one process and keeps its ordering.
+# HTTP worker i listens on port + i and only serves its own sessions: a REST
+# call for another worker's session is redirected there (307 keeps the
+# method and body), and a WebSocket is told the right port and closed. A
+# proxy in front can route by the same hash (`worker_for`). The processes
+# share the on-disk state under AGENT_CACHE_DIR: the session DB (SQLite, WAL)
+# and, with EMBEDDINGS=local, the "queries" and "memories" embedding stores,
+# whose appends are serialized with a file lock (embeddings.py). Anything
+# else written there must be safe for several writers too.
+#
+#   python -m actual.serve --agent root_agent --port 8080 --workers 4
+#   python -m actual.serve --agent nl2sql_agent --batch questions.jsonl --out answers.jsonl
+#
+# Batch lines are {"user_id": ..., "session_id": ..., "text": ...}; results are
+# written in input order and carry the input line number in "line".
+
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import statistics
+import sys
+import time
+import zlib
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Callable, Optional
+
+from .agent import create_runner, run_turn, timing_summary
+from .registry import DEFAULT_AGENT, agent_names, shutdown
+
+SERVE_CONCURRENCY = int(os.environ.get("SERVE_CONCURRENCY", "32"))
+SERVE_MAX_PENDING = int(os.environ.get("SERVE_MAX_PENDING", "512"))
+SERVE_SESSION_QUEUE = int(os.environ.get("SERVE_SESSION_QUEUE", "8"))
+SERVE_TURN_TIMEOUT = float(os.environ.get("SERVE_TURN_TIMEOUT", "300"))
+SERVE_DRAIN_TIMEOUT = float(os.environ.get("SERVE_DRAIN_TIMEOUT", "30"))
+SERVE_APP_NAME = os.environ.get("SERVE_APP_NAME", "agent_server")
+
+# Sessions known to exist, so a session lookup is only paid on a session's first message
+KNOWN_SESSIONS = 10000
+
+
+class Overloaded(Exception):
+    """The dispatcher is at its queue-depth limit (or draining); retry later."""
+
+
+def worker_for(user_id: str, session_id: str, workers: int) -> int:
+    """The worker process that owns a session, in both HTTP and batch mode."""
+    return zlib.crc32(f"{user_id}/{session_id}".encode()) % workers
+
+
+class SessionDispatcher:
+    """Runs turns for many sessions on one Runner: ordered per session, bounded overall."""
+
+    def __init__(self, runner, max_concurrency: int = SERVE_CONCURRENCY, max_pending: int = SERVE_MAX_PENDING,
+                 max_session_queue: int = SERVE_SESSION_QUEUE, turn_timeout: float = SERVE_TURN_TIMEOUT):
+        self.runner = runner
+        self.max_concurrency = max_concurrency
+        self.max_pending = max_pending
+        self.max_session_queue = max_session_queue
+        self.turn_timeout = turn_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        # (user_id, session_id) -> queued (text, future, queued_at); a key is present while its worker runs
+        self._queues: dict[tuple[str, str], deque] = {}
+        self._workers: dict[tuple[str, str], asyncio.Task] = {}
+        self._known: OrderedDict[tuple[str, str], None] = OrderedDict()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self.draining = False
+        self.pending = 0  # queued + running
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._latencies: deque = deque(maxlen=1000)
+        self._waits: deque = deque(maxlen=1000)
+
+    async def submit(self, user_id: str, session_id: str, text: str, on_event: Optional[Callable] = None) -> str:
+        """Queue a message behind the session's earlier ones and return the agent's reply.
+
+        `on_event` is passed to run_turn() to follow the turn as it streams.
+        """
+        if self.draining:
+            self.rejected += 1
+            raise Overloaded("Server is shutting down.")
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise Overloaded(f"{self.pending} messages already pending.")
+        key = (user_id, session_id)
+        queue = self._queues.setdefault(key, deque())
+        if len(queue) >= self.max_session_queue:
+            self.rejected += 1
+            raise Overloaded(f"Session {session_id} already has {len(queue)} messages waiting.")
+        future = asyncio.get_running_loop().create_future()
+        queue.append((text, on_event, future, time.perf_counter()))
+        self.pending += 1
+        self._idle.clear()
+        if key not in self._workers:
+            self._workers[key] = asyncio.create_task(self._session_worker(key))
+        return await future
+
+    async def _ensure_session(self, user_id: str, session_id: str) -> None:
+        key = (user_id, session_id)
+        if key in self._known:
+            self._known.move_to_end(key)
+            return
+        service = self.runner.session_service
+        app_name = self.runner.app_name
+        if await service.get_session(app_name=app_name, user_id=user_id, session_id=session_id) is None:
+            await service.create_session(app_name=app_name, user_id=user_id, session_id=session_id)
+        self._known[key] = None
+        if len(self._known) > KNOWN_SESSIONS:
+            self._known.popitem(last=False)
+
+    async def _session_worker(self, key: tuple[str, str]) -> None:
+        user_id, session_id = key
+        queue = self._queues[key]
+        try:
+            while queue:
+                text, on_event, future, queued_at = queue.popleft()
+                try:
+                    if future.done():
+                        continue  # The caller went away before its turn came
+                    async with self._semaphore:
+                        started = time.perf_counter()
+                        self._waits.append(started - queued_at)
+                        self.running += 1
+                        try:
+                            await self._ensure_session(user_id, session_id)
+                            response = await asyncio.wait_for(
+                                run_turn(self.runner, user_id, session_id, text, on_event=on_event), self.turn_timeout)
+                            self.completed += 1
+                            self._latencies.append(time.perf_counter() - started)
+                            if not future.done():
+                                future.set_result(response)
+                        except Exception as e:
+                            self.failed += 1
+                            logging.warning(f"[Serve] Turn failed for {user_id}/{session_id}: {e!r}")
+                            if not future.done():
+                                future.set_exception(e)
+                        finally:
+                            self.running -= 1
+                finally:
+                    self.pending -= 1
+                    if self.pending == 0:
+                        self._idle.set()
+        finally:
+            del self._queues[key]
+            del self._workers[key]
+            # Only left over when the worker was cancelled by drain()
+            self.pending -= len(queue)
+            for _, _, future, _ in queue:
+                future.cancel()
+
+    async def drain(self, timeout: float = SERVE_DRAIN_TIMEOUT) -> None:
+        """Stop accepting messages and let pending ones finish; cancel whatever is left after `timeout`."""
+        self.draining = True
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"[Serve] Drain timed out with {self.pending} messages pending; cancelling them")
+            workers = list(self._workers.values())
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    def stats(self) -> dict:
+        latencies = sorted(self._latencies)
+        return {
+            "pid": os.getpid(),
+            "draining": self.draining,
+            "pending": self.pending,
+            "running": self.running,
+            "active_sessions": len(self._workers),
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "turn_p50_s": statistics.median(latencies) if latencies else None,
+            "turn_p95_s": latencies[int(len(latencies) * 0.95)] if latencies else None,
+            "queue_wait_avg_s": statistics.fmean(self._waits) if self._waits else None,
+            **timing_summary(),
+            "session_store": getattr(self.runner.session_service, "stats", dict)(),
+        }
+
+
+# @title HTTP / WebSocket front end
+
+def create_app(agent_name: Optional[str] = None):
+    """FastAPI app serving one agent; uvicorn calls this once per worker process."""
+    from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+    from fastapi import Request
+    from fastapi.responses import JSONResponse, RedirectResponse
+    from pydantic import BaseModel
+
+    agent_name = agent_name or os.environ.get("SERVE_AGENT", DEFAULT_AGENT)
+    # Set by serve_http for each of its worker processes
+    worker = int(os.environ.get("SERVE_WORKER", "0"))
+    workers = int(os.environ.get("SERVE_WORKERS", "1"))
+    base_port = int(os.environ.get("SERVE_BASE_PORT", "0"))
+
+    def owner_port(user_id: str, session_id: str) -> Optional[int]:
+        """Port of the worker owning the session, or None if it is this one."""
+        owner = worker_for(user_id, session_id, workers)
+        return None if owner == worker else base_port + owner
+
+    class Message(BaseModel):
+        text: str
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        app.state.dispatcher = SessionDispatcher(create_runner(agent_name, SERVE_APP_NAME))
+        logging.info(f"[Serve] {agent_name} ready in worker {os.getpid()}")
+        try:
+            yield
+        finally:
+            await app.state.dispatcher.drain()
+            await shutdown()
+
+    app = FastAPI(title=f"{agent_name} server", lifespan=lifespan)
+
+    @app.exception_handler(Overloaded)
+    async def overloaded(request, exc: Overloaded):
+        return JSONResponse({"error": str(exc)}, status_code=503 if app.state.dispatcher.draining else 429,
+                            headers={"Retry-After": "1"})
+
+    @app.post("/sessions/{user_id}/{session_id}/messages")
+    async def post_message(user_id: str, session_id: str, message: Message, request: Request):
+        port = owner_port(user_id, session_id)
+        if port is not None:
+            return RedirectResponse(str(request.url.replace(port=port)), status_code=307)
+        started = time.perf_counter()
+        try:
+            response = await app.state.dispatcher.submit(user_id, session_id, message.text)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail="The agent did not answer in time.")
+        return {"response": response, "latency_s": time.perf_counter() - started}
+
+    @app.websocket("/sessions/{user_id}/{session_id}/ws")
+    async def session_socket(websocket: WebSocket, user_id: str, session_id: str, stream: bool = False):
+        # One connection is one session: messages are answered one by one, in order.
+        # With ?stream=true, text chunks and tool progress are sent as they happen, before the reply.
+        await websocket.accept()
+        port = owner_port(user_id, session_id)
+        if port is not None:
+            await websocket.send_json({"error": f"Session {session_id} is served on port {port}.",
+                                       "retry": False, "port": port})
+            await websocket.close(code=1013)
+            return
+        progress: asyncio.Queue = asyncio.Queue()
+
+        def on_event(kind: str, event, text: str):
+            if kind == "text" and text:
+                progress.put_nowait({"event": "text", "text": text})
+            elif kind in ("tool_call", "tool_result"):
+                names = [call.name for call in event.get_function_calls()]
+                names += [response.name for response in event.get_function_responses()]
+                progress.put_nowait({"event": kind, "author": event.author, "tools": names})
+
+        async def forward_progress():
+            while (message := await progress.get()) is not None:
+                await websocket.send_json(message)
+
+        try:
+            while True:
+                text = await websocket.receive_text()
+                started = time.perf_counter()
+                forwarder = asyncio.create_task(forward_progress()) if stream else None
+                try:
+                    reply = {"response": await app.state.dispatcher.submit(
+                        user_id, session_id, text, on_event=on_event if stream else None)}
+                except Overloaded as e:
+                    reply = {"error": str(e), "retry": True}
+                except Exception as e:
+                    reply = {"error": f"{type(e).__name__}: {e}", "retry": False}
+                if forwarder is not None:
+                    progress.put_nowait(None)  # Everything streamed so far goes out before the reply
+                    await forwarder
+                reply["latency_s"] = time.perf_counter() - started
+                await websocket.send_json(reply)
+        except WebSocketDisconnect:
+            pass
+
+    @app.get("/healthz")
+    async def healthz():
+        return app.state.dispatcher.stats()
+
+    return app
+
+
+def _http_worker(agent_name: str, host: str, port: int, worker: int, workers: int) -> None:
+    import uvicorn
+
+    os.environ.update(SERVE_AGENT=agent_name, SERVE_WORKER=str(worker), SERVE_WORKERS=str(workers),
+                      SERVE_BASE_PORT=str(port))
+    uvicorn.run(f"{__package__}.serve:create_app", factory=True, host=host, port=port + worker,
+                timeout_graceful_shutdown=int(SERVE_DRAIN_TIMEOUT) + 5)
+
+
+def serve_http(agent_name: str, host: str, port: int, workers: int) -> None:
+    """Serve on `port`, or with several workers on port .. port + workers - 1, one session partition each."""
+    if workers == 1:
+        _http_worker(agent_name, host, port, 0, 1)
+        return
+    processes = [multiprocessing.Process(target=_http_worker, args=(agent_name, host, port, worker, workers))
+                 for worker in range(workers)]
+    for process in processes:
+        process.start()
+
+    def stop(signum, frame):
+        # Workers drain on SIGTERM; a repeated SIGINT would make uvicorn exit without draining
+        for process in processes:
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    for process in processes:
+        process.join()
+
+
+# @title JSONL batch driver
+
+def _session_of(line: dict) -> tuple[str, str]:
+    return str(line.get("user_id", "user_1")), str(line.get("session_id", "session_1"))
+
+
+async def run_batch(agent_name: str, lines: list[tuple[int, dict]]) -> tuple[list[dict], dict]:
+    """Answer (line number, request) pairs; returns results in input order and dispatcher stats.
+
+    Each session's lines are sent one after another and different sessions
+    concurrently. At most max_pending sessions are in flight, so the driver
+    waits for capacity instead of being rejected.
+    """
+    dispatcher = SessionDispatcher(create_runner(agent_name, SERVE_APP_NAME))
+    sessions: dict[tuple[str, str], list[tuple[int, dict]]] = {}
+    for number, line in lines:
+        sessions.setdefault(_session_of(line), []).append((number, line))
+    results: dict[int, dict] = {}
+    capacity = asyncio.Semaphore(dispatcher.max_pending)
+
+    async def converse(key: tuple[str, str], session_lines: list[tuple[int, dict]]) -> None:
+        user_id, session_id = key
+        async with capacity:
+            for number, line in session_lines:
+                started = time.perf_counter()
+                result = {"line": number, "user_id": user_id, "session_id": session_id}
+                try:
+                    result["response"] = await dispatcher.submit(user_id, session_id, line["text"])
+                except Exception as e:
+                    result["error"] = f"{type(e).__name__}: {e}"
+                result["latency_s"] = time.perf_counter() - started
+                results[number] = result
+
+    try:
+        await asyncio.gather(*(converse(key, session_lines) for key, session_lines in sessions.items()))
+        await dispatcher.drain()
+    finally:
+        await shutdown()
+    return [results[number] for number, _ in lines], dispatcher.stats()
+
+
+def _read_batch(path: str, worker: int = 0, workers: int = 1) -> list[tuple[int, dict]]:
+    """This worker's share of the batch: every line of the sessions that hash to it."""
+    lines = []
+    with open(path) as f:
+        for number, raw in enumerate(f, start=1):
+            if not raw.strip():
+                continue
+            line = json.loads(raw)
+            if worker_for(*_session_of(line), workers) == worker:
+                lines.append((number, line))
+    return lines
+
+
+def _batch_worker(agent_name: str, path: str, worker: int, workers: int) -> tuple[list[dict], dict]:
+    return asyncio.run(run_batch(agent_name, _read_batch(path, worker, workers)))
+
+
+def serve_batch(agent_name: str, path: str, out_path: Optional[str], workers: int) -> None:
+    started = time.perf_counter()
+    if workers > 1:
+        with multiprocessing.Pool(workers) as pool:
+            parts = pool.starmap(_batch_worker, [(agent_name, path, worker, workers) for worker in range(workers)])
+    else:
+        parts = [_batch_worker(agent_name, path, 0, 1)]
+    results = sorted((result for part, _ in parts for result in part), key=lambda result: result["line"])
+    out = open(out_path, "w") if out_path else sys.stdout
+    try:
+        for result in results:
+            out.write(json.dumps(result) + "\n")
+    finally:
+        if out_path:
+            out.close()
+    elapsed = time.perf_counter() - started
+    summary = {"messages": len(results), "errors": sum(1 for result in results if "error" in result),
+               "seconds": elapsed, "messages_per_s": len(results) / elapsed if elapsed else None,
+               "workers": [stats for _, stats in parts]}
+    print(json.dumps(summary), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve an agent to many concurrent sessions.")
+    parser.add_argument("--agent", choices=agent_names(), default=DEFAULT_AGENT)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Server (or batch) processes, each owning a share of the sessions; HTTP worker i "
+                             "listens on --port + i. They share AGENT_CACHE_DIR, whose stores lock their writes")
+    parser.add_argument("--batch", default=None, help="Answer a JSONL file of messages instead of serving HTTP")
+    parser.add_argument("--out", default=None, help="Where to write batch results (default: stdout)")
+    args = parser.parse_args()
+    if args.batch:
+        serve_batch(args.agent, args.batch, args.out, args.workers)
+    else:
+        serve_http(args.agent, args.host, args.port, args.workers)
@@ -0,0 +1,451 @@
+# @title Persistent, bounded session store
+#
+# InMemorySessionService kept every session, and every event in it, in RAM
+# for the life of the process, lost them all on restart, and let the
+# transcript grow without bound. Because the whole transcript is resent to
+# Gemini on every turn, latency and token cost grew with conversation length.
+#
+# SqliteSessionService stores sessions, events and app/user state in a
+# local SQLite database in WAL mode: readers do not block the writer, and
+# several worker processes can share the file. Every event is written through
+# as it is appended. Recently used sessions are also kept in an in-memory LRU
+# (SESSION_CACHE_SIZE entries). Sessions idle for SESSION_IDLE_SECONDS are
+# evicted from it and reloaded from disk on their next message. Every write
+# bumps the session's row version, and a cached session is only used while its
+# version matches the database, so another process appending to or compacting
+# the same session makes this one reload it.
+#
+# When a session's history goes over SESSION_TOKEN_BUDGET (estimated at about
+# 4 characters per token), the end of the turn compacts it:
+#   * The newest whole turns, up to SESSION_KEEP_TOKENS, are kept verbatim.
+#   * Everything older is replaced by a single summary event: a digest of the
+#     earlier user requests and agent replies, folded into any previous summary.
+# The dropped events are deleted from the database too, so both the prompt and
+# the stored history stay bounded. Pass `summarize=` to produce the summary
+# some other way, e.g. with a model.
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+from google.adk.events import Event
+from google.adk.sessions import BaseSessionService, Session
+from google.adk.sessions.base_session_service import GetSessionConfig, ListSessionsResponse
+from google.adk.sessions.state import State
+from google.genai import types
+
+from .search_cache import CACHE_DIR
+
+SESSION_DB = os.environ.get("SESSION_DB", os.path.join(CACHE_DIR, "sessions.db"))
+SESSION_CACHE_SIZE = int(os.environ.get("SESSION_CACHE_SIZE", "256"))
+SESSION_IDLE_SECONDS = float(os.environ.get("SESSION_IDLE_SECONDS", "900"))
+SESSION_TOKEN_BUDGET = int(os.environ.get("SESSION_TOKEN_BUDGET", "8000"))
+SESSION_KEEP_TOKENS = int(os.environ.get("SESSION_KEEP_TOKENS", str(SESSION_TOKEN_BUDGET // 2)))
+# Digest limits: per summarized message, and for the whole summary (about a quarter of the token budget)
+SUMMARY_ITEM_CHARS = 200
+SUMMARY_MAX_CHARS = int(os.environ.get("SUMMARY_MAX_CHARS", str(SESSION_TOKEN_BUDGET)))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    app_name TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    state TEXT NOT NULL,
+    last_update_time REAL NOT NULL,
+    version INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (app_name, user_id, id)
+);
+CREATE TABLE IF NOT EXISTS events (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    app_name TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    event TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_by_session ON events (app_name, user_id, session_id, seq);
+CREATE TABLE IF NOT EXISTS app_states (app_name TEXT PRIMARY KEY, state TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS user_states (
+    app_name TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    state TEXT NOT NULL,
+    PRIMARY KEY (app_name, user_id)
+);
+"""
+
+SessionKey = tuple[str, str, str]
+
+
+def estimate_tokens(event: Event) -> int:
+    """Rough prompt size of an event: about 4 characters per token."""
+    if not event.content or not event.content.parts:
+        return 0
+    chars = 0
+    for part in event.content.parts:
+        if part.text:
+            chars += len(part.text)
+        if part.function_call:
+            chars += len(part.function_call.name or "") + len(json.dumps(part.function_call.args or {}, default=str))
+        if part.function_response:
+            chars += len(json.dumps(part.function_response.response or {}, default=str))
+    return chars // 4 + 1
+
+
+def _text(event: Event) -> str:
+    if not event.content or not event.content.parts:
+        return ""
+    return "".join(part.text for part in event.content.parts if part.text).strip()
+
+
+def _is_summary(event: Event) -> bool:
+    return bool(event.custom_metadata and event.custom_metadata.get("summary"))
+
+
+def _starts_turn(event: Event) -> bool:
+    """A user message: the only safe place to cut history without splitting a tool call from its response."""
+    return event.author == "user" and bool(_text(event)) and not _is_summary(event)
+
+
+def digest(events: list[Event]) -> str:
+    """Extractive summary: the earlier summary, then each user message and agent reply, truncated."""
+    lines = []
+    for event in events:
+        text = _text(event)
+        if not text:
+            continue
+        if _is_summary(event):
+            lines.append(text)
+            continue
+        if event.get_function_calls() or event.get_function_responses():
+            continue
+        if len(text) > SUMMARY_ITEM_CHARS:
+            text = text[:SUMMARY_ITEM_CHARS] + "..."
+        lines.append(f"- {event.author}: {text}")
+    summary = "\n".join(lines)
+    if len(summary) > SUMMARY_MAX_CHARS:
+        # Keep the most recent part of the digest
+        summary = "...\n" + summary[-SUMMARY_MAX_CHARS:].split("\n", 1)[-1]
+    return summary
+
+
+def _summary_event(text: str, timestamp: float) -> Event:
+    if not text.startswith("Summary of the earlier conversation"):
+        text = f"Summary of the earlier conversation:\n{text}"
+    return Event(
+        id=f"summary-{uuid.uuid4().hex[:8]}",
+        author="user",
+        content=types.Content(role="user", parts=[types.Part(text=text)]),
+        custom_metadata={"summary": True},
+        timestamp=timestamp,
+    )
+
+
+def _split_state(state: dict[str, Any]) -> tuple[dict, dict, dict]:
+    """Session, app and user parts of a state dict; temp: keys are never stored."""
+    session_state, app_state, user_state = {}, {}, {}
+    for key, value in state.items():
+        if key.startswith(State.APP_PREFIX):
+            app_state[key.removeprefix(State.APP_PREFIX)] = value
+        elif key.startswith(State.USER_PREFIX):
+            user_state[key.removeprefix(State.USER_PREFIX)] = value
+        elif not key.startswith(State.TEMP_PREFIX):
+            session_state[key] = value
+    return session_state, app_state, user_state
+
+
+class _Cached:
+    __slots__ = ("session", "tokens", "seqs", "version", "last_access")
+
+    def __init__(self, session: Session, seqs: list[int], version: int = 0):
+        self.session = session  # Session and event state only; app:/user: keys are merged on read
+        self.seqs = seqs  # Database row of each event, in order
+        self.version = version  # sessions.version this copy was loaded at
+        self.tokens = sum(estimate_tokens(event) for event in session.events)
+        self.last_access = time.monotonic()
+
+
+class SqliteSessionService(BaseSessionService):
+    """Session service persisted to SQLite (WAL), with an LRU of hot sessions and history compaction."""
+
+    def __init__(self, path: str = SESSION_DB, cache_size: int = SESSION_CACHE_SIZE,
+                 idle_seconds: float = SESSION_IDLE_SECONDS, token_budget: int = SESSION_TOKEN_BUDGET,
+                 keep_tokens: int = SESSION_KEEP_TOKENS, summarize: Callable[[list[Event]], str] = digest):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.cache_size = cache_size
+        self.idle_seconds = idle_seconds
+        self.token_budget = token_budget
+        self.keep_tokens = keep_tokens
+        self.summarize = summarize
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA busy_timeout=5000")
+        self._db.executescript(SCHEMA)
+        if "version" not in {row[1] for row in self._db.execute("PRAGMA table_info(sessions)")}:
+            # Databases created before sessions were versioned
+            self._db.execute("ALTER TABLE sessions ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        self._db_lock = threading.Lock()
+        self._cache: OrderedDict[SessionKey, _Cached] = OrderedDict()
+        self.hits = 0
+        self.loads = 0
+        self.reloads = 0
+        self.evictions = 0
+        self.compactions = 0
+        self.tokens_compacted = 0
+
+    # Database access runs on a worker thread so the event loop never waits on disk
+
+    def _query(self, sql: str, params: tuple = ()) -> list[tuple]:
+        with self._db_lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def _transaction(self, statements: list[tuple[str, tuple]]) -> list[Optional[int]]:
+        """Run statements atomically; returns each statement's lastrowid."""
+        with self._db_lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row_ids = [self._db.execute(sql, params).lastrowid for sql, params in statements]
+                self._db.execute("COMMIT")
+                return row_ids
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    async def _run(self, func: Callable, *args):
+        return await asyncio.to_thread(func, *args)
+
+    # LRU of hot sessions
+
+    def _remember(self, key: SessionKey, cached: _Cached) -> None:
+        self._cache[key] = cached
+        self._cache.move_to_end(key)
+        now = time.monotonic()
+        while self._cache:
+            oldest_key, oldest = next(iter(self._cache.items()))
+            if len(self._cache) <= self.cache_size and now - oldest.last_access < self.idle_seconds:
+                break
+            del self._cache[oldest_key]
+            self.evictions += 1
+
+    def _load(self, key: SessionKey) -> Optional[_Cached]:
+        app_name, user_id, session_id = key
+        rows = self._query(
+            "SELECT state, last_update_time, version FROM sessions WHERE app_name=? AND user_id=? AND id=?", key)
+        if not rows:
+            return None
+        state, last_update_time, version = rows[0]
+        event_rows = self._query(
+            "SELECT seq, event FROM events WHERE app_name=? AND user_id=? AND session_id=? ORDER BY seq", key)
+        session = Session(id=session_id, app_name=app_name, user_id=user_id, state=json.loads(state),
+                          events=[Event.model_validate_json(event) for _, event in event_rows],
+                          last_update_time=last_update_time)
+        return _Cached(session, [seq for seq, _ in event_rows], version)
+
+    def _current(self, key: SessionKey, cached: Optional[_Cached]) -> tuple[Optional[_Cached], bool]:
+        """The cached copy if the database still has its version, else a fresh load; and whether it was cached."""
+        if cached is not None:
+            rows = self._query("SELECT version FROM sessions WHERE app_name=? AND user_id=? AND id=?", key)
+            if rows and rows[0][0] == cached.version:
+                return cached, True
+        return self._load(key), False
+
+    async def _cached(self, key: SessionKey) -> Optional[_Cached]:
+        stale = self._cache.get(key)
+        cached, hit = await self._run(self._current, key, stale)
+        if hit:
+            self.hits += 1
+        else:
+            if stale is not None:
+                # Another process wrote to the session, or deleted it
+                self._cache.pop(key, None)
+                self.reloads += 1
+            if cached is None:
+                return None
+            self.loads += 1
+        cached.last_access = time.monotonic()
+        self._remember(key, cached)
+        return cached
+
+    def _shared_state(self, app_name: str, user_id: str) -> dict[str, Any]:
+        state = {}
+        for (value,) in self._query("SELECT state FROM app_states WHERE app_name=?", (app_name,)):
+            state.update({State.APP_PREFIX + key: item for key, item in json.loads(value).items()})
+        for (value,) in self._query("SELECT state FROM user_states WHERE app_name=? AND user_id=?",
+                                    (app_name, user_id)):
+            state.update({State.USER_PREFIX + key: item for key, item in json.loads(value).items()})
+        return state
+
+    def _merge_shared(self, app_name: str, user_id: str, shared: dict, app_state: dict, user_state: dict) -> list:
+        """Statements that fold app:/user: state changes into their tables."""
+        statements = []
+        if app_state:
+            merged = {key.removeprefix(State.APP_PREFIX): value for key, value in shared.items()
+                      if key.startswith(State.APP_PREFIX)}
+            merged.update(app_state)
+            statements.append(("INSERT OR REPLACE INTO app_states VALUES (?, ?)", (app_name, json.dumps(merged))))
+        if user_state:
+            merged = {key.removeprefix(State.USER_PREFIX): value for key, value in shared.items()
+                      if key.startswith(State.USER_PREFIX)}
+            merged.update(user_state)
+            statements.append(("INSERT OR REPLACE INTO user_states VALUES (?, ?, ?)",
+                               (app_name, user_id, json.dumps(merged))))
+        return statements
+
+    # BaseSessionService
+
+    async def create_session(self, *, app_name: str, user_id: str, state: Optional[dict[str, Any]] = None,
+                             session_id: Optional[str] = None) -> Session:
+        session_id = (session_id or "").strip() or str(uuid.uuid4())
+        session_state, app_state, user_state = _split_state(state or {})
+        now = time.time()
+
+        def create() -> dict:
+            shared = self._shared_state(app_name, user_id)
+            try:
+                self._transaction(
+                    [("INSERT INTO sessions (app_name, user_id, id, state, last_update_time) VALUES (?, ?, ?, ?, ?)",
+                      (app_name, user_id, session_id, json.dumps(session_state), now))]
+                    + self._merge_shared(app_name, user_id, shared, app_state, user_state))
+            except sqlite3.IntegrityError:
+                raise ValueError(f"Session {session_id} already exists for {app_name}/{user_id}.")
+            return self._shared_state(app_name, user_id)
+
+        shared = await self._run(create)
+        session = Session(id=session_id, app_name=app_name, user_id=user_id, state=session_state,
+                          last_update_time=now)
+        self._remember((app_name, user_id, session_id), _Cached(session, []))
+        return self._copy(session, shared)
+
+    async def get_session(self, *, app_name: str, user_id: str, session_id: str,
+                          config: Optional[GetSessionConfig] = None) -> Optional[Session]:
+        cached = await self._cached((app_name, user_id, session_id))
+        if cached is None:
+            return None
+        session = self._copy(cached.session, await self._run(self._shared_state, app_name, user_id))
+        if config:
+            if config.num_recent_events:
+                session.events = session.events[-config.num_recent_events:]
+            if config.after_timestamp:
+                session.events = [event for event in session.events if event.timestamp >= config.after_timestamp]
+        return session
+
+    @staticmethod
+    def _copy(session: Session, shared: dict[str, Any]) -> Session:
+        # Callers append to their copy; events themselves are never modified, so a shallow copy is enough
+        return session.model_copy(update={"events": list(session.events), "state": {**session.state, **shared}})
+
+    async def list_sessions(self, *, app_name: str, user_id: str) -> ListSessionsResponse:
+        rows = await self._run(self._query, "SELECT id, last_update_time FROM sessions WHERE app_name=? AND user_id=?",
+                               (app_name, user_id))
+        return ListSessionsResponse(sessions=[
+            Session(id=session_id, app_name=app_name, user_id=user_id, last_update_time=last_update_time)
+            for session_id, last_update_time in rows])
+
+    async def delete_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
+        key = (app_name, user_id, session_id)
+        self._cache.pop(key, None)
+        await self._run(self._transaction, [
+            ("DELETE FROM events WHERE app_name=? AND user_id=? AND session_id=?", key),
+            ("DELETE FROM sessions WHERE app_name=? AND user_id=? AND id=?", key),
+        ])
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        if event.partial:
+            return event
+        # Update the caller's copy
+        await super().append_event(session=session, event=event)
+        session.last_update_time = event.timestamp
+
+        key = (session.app_name, session.user_id, session.id)
+        cached = await self._cached(key)
+        if cached is None:
+            return event
+        session_delta, app_delta, user_delta = _split_state(event.actions.state_delta if event.actions else {})
+        cached.session.events.append(event)
+        cached.session.state.update(session_delta)
+        cached.session.last_update_time = event.timestamp
+        cached.tokens += estimate_tokens(event)
+
+        def store() -> int:
+            shared = self._shared_state(session.app_name, session.user_id) if app_delta or user_delta else {}
+            row_ids = self._transaction(
+                [("INSERT INTO events (app_name, user_id, session_id, event) VALUES (?, ?, ?, ?)",
+                  (*key, event.model_dump_json(exclude_none=True))),
+                 ("UPDATE sessions SET state=?, last_update_time=?, version=version+1 "
+                  "WHERE app_name=? AND user_id=? AND id=?",
+                  (json.dumps(cached.session.state), event.timestamp, *key))]
+                + self._merge_shared(session.app_name, session.user_id, shared, app_delta, user_delta))
+            return row_ids[0]
+
+        cached.seqs.append(await self._run(store))
+        # If another process wrote in between, the database is further ahead and the next read reloads
+        cached.version += 1
+        if cached.tokens > self.token_budget and event.is_final_response():
+            await self._compact(key, cached)
+        return event
+
+    # History compaction
+
+    def _cut(self, events: list[Event]) -> Optional[int]:
+        """Index of the first event to keep: the oldest turn start that fits in keep_tokens (at least the last turn)."""
+        cut, kept = None, 0
+        for index in range(len(events) - 1, -1, -1):
+            kept += estimate_tokens(events[index])
+            if _starts_turn(events[index]):
+                if cut is not None and kept > self.keep_tokens:
+                    break
+                cut = index
+        if cut is None or cut == 0 or (cut == 1 and _is_summary(events[0])):
+            return None  # Nothing older than the kept turns
+        return cut
+
+    async def _compact(self, key: SessionKey, cached: _Cached) -> None:
+        events = cached.session.events
+        cut = self._cut(events)
+        if cut is None:
+            return
+        dropped, kept = events[:cut], events[cut:]
+        try:
+            summary = _summary_event(self.summarize(dropped), dropped[-1].timestamp)
+        except Exception as e:
+            logging.warning(f"[Sessions] Could not summarize {key[2]}: {e}")
+            return
+        # The summary takes the row of the newest dropped event, so ordering by seq still holds
+        summary_seq = cached.seqs[cut - 1]
+        await self._run(self._transaction, [
+            ("DELETE FROM events WHERE app_name=? AND user_id=? AND session_id=? AND seq<?", (*key, summary_seq)),
+            ("UPDATE events SET event=? WHERE seq=?", (summary.model_dump_json(exclude_none=True), summary_seq)),
+            ("UPDATE sessions SET version=version+1 WHERE app_name=? AND user_id=? AND id=?", key),
+        ])
+        before = cached.tokens
+        cached.session.events = [summary] + kept
+        cached.seqs = [summary_seq] + cached.seqs[cut:]
+        cached.tokens = sum(estimate_tokens(event) for event in cached.session.events)
+        cached.version += 1
+        self.compactions += 1
+        self.tokens_compacted += before - cached.tokens
+        logging.info(f"[Sessions] Compacted {key[2]}: {len(dropped)} events, ~{before} -> ~{cached.tokens} tokens")
+
+    def stats(self) -> dict:
+        return {
+            "cached_sessions": len(self._cache),
+            "cached_events": sum(len(cached.session.events) for cached in self._cache.values()),
+            "hits": self.hits,
+            "loads": self.loads,
+            "reloads": self.reloads,
+            "evictions": self.evictions,
+            "compactions": self.compactions,
+            "tokens_compacted": self.tokens_compacted,
+        }
+
+    def close(self) -> None:
+        with self._db_lock:
+            self._db.close()
@@ -0,0 +1,75 @@
+# @title Snippets and token budgets for search results
+#
+# get_file returns short, highlighted snippets of the best chunks rather than
+# whole documents, and stops adding hits once the (estimated) token budget is
+# spent, so the prompt size per search stays bounded however large the
+# documents are.
+
+import os
+import re
+
+from .keyword_index import tokenize
+
+SNIPPET_CHARS = int(os.environ.get("SEARCH_SNIPPET_CHARS", "400"))
+SEARCH_TOKEN_BUDGET = int(os.environ.get("SEARCH_TOKEN_BUDGET", "1500"))
+
+# Rough average for English text with Gemini / Llama style tokenizers
+CHARS_PER_TOKEN = 4
+
+# Ignore very short query words when highlighting ("a", "of", ...)
+MIN_TERM_LENGTH = 3
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def _term_pattern(query: str):
+    terms = sorted({term for term in tokenize(query) if len(term) >= MIN_TERM_LENGTH}, key=len, reverse=True)
+    if not terms:
+        return None
+    return re.compile(r"\b(" + "|".join(re.escape(term) for term in terms) + r")\b", re.IGNORECASE)
+
+
+def extract_snippet(text: str, query: str, max_chars: int = SNIPPET_CHARS) -> str:
+    """Return the window of `text` with the most query-term matches, terms wrapped in **bold**."""
+    pattern = _term_pattern(query)
+    matches = [m.start() for m in pattern.finditer(text)][:200] if pattern else []
+    if len(text) <= max_chars:
+        start, end = 0, len(text)
+    elif not matches:
+        start, end = 0, max_chars
+    else:
+        # Start a window a little before each match and keep the one covering the most matches
+        best_start, best_count = 0, -1
+        for position in matches:
+            candidate = max(0, min(position - max_chars // 4, len(text) - max_chars))
+            count = sum(1 for other in matches if candidate <= other < candidate + max_chars)
+            if count > best_count:
+                best_start, best_count = candidate, count
+        start, end = best_start, best_start + max_chars
+        # Snap to word boundaries
+        if start > 0:
+            space = text.find(" ", start, start + 40)
+            start = space + 1 if space != -1 else start
+        if end < len(text):
+            space = text.rfind(" ", end - 40, end)
+            end = space if space != -1 else end
+
+    snippet = text[start:end].strip()
+    if pattern:
+        snippet = pattern.sub(r"**\1**", snippet)
+    return f"{'...' if start > 0 else ''}{snippet}{'...' if end < len(text) else ''}"
+
+
+def fit_to_budget(items: list[dict], budget_tokens: int = SEARCH_TOKEN_BUDGET) -> tuple[list[dict], bool]:
+    """Keep items in order until the budget is spent. Returns (kept, truncated)."""
+    kept = []
+    used = 0
+    for item in items:
+        cost = estimate_tokens(str(item))
+        if kept and used + cost > budget_tokens:
+            return kept, True
+        kept.append(item)
+        used += cost
+    return kept, False
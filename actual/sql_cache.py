@@ -0,0 +1,167 @@
+# @title Question -> SQL memoization and SQL result cache for nl2sql_agent
+#
+# People ask nl2sql_agent the same questions over and over ("list all songs",
+# "when was Minji born"), and every time the model regenerated the SQL and
+# Postgres ran it again. Two levels of caching cut both out:
+#
+#   1. QuestionCache maps a normalized question to SQL that already ran
+#      successfully. nl2sql_agent's before_model_callback answers the SQL
+#      generation turn from it by emitting the search_nj_db call directly.
+#      Matching near-identical questions by embedding similarity is opt-in
+#      (NL2SQL_SIMILARITY > 0 with EMBEDDINGS=local). Template-identical
+#      questions about different people embed almost the same, so a fuzzy match
+#      is only accepted when the names, numbers and quoted strings of each
+#      question appear in the other and every literal in the cached SQL appears
+#      in the new one.
+#   2. SqlResultCache keeps tool results per SQL statement. Nothing in this
+#      tree writes to the tables (the pool is read-only), so entries simply
+#      expire after NL2SQL_RESULT_TTL; lower it if another process updates the
+#      data and results must show up sooner.
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+import numpy as np
+
+from .embeddings import EMBEDDINGS_MODE, Embedder, query_embedder
+from .search_cache import ResultCache, normalize_query
+
+NL2SQL_QUESTION_CACHE_SIZE = int(os.environ.get("NL2SQL_QUESTION_CACHE_SIZE", "512"))
+NL2SQL_QUESTION_TTL = float(os.environ.get("NL2SQL_QUESTION_TTL", "86400"))
+NL2SQL_RESULT_CACHE_SIZE = int(os.environ.get("NL2SQL_RESULT_CACHE_SIZE", "256"))
+NL2SQL_RESULT_TTL = float(os.environ.get("NL2SQL_RESULT_TTL", "300"))
+# Cosine similarity above which two questions are treated as the same one; 0 turns fuzzy matching off
+NL2SQL_SIMILARITY = float(os.environ.get("NL2SQL_SIMILARITY", "0"))
+
+_trailing_punctuation = re.compile(r"[\s?.!]+$")
+_sql_literal = re.compile(r"'((?:[^']|'')*)'|\b(\d+(?:\.\d+)?)\b")
+# Quoted strings, numbers and capitalized words after the first: what tells two same-shaped questions apart
+_entity = re.compile(r"[\"']([^\"']+)[\"']|\b(\d+(?:\.\d+)?)\b|(?<=\S\s)([A-Z][\w-]*)")
+
+
+def normalize_question(question: str) -> str:
+    return _trailing_punctuation.sub("", normalize_query(question))
+
+
+def question_entities(question: str) -> frozenset[str]:
+    return frozenset(next(group for group in match.groups() if group).lower() for match in _entity.finditer(question))
+
+
+def sql_literals(sql: str) -> frozenset[str]:
+    """String and numeric literals in a statement, lowercased."""
+    return frozenset((match.group(1) if match.group(1) is not None else match.group(2)).replace("''", "'").lower()
+                     for match in _sql_literal.finditer(sql))
+
+
+def _mentions(text: str, word: str) -> bool:
+    return re.search(rf"(?<!\w){re.escape(word)}(?!\w)", text) is not None
+
+
+class SqlResultCache(ResultCache):
+    """ResultCache keyed by SQL text, expiring by TTL only."""
+
+    def __init__(self, max_size: int = NL2SQL_RESULT_CACHE_SIZE, ttl: float = NL2SQL_RESULT_TTL):
+        super().__init__(max_size, ttl, version=None)
+
+    @staticmethod
+    def _key(sql: str) -> str:
+        # Exact text: normalizing case would also fold string literals ('Minji' vs 'MINJI')
+        return sql.strip().rstrip(";").rstrip()
+
+    def get(self, sql: str) -> Optional[Any]:
+        return super().get(self._key(sql))
+
+    def put(self, sql: str, value: Any, ttl: Optional[float] = None) -> None:
+        super().put(self._key(sql), value, ttl)
+
+
+class QuestionCache:
+    """LRU + TTL map from natural-language questions to validated SQL, with optional fuzzy lookup."""
+
+    def __init__(self, max_size: int = NL2SQL_QUESTION_CACHE_SIZE, ttl: float = NL2SQL_QUESTION_TTL,
+                 similarity: float = NL2SQL_SIMILARITY, embedder: Optional[Callable[[], Embedder]] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.similarity = similarity
+        self.embedder = embedder  # factory, so the embedding store is only opened on first use
+        # normalized question -> (expires_at, sql, unit vector or None, question as asked)
+        self._entries: "OrderedDict[str, tuple[float, str, Optional[np.ndarray], str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+
+    def _vector(self, question: str) -> Optional[np.ndarray]:
+        if self.embedder is None or self.similarity <= 0:
+            return None
+        try:
+            vector = np.asarray(self.embedder().embed_one(question), dtype=np.float32)
+        except Exception:
+            # Fuzzy matching is best effort; exact matches keep working without Ollama
+            return None
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def get(self, question: str) -> Optional[str]:
+        key = normalize_question(question)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            candidates = [(k, e) for k, e in self._entries.items() if e[2] is not None and e[0] > now]
+        vector = self._vector(key) if candidates else None
+        if vector is not None:
+            _, best_entry = max(candidates, key=lambda item: float(item[1][2] @ vector))
+            if float(best_entry[2] @ vector) >= self.similarity and self._same_subject(question, best_entry):
+                with self._lock:
+                    self.similar_hits += 1
+                return best_entry[1]
+        with self._lock:
+            self.misses += 1
+        return None
+
+    @staticmethod
+    def _same_subject(question: str, entry: tuple) -> bool:
+        """Whether a similar cached question asks about the same things, so its SQL answers this one too."""
+        cached_question, text, cached_text = entry[3], question.lower(), entry[3].lower()
+        return (all(_mentions(cached_text, entity) for entity in question_entities(question))
+                and all(_mentions(text, entity) for entity in question_entities(cached_question))
+                and all(_mentions(text, literal) for literal in sql_literals(entry[1])))
+
+    def put(self, question: str, sql: str) -> None:
+        key = normalize_question(question)
+        vector = self._vector(key)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, sql, vector, question)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def discard(self, question: str) -> None:
+        with self._lock:
+            self._entries.pop(normalize_question(question), None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.similar_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "similar_hits": self.similar_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.similar_hits) / lookups if lookups else 0.0,
+            }
+
+
+# Shared by nl2sql_agent's callbacks and the search_nj_db tool
+question_cache = QuestionCache(embedder=query_embedder if EMBEDDINGS_MODE == "local" and NL2SQL_SIMILARITY > 0 else None)
+sql_result_cache = SqlResultCache()
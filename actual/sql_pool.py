@@ -0,0 +1,262 @@
+# @title Pooled Postgres access for the NL2SQL tool
+#
+# search_nj_db used to go through crewai's NL2SQLTool.execute_sql, which gave
+# no control over connections or statement preparation. SqlPool keeps a sized
+# pool of read-only connections; each query runs in its own transaction with a
+# statement timeout, and SELECT-style statements are PREPAREd once per
+# connection and then EXECUTEd, so hot questions skip reconnecting and
+# re-parsing/planning on the server. Callers block (up to the timeout) when
+# every connection is busy rather than failing.
+#
+# Results are bounded: at most SQL_MAX_ROWS rows are ever produced (the cap is
+# pushed into prepared statements as a LIMIT, and other statements are read
+# through a server-side cursor), and values are made JSON-friendly in the same
+# single pass that reads them.
+#
+# The SQL comes from a model, so read-only is enforced twice. Before anything
+# runs, a read-only pool only accepts a single SELECT or WITH statement (no
+# `;` outside literals, no data-modifying CTEs or side-effecting functions):
+# otherwise `COMMIT; DELETE FROM songs` would end the READ ONLY transaction
+# and write. And every connection is opened with
+# default_transaction_read_only=on, so the server refuses writes even if
+# something slips through. For production, also connect as a role that only
+# has SELECT grants.
+
+import itertools
+import re
+import logging
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from typing import Any, Optional
+from uuid import UUID
+
+import psycopg2
+import psycopg2.extensions
+from psycopg2.pool import ThreadedConnectionPool
+
+SQL_POOL_MIN = int(os.environ.get("SQL_POOL_MIN", "1"))
+SQL_POOL_MAX = int(os.environ.get("SQL_POOL_MAX", "10"))
+SQL_TIMEOUT_MS = int(os.environ.get("SQL_TIMEOUT_MS", "10000"))
+SQL_STATEMENT_CACHE_SIZE = int(os.environ.get("SQL_STATEMENT_CACHE_SIZE", "128"))
+SQL_MAX_ROWS = int(os.environ.get("SQL_MAX_ROWS", "200"))
+SQL_MAX_CELL_CHARS = int(os.environ.get("SQL_MAX_CELL_CHARS", "500"))
+
+# Rows pulled per round trip from a server-side cursor
+FETCH_SIZE = 100
+
+# Statements PostgreSQL can PREPARE that a read-only transaction will accept
+PREPARABLE = ("select", "with", "values", "table")
+# What a read-only pool runs at all
+READ_ONLY_STATEMENTS = ("select", "with")
+
+# Literals, quoted identifiers and comments, removed before looking at keywords and semicolons
+_quoted = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|(\$\w*\$).*?\1|--[^\n]*|/\*.*?\*/", re.DOTALL)
+# Inside a single SELECT/WITH, what can still write: data-modifying CTEs, SELECT INTO, row locks,
+# and functions that change settings, sequences, files or other sessions
+_unsafe = re.compile(
+    r"\b(insert|update|delete|merge|into)\b"
+    r"|\b(set_config|nextval|setval|dblink\w*|lo_\w+|pg_\w+)\s*\(",
+    re.IGNORECASE,
+)
+
+
+class UnsafeStatement(ValueError):
+    """A statement a read-only pool refuses to run."""
+
+
+def ensure_read_only(sql: str) -> str:
+    """Return `sql` without its trailing semicolon if it is one SELECT/WITH statement, else raise UnsafeStatement."""
+    sql = sql.strip().rstrip(";").strip()
+    bare = _quoted.sub(" ", sql)
+    if ";" in bare:
+        raise UnsafeStatement("Only a single statement is allowed")
+    if not bare.lstrip().lower().startswith(READ_ONLY_STATEMENTS):
+        raise UnsafeStatement("Only SELECT or WITH queries are allowed")
+    unsafe = _unsafe.search(bare)
+    if unsafe:
+        raise UnsafeStatement(f"{(unsafe.group(1) or unsafe.group(2)).upper()} is not allowed in a read-only query")
+    return sql
+
+
+def default_dsn() -> str:
+    return (
+        f"postgresql://{os.getenv('POSTGRES_USER')}:{os.getenv('POSTGRES_PASSWORD')}"
+        f"@{os.getenv('POSTGRES_HOST')}:{os.getenv('POSTGRES_PORT')}/{os.getenv('POSTGRES_DB')}"
+    )
+
+
+_PLAIN_TYPES = (type(None), bool, int, float)
+
+
+def encode_value(value: Any) -> Any:
+    """Turn a database value into something JSON-serializable and prompt-sized."""
+    if isinstance(value, _PLAIN_TYPES):
+        return value
+    if isinstance(value, str):
+        return value if len(value) <= SQL_MAX_CELL_CHARS else value[:SQL_MAX_CELL_CHARS] + "..."
+    if isinstance(value, (date, datetime, time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    if isinstance(value, UUID):
+        return str(value)
+    if isinstance(value, (bytes, memoryview)):
+        return f"<{len(value)} bytes>"
+    if isinstance(value, (list, tuple)):
+        return [encode_value(item) for item in value]
+    if isinstance(value, dict):
+        return {key: encode_value(item) for key, item in value.items()}
+    return str(value)
+
+
+class _Connection(psycopg2.extensions.connection):
+    """Connection that remembers which statements it has prepared (SQL text -> statement name)."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared: "OrderedDict[str, str]" = OrderedDict()
+
+
+class SqlPool:
+    def __init__(self, dsn: Optional[str] = None, min_connections: int = SQL_POOL_MIN,
+                 max_connections: int = SQL_POOL_MAX, timeout_ms: int = SQL_TIMEOUT_MS,
+                 statement_cache_size: int = SQL_STATEMENT_CACHE_SIZE, read_only: bool = True):
+        self.dsn = dsn
+        self.min_connections = min_connections
+        self.max_connections = max_connections
+        self.timeout_ms = timeout_ms
+        self.statement_cache_size = statement_cache_size
+        self.read_only = read_only
+        self._pool: Optional[ThreadedConnectionPool] = None
+        self._lock = threading.Lock()
+        # psycopg2's pool raises when exhausted; the semaphore makes callers wait instead
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._names = itertools.count(1)
+        self.prepared_hits = 0
+        self.prepared_misses = 0
+
+    def _get_pool(self) -> ThreadedConnectionPool:
+        with self._lock:
+            if self._pool is None:
+                # Opened lazily so importing agent.py never needs a reachable database
+                options = {"options": "-c default_transaction_read_only=on"} if self.read_only else {}
+                self._pool = ThreadedConnectionPool(
+                    self.min_connections, self.max_connections, self.dsn or default_dsn(),
+                    connection_factory=_Connection, **options,
+                )
+            return self._pool
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for one transaction; broken connections are discarded."""
+        if not self._slots.acquire(timeout=self.timeout_ms / 1000):
+            raise TimeoutError(f"No database connection available within {self.timeout_ms} ms")
+        pool = None
+        conn = None
+        broken = False
+        try:
+            pool = self._get_pool()
+            conn = pool.getconn()
+            if conn.readonly != self.read_only:
+                conn.set_session(readonly=self.read_only)
+            yield conn
+            conn.commit()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        except Exception:
+            if conn is not None and not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            if conn is not None:
+                pool.putconn(conn, close=broken or bool(conn.closed))
+            self._slots.release()
+
+    def _prepare(self, conn: _Connection, cursor, sql: str) -> Optional[str]:
+        """Return the name of a prepared statement for `sql`, or None if it cannot be prepared."""
+        name = conn.prepared.get(sql)
+        if name is not None:
+            conn.prepared.move_to_end(sql)
+            self.prepared_hits += 1
+            return name
+        self.prepared_misses += 1
+        if not sql.lstrip().lower().startswith(PREPARABLE) or ";" in sql:
+            return None
+        name = f"nl2sql_{next(self._names)}"
+        cursor.execute("SAVEPOINT before_prepare")
+        try:
+            cursor.execute(f"PREPARE {name} AS {sql}")
+        except psycopg2.Error as e:
+            # Fall back to a plain execution, which reports the error the model should see
+            logging.debug(f"[SQL] Could not prepare statement: {e}")
+            cursor.execute("ROLLBACK TO SAVEPOINT before_prepare")
+            return None
+        cursor.execute("RELEASE SAVEPOINT before_prepare")
+        conn.prepared[sql] = name
+        if len(conn.prepared) > self.statement_cache_size:
+            _, evicted = conn.prepared.popitem(last=False)
+            cursor.execute(f"DEALLOCATE {evicted}")
+        return name
+
+    def execute(self, sql: str, timeout_ms: Optional[int] = None,
+                max_rows: int = SQL_MAX_ROWS) -> tuple[list[str], list[list], bool]:
+        """Run one statement. Returns (column names, encoded rows, truncated).
+
+        A read-only pool raises UnsafeStatement for anything but a single SELECT/WITH query.
+        """
+        sql = ensure_read_only(sql) if self.read_only else sql.strip().rstrip(";").strip()
+        preparable = sql.lstrip().lower().startswith(PREPARABLE) and ";" not in sql
+        with self.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SET LOCAL statement_timeout = %s", (timeout_ms or self.timeout_ms,))
+                # One row past the cap tells us whether the result was truncated
+                # The newline keeps a trailing -- comment from swallowing the wrapper
+                capped = f"SELECT * FROM ({sql}\n) AS capped LIMIT {max_rows + 1}" if preparable else sql
+                name = self._prepare(conn, cursor, capped) if preparable else None
+                if name:
+                    cursor.execute(f"EXECUTE {name}")
+                    return self._read(cursor, max_rows)
+            if preparable:
+                # Could not prepare: stream the statement through a server-side cursor instead
+                with conn.cursor(name="nl2sql_stream") as cursor:
+                    cursor.itersize = FETCH_SIZE
+                    cursor.execute(sql)
+                    return self._read(cursor, max_rows)
+            with conn.cursor() as cursor:
+                cursor.execute(sql)
+                return self._read(cursor, max_rows)
+
+    @staticmethod
+    def _read(cursor, max_rows: int) -> tuple[list[str], list[list], bool]:
+        if cursor.description is None and not cursor.name:
+            return [], [], False
+        rows = []
+        while len(rows) <= max_rows:
+            batch = cursor.fetchmany(min(FETCH_SIZE, max_rows + 1 - len(rows)))
+            if not batch:
+                break
+            rows.extend([encode_value(value) for value in row] for row in batch)
+        # Named (server-side) cursors only know their description after the first fetch
+        columns = [column.name for column in cursor.description or ()]
+        truncated = len(rows) > max_rows
+        return columns, rows[:max_rows], truncated
+
+    def stats(self) -> dict:
+        return {"prepared_hits": self.prepared_hits, "prepared_misses": self.prepared_misses}
+
+    def close(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._pool.closeall()
+                self._pool = None
+
+
+# Shared by the NL2SQL tool
+sql_pool = SqlPool()
@@ -0,0 +1,250 @@
+# @title Local stand-ins for Weaviate, Postgres and the MCP servers
+#
+# Used by benchmark_agents.py so the agents' tools run their real code paths
+# (caches, offloading, pools, result shaping) against services that live in
+# the benchmark process or in a stub subprocess:
+#
+#   FakeWeaviateClient  an in-memory Document collection with a deterministic,
+#                       synthetic corpus. It supports the query calls
+#                       search_agent makes (near_text/near_vector/hybrid/bm25,
+#                       fetch_objects with filters, sort and cursor, and
+#                       fetch_object_by_id), ranked by word overlap.
+#   SqliteSqlPool       SqlPool's execute() over an in-memory SQLite copy of the
+#                       NewJeans members/songs tables, read-only.
+#   mcp_stub_server.py  replaces the postgres toolbox and agentmail-mcp behind
+#                       their existing mcp_pool pools (`--server agentmail` for the latter).
+#
+# Every stand-in sleeps for a configurable latency per call, so the load
+# looks like a network service to the agents (blocking calls stay in worker
+# threads, MCP calls stay asynchronous). install() swaps them in after the
+# agents' modules are imported.
+
+import os
+import random
+import re
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+from typing import Any, Optional
+
+from .sql_pool import SQL_MAX_ROWS, encode_value, ensure_read_only
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+TOPICS = [
+    "quarterly report", "onboarding guide", "marketing plan", "product launch", "security policy",
+    "travel expenses", "hiring plan", "customer survey", "release notes", "budget forecast",
+    "incident review", "roadmap", "vendor contract", "training schedule", "brand guidelines",
+]
+FILLER = ("team project review status update revenue customer feedback schedule risk owner milestone "
+          "deadline summary decision action metric goal plan budget forecast analysis").split()
+
+_words = re.compile(r"\w+")
+
+
+def _tokens(text: str) -> set[str]:
+    return set(_words.findall(text.lower()))
+
+
+class _Objects(SimpleNamespace):
+    pass
+
+
+class FakeCollection:
+    """The subset of a Weaviate collection's query API that search_agent uses, over an in-memory corpus."""
+
+    def __init__(self, documents: int = 200, chunks_per_document: int = 3, chunk_chars: int = 800,
+                 latency_ms: float = 0.0, seed: int = 0):
+        rng = random.Random(seed)
+        self.latency = latency_ms / 1000
+        self.objects = []
+        for number in range(documents):
+            topic = TOPICS[number % len(TOPICS)]
+            title = f"{topic.title()} {number // len(TOPICS) + 1}"
+            source = f"doc-{number:05d}"
+            for chunk_index in range(chunks_per_document):
+                words = [topic] + [rng.choice(FILLER) for _ in range(chunk_chars // 7)]
+                content = " ".join(words)[:chunk_chars]
+                properties = {"title": title, "content": content, "source": source, "chunk_index": chunk_index,
+                              "doc_size": chunk_chars * chunks_per_document}
+                self.objects.append(SimpleNamespace(
+                    uuid=uuid.UUID(int=rng.getrandbits(128)), properties=properties, tokens=_tokens(f"{title} {content}")))
+        self.objects.sort(key=lambda obj: obj.uuid)
+        self.by_id = {str(obj.uuid): obj for obj in self.objects}
+        self.query = self
+
+    def _sleep(self) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+
+    @staticmethod
+    def _result(obj, properties: Optional[list[str]], distance: Optional[float] = None, score: Optional[float] = None):
+        selected = {key: obj.properties.get(key) for key in properties} if properties else dict(obj.properties)
+        return SimpleNamespace(uuid=obj.uuid, properties=selected, metadata=SimpleNamespace(distance=distance, score=score))
+
+    def _ranked(self, query: str, limit: int, properties, as_distance: bool):
+        wanted = _tokens(query)
+        scored = []
+        for obj in self.objects:
+            overlap = len(wanted & obj.tokens)
+            if overlap:
+                scored.append((overlap / len(wanted), obj))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return _Objects(objects=[
+            self._result(obj, properties, distance=1 - score if as_distance else None, score=None if as_distance else score)
+            for score, obj in scored[:limit]
+        ])
+
+    def near_text(self, query: str, limit: int = 10, return_properties=None, return_metadata=None, **_):
+        self._sleep()
+        return self._ranked(query, limit, return_properties, as_distance=True)
+
+    def near_vector(self, near_vector, limit: int = 10, return_properties=None, return_metadata=None, **_):
+        # Vectors carry no words; answer like a vector index that finds the nearest chunks regardless
+        self._sleep()
+        return _Objects(objects=[self._result(obj, return_properties, distance=0.5) for obj in self.objects[:limit]])
+
+    def hybrid(self, query: str, alpha: float = 0.5, limit: int = 10, return_properties=None, **_):
+        self._sleep()
+        return self._ranked(query, limit, return_properties, as_distance=False)
+
+    def bm25(self, query: str, limit: int = 10, return_properties=None, **_):
+        self._sleep()
+        return self._ranked(query, limit, return_properties, as_distance=False)
+
+    @staticmethod
+    def _matches(obj, filters) -> bool:
+        if filters is None:
+            return True
+        if hasattr(filters, "filters"):  # _FilterAnd
+            return all(FakeCollection._matches(obj, part) for part in filters.filters)
+        value = obj.properties.get(filters.target)
+        operator = filters.operator.value
+        if operator == "Equal":
+            return value == filters.value
+        if operator == "GreaterThanEqual":
+            return value is not None and value >= filters.value
+        raise NotImplementedError(f"Filter operator {operator} is not supported by the stand-in")
+
+    def fetch_objects(self, limit: int = 10, after: Optional[str] = None, filters=None, sort=None,
+                      return_properties=None, **_):
+        self._sleep()
+        objects = [obj for obj in self.objects if self._matches(obj, filters)]
+        if after is not None:
+            objects = [obj for obj in objects if str(obj.uuid) > after]
+        for order in reversed(sort.sorts if sort is not None else []):
+            objects.sort(key=lambda obj: obj.properties.get(order.prop) or 0, reverse=not order.ascending)
+        return _Objects(objects=[self._result(obj, return_properties) for obj in objects[:limit]])
+
+    def fetch_object_by_id(self, object_id: str, **_):
+        self._sleep()
+        obj = self.by_id.get(object_id)
+        return self._result(obj, None) if obj is not None else None
+
+
+class FakeWeaviateClient:
+    def __init__(self, collection: FakeCollection):
+        self.collections = SimpleNamespace(get=lambda name: collection)
+
+    def is_ready(self) -> bool:
+        return True
+
+    def close(self) -> None:
+        pass
+
+
+MEMBERS = [
+    (1, "Minji", "2004-05-07", "Leader", "2022-07-22"),
+    (2, "Hanni", "2004-10-06", "Vocalist", "2022-07-22"),
+    (3, "Danielle", "2005-04-11", "Vocalist", "2022-07-22"),
+    (4, "Haerin", "2006-05-15", "Vocalist", "2022-07-22"),
+    (5, "Hyein", "2008-04-21", "Vocalist", "2022-07-22"),
+]
+SONGS = [
+    (1, "Attention", "2022-07-22", 180, "Pop"),
+    (2, "Hype Boy", "2022-08-01", 179, "Pop"),
+    (3, "Cookie", "2022-08-01", 235, "R&B"),
+    (4, "Ditto", "2022-12-19", 185, "Pop"),
+    (5, "OMG", "2023-01-02", 212, "Pop"),
+    (6, "Super Shy", "2023-07-07", 154, "Pop"),
+    (7, "ETA", "2023-07-21", 151, "Pop"),
+    (8, "How Sweet", "2024-05-24", 219, "Pop"),
+]
+
+
+class SqliteSqlPool:
+    """SqlPool.execute() over an in-memory SQLite copy of the NewJeans tables."""
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency = latency_ms / 1000
+        # A named shared-cache database, so every thread's connection sees the same tables
+        self.uri = f"file:bench-{uuid.uuid4().hex}?mode=memory&cache=shared"
+        self._local = threading.local()
+        self._keeper = self._connect(writable=True)
+        self._keeper.executescript("""
+            CREATE TABLE members (member_id INTEGER PRIMARY KEY, name TEXT, birth_date TEXT, position TEXT, debut_date TEXT);
+            CREATE TABLE songs (song_id INTEGER PRIMARY KEY, title TEXT, release_date TEXT, duration INTEGER, genre TEXT);
+        """)
+        self._keeper.executemany("INSERT INTO members VALUES (?, ?, ?, ?, ?)", MEMBERS)
+        self._keeper.executemany("INSERT INTO songs VALUES (?, ?, ?, ?, ?)", SONGS)
+        self._keeper.commit()
+        self.queries = 0
+
+    def _connect(self, writable: bool = False) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.uri, uri=True, check_same_thread=False)
+        if not writable:
+            conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    def execute(self, sql: str, timeout_ms: Optional[int] = None,
+                max_rows: int = SQL_MAX_ROWS) -> tuple[list[str], list[list], bool]:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        if self.latency:
+            time.sleep(self.latency)
+        self.queries += 1
+        cursor = conn.execute(ensure_read_only(sql))
+        rows = [[encode_value(value) for value in row] for row in cursor.fetchmany(max_rows + 1)]
+        columns = [column[0] for column in cursor.description or ()]
+        return columns, rows[:max_rows], len(rows) > max_rows
+
+    def stats(self) -> dict:
+        return {"queries": self.queries}
+
+    def close(self) -> None:
+        pass
+
+
+def mcp_stub_params(server: str, latency_ms: float):
+    from mcp import StdioServerParameters
+    return StdioServerParameters(command=sys.executable, args=[
+        os.path.join(HERE, "mcp_stub_server.py"), "--server", server, "--latency", str(latency_ms / 1000)])
+
+
+def install(weaviate_latency_ms: float = 0.0, db_latency_ms: float = 0.0, mcp_latency_ms: float = 0.0,
+            documents: int = 200, seed: int = 0) -> dict[str, Any]:
+    """Swap the stand-ins in for whichever agent modules are loaded; call after building the agent."""
+    installed = {}
+    weaviate_pool = sys.modules.get(f"{__package__}.weaviate_pool")
+    if weaviate_pool is not None:
+        client = FakeWeaviateClient(FakeCollection(documents, latency_ms=weaviate_latency_ms, seed=seed))
+        # with_collection() looks the function up at call time
+        weaviate_pool.get_client = lambda: client
+        installed["weaviate"] = f"{documents} documents in memory"
+    nl2sql_agent = sys.modules.get(f"{__package__}.nl2sql_agent")
+    if nl2sql_agent is not None:
+        nl2sql_agent.sql_pool = SqliteSqlPool(db_latency_ms)
+        installed["postgres"] = "in-memory SQLite"
+    mcp_pool = sys.modules.get(f"{__package__}.mcp_pool")
+    if mcp_pool is not None:
+        # Pools start on first use, so their connection can still be pointed elsewhere
+        for name, server in (("postgres-toolbox", "toolbox"), ("agentmail", "agentmail")):
+            pool = mcp_pool._pools.get(name)
+            if pool is not None:
+                pool.connection_params = mcp_stub_params(server, mcp_latency_ms)
+                installed[name] = f"mcp_stub_server.py --server {server}"
+    return installed
@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+
+# Tests import the agent modules from the `actual` package, as `python -m actual.agent` does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+# Keep version markers and stores out of the working tree
+os.environ.setdefault("AGENT_CACHE_DIR", tempfile.mkdtemp(prefix="agent-tests-"))
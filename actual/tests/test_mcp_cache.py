@@ -0,0 +1,69 @@
+import asyncio
+import json
+import os
+import sys
+
+from google.adk.tools.mcp_tool.mcp_toolset import MCPToolset, StdioServerParameters
+
+from actual.mcp_cache import CachedMCPToolset
+
+STUB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "mcp_stub_server.py")
+
+
+def _with_stub(scenario, ttls=None, latency=0.0):
+    """Run `scenario(toolset, tools)` against a fresh stub server behind a CachedMCPToolset."""
+    async def run():
+        toolset = CachedMCPToolset(
+            MCPToolset(connection_params=StdioServerParameters(
+                command=sys.executable, args=[STUB, "--latency", str(latency)])),
+            server="stub", ttls=ttls)
+        try:
+            tools = {tool.name: tool for tool in await toolset.get_tools()}
+            await scenario(toolset, tools)
+        finally:
+            await toolset.close()
+
+    asyncio.run(run())
+
+
+async def _call(tool, **args):
+    """The stub's reply, which counts the calls the server has executed."""
+    result = await tool.run_async(args=args, tool_context=None)
+    return json.loads(result.content[0].text)
+
+
+def test_concurrent_identical_reads_reach_the_server_once():
+    async def scenario(toolset, tools):
+        replies = await asyncio.gather(*(_call(tools["list-songs"]) for _ in range(5)))
+
+        assert {reply["executions"] for reply in replies} == {1}
+        assert toolset.coalesced == 4
+        assert (await _call(tools["list-songs"]))["executions"] == 1  # Now from the cache
+
+    _with_stub(scenario, latency=0.3)
+
+
+def test_reads_expire_after_their_ttl():
+    async def scenario(toolset, tools):
+        assert (await _call(tools["list-songs"]))["executions"] == 1
+        assert (await _call(tools["list-songs"]))["executions"] == 1
+        await asyncio.sleep(0.6)
+        assert (await _call(tools["list-songs"]))["executions"] == 2
+
+    _with_stub(scenario, ttls={"list-*": 0.5})
+
+
+def test_successful_write_drops_cached_reads():
+    async def scenario(toolset, tools):
+        assert "Bubble Gum" not in (await _call(tools["list-songs"]))["songs"]
+        assert (await _call(tools["find-member-by-name"], name="Minji"))["executions"] == 2
+
+        await _call(tools["create-song"], title="Bubble Gum")
+
+        reply = await _call(tools["list-songs"])
+        assert "Bubble Gum" in reply["songs"]
+        assert reply["executions"] == 4
+        assert (await _call(tools["find-member-by-name"], name="Minji"))["executions"] == 5
+        assert toolset.invalidations == 1
+
+    _with_stub(scenario)
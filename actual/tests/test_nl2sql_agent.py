@@ -0,0 +1,35 @@
+import asyncio
+from types import SimpleNamespace
+
+from google.adk.models import LlmRequest
+from google.genai import types
+
+from actual.nl2sql_agent import remember_sql, reuse_cached_sql
+from actual.sql_cache import question_cache
+
+
+def _turn(question):
+    content = types.Content(role="user", parts=[types.Part(text=question)])
+    return SimpleNamespace(user_content=content), LlmRequest(contents=[content])
+
+
+def _answer(question, sql):
+    context, _ = _turn(question)
+    tool = SimpleNamespace(name="search_nj_db")
+    asyncio.run(remember_sql(tool, {"query": sql}, context, {"status": "success"}))
+
+
+def test_repeated_question_skips_sql_generation():
+    _answer("When was Minji born?", "SELECT birth_date FROM members WHERE name = 'Minji'")
+
+    response = asyncio.run(reuse_cached_sql(*_turn("when was Minji born")))
+    call = response.content.parts[0].function_call
+    assert call.name == "search_nj_db"
+    assert call.args == {"query": "SELECT birth_date FROM members WHERE name = 'Minji'"}
+
+
+def test_questions_that_refer_back_are_not_cached():
+    _answer("When was she born?", "SELECT birth_date FROM members WHERE name = 'Hanni'")
+
+    assert question_cache.get("When was she born?") is None
+    assert asyncio.run(reuse_cached_sql(*_turn("When was she born?"))) is None
@@ -0,0 +1,46 @@
+import asyncio
+import time
+
+from google.adk.events import Event
+from google.genai import types
+
+from actual.session_store import SqliteSessionService
+
+
+def _message(author, text):
+    return Event(author=author, invocation_id=f"inv-{text}", timestamp=time.time(),
+                 content=types.Content(role="user" if author == "user" else "model", parts=[types.Part(text=text)]))
+
+
+def _texts(session):
+    return [event.content.parts[0].text for event in session.events]
+
+
+def test_workers_sharing_a_database_see_each_others_writes(tmp_path):
+    async def scenario():
+        path = str(tmp_path / "sessions.db")
+        # Two serve.py workers: each keeps its own LRU over the same file
+        first = SqliteSessionService(path)
+        second = SqliteSessionService(path, token_budget=80, keep_tokens=60)
+        session = await first.create_session(app_name="app", user_id="u", session_id="s")
+        await first.append_event(session, _message("user", "hello"))
+
+        assert _texts(await second.get_session(app_name="app", user_id="u", session_id="s")) == ["hello"]
+
+        await first.append_event(session, _message("agent", "hi there"))
+        assert _texts(await second.get_session(app_name="app", user_id="u", session_id="s")) == ["hello", "hi there"]
+
+        other = await second.get_session(app_name="app", user_id="u", session_id="s")
+        await second.append_event(other, _message("user", "x" * 200))
+        await second.append_event(other, _message("agent", "y" * 200))  # Over budget: compacted in this worker
+        compacted = _texts(await first.get_session(app_name="app", user_id="u", session_id="s"))
+        assert compacted[0].startswith("Summary of the earlier conversation")
+        assert compacted[1:] == ["x" * 200, "y" * 200]
+
+        await second.delete_session(app_name="app", user_id="u", session_id="s")
+        assert await first.get_session(app_name="app", user_id="u", session_id="s") is None
+        assert first.stats()["reloads"] == 2
+        first.close()
+        second.close()
+
+    asyncio.run(scenario())
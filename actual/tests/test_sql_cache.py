@@ -0,0 +1,40 @@
+import numpy as np
+
+from actual.sql_cache import QuestionCache, SqlResultCache
+
+
+def test_result_cache_keeps_literal_case():
+    cache = SqlResultCache()
+    cache.put("SELECT * FROM members WHERE name='Minji';", {"rows": [["Minji"]]})
+
+    assert cache.get("where name='MINJI'") is None
+    assert cache.get("SELECT * FROM members WHERE name='MINJI'") is None
+    assert cache.get("  SELECT * FROM members WHERE name='Minji'  ") == {"rows": [["Minji"]]}
+
+    cache.put("SELECT * FROM members WHERE name='MINJI'", {"rows": []})
+    assert cache.get("SELECT * FROM members WHERE name='Minji'") == {"rows": [["Minji"]]}
+    assert cache.get("SELECT * FROM members WHERE name='MINJI'") == {"rows": []}
+
+
+class _SameVector:
+    """Embeds every question identically, like two template-identical questions would be."""
+
+    def embed_one(self, text):
+        return np.ones(4, dtype=np.float32)
+
+
+def test_question_cache_fuzzy_match_is_off_by_default():
+    cache = QuestionCache(embedder=_SameVector)
+    cache.put("When was Minji born?", "SELECT birth_date FROM members WHERE name = 'Minji'")
+
+    assert cache.get("when was minji born") == "SELECT birth_date FROM members WHERE name = 'Minji'"
+    assert cache.get("What is Minji's birthday?") is None
+
+
+def test_question_cache_fuzzy_match_needs_the_same_names():
+    cache = QuestionCache(similarity=0.95, embedder=_SameVector)
+    cache.put("When was Minji born?", "SELECT birth_date FROM members WHERE name = 'Minji'")
+
+    assert cache.get("When was Hanni born?") is None
+    assert cache.get("when was hanni born") is None
+    assert cache.get("Minji was born when?") == "SELECT birth_date FROM members WHERE name = 'Minji'"
@@ -0,0 +1,27 @@
+import pytest
+
+from actual.sql_pool import SqlPool, UnsafeStatement, ensure_read_only
+
+
+@pytest.mark.parametrize("sql", [
+    "COMMIT; DELETE FROM songs",
+    "SELECT 1; DELETE FROM songs;",
+    "DELETE FROM songs",
+    "WITH gone AS (DELETE FROM songs RETURNING *) SELECT * FROM gone",
+    "SELECT * INTO songs_copy FROM songs",
+    "SELECT set_config('default_transaction_read_only', 'off', false)",
+])
+def test_read_only_pool_refuses_writes_before_connecting(sql):
+    pool = SqlPool(dsn="postgresql://nobody@127.0.0.1:1/none")
+
+    with pytest.raises(UnsafeStatement):
+        pool.execute(sql)
+    assert pool._pool is None  # Refused before a connection was ever opened
+
+
+def test_read_only_queries_pass():
+    assert ensure_read_only("SELECT birth_date FROM members WHERE name = 'Minji';") == \
+        "SELECT birth_date FROM members WHERE name = 'Minji'"
+    assert ensure_read_only("SELECT title FROM songs WHERE title = 'a; DELETE FROM songs'")
+    assert ensure_read_only("WITH long AS (SELECT * FROM songs WHERE duration > 180) SELECT COUNT(*) FROM long")
+    assert ensure_read_only("SELECT CASE WHEN duration > 180 THEN 'long' ELSE 'short' END FROM songs")
@@ -0,0 +1,218 @@
+# @title OpenTelemetry tracing and metrics setup
+#
+# Moved out of agent.py so the exporters are only imported once an agent is
+# actually built (see registry.get_agent), not on every import of agent.py.
+#
+# Spans used to go to Langfuse only, through a BatchSpanProcessor wired in
+# unconditionally. The destination is now chosen with TRACE_EXPORTER:
+#   langfuse  OTLP/HTTP to Langfuse (the default when LANGFUSE_PUBLIC_KEY is set)
+#   otlp      OTLP/HTTP to OTEL_EXPORTER_OTLP_ENDPOINT (a local collector, Jaeger, ...)
+#   file      one JSON object per span appended to TRACE_FILE, for offline runs
+#   console   the same compact lines on stdout
+#   none      no exporter (the default otherwise); spans stay non-recording
+# METRICS_EXPORTER picks where the histograms from instrumentation.py go (otlp,
+# file, console or none). Langfuse only ingests traces, so it defaults to none there.
+#
+# Sampling happens in two places. TRACE_SAMPLE_RATE is head sampling: the
+# decision is made when a trace starts, so unsampled traces cost almost
+# nothing. TRACE_TAIL_LATENCY_MS turns on tail sampling: every span of a trace
+# is held until its root span ends, and the trace is exported only if it was
+# slower than the threshold or contains an error (plus a TRACE_TAIL_KEEP share
+# of the rest). That way the traces worth looking at are kept without
+# exporting every fast, healthy turn.
+
+import base64
+import json
+import logging
+import os
+import random
+import sys
+import threading
+from collections import OrderedDict
+from contextvars import Token
+from typing import Optional
+
+from opentelemetry.sdk.trace import SpanProcessor
+from opentelemetry.trace import StatusCode
+
+from .registry import at_shutdown
+from .search_cache import CACHE_DIR
+
+SERVICE_NAME = os.environ.get("OTEL_SERVICE_NAME", "adk-agents")
+TRACE_EXPORTER = os.environ.get("TRACE_EXPORTER", "langfuse" if os.environ.get("LANGFUSE_PUBLIC_KEY") else "none")
+METRICS_EXPORTER = os.environ.get("METRICS_EXPORTER", "none" if TRACE_EXPORTER == "langfuse" else TRACE_EXPORTER)
+TRACE_FILE = os.environ.get("TRACE_FILE", os.path.join(CACHE_DIR, "traces.jsonl"))
+METRICS_FILE = os.environ.get("METRICS_FILE", os.path.join(CACHE_DIR, "metrics.jsonl"))
+METRICS_INTERVAL_SECONDS = float(os.environ.get("METRICS_INTERVAL_SECONDS", "30"))
+# Head sampling: share of traces recorded at all
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "1.0"))
+# Tail sampling: 0 disables it; otherwise keep traces at least this slow, or with an error
+TRACE_TAIL_LATENCY_MS = float(os.environ.get("TRACE_TAIL_LATENCY_MS", "0"))
+TRACE_TAIL_KEEP = float(os.environ.get("TRACE_TAIL_KEEP", "0.0"))
+TRACE_TAIL_MAX_SPANS = int(os.environ.get("TRACE_TAIL_MAX_SPANS", "20000"))
+
+_configured = False
+
+
+def compact_span(span) -> str:
+    """One line of JSON per span: enough to find slow tools offline with jq or pandas."""
+    parent = span.parent.span_id if span.parent else None
+    return json.dumps({
+        "name": span.name,
+        "trace_id": f"{span.context.trace_id:032x}",
+        "span_id": f"{span.context.span_id:016x}",
+        "parent_id": f"{parent:016x}" if parent else None,
+        "start": span.start_time / 1e9,
+        "duration_ms": round((span.end_time - span.start_time) / 1e6, 3),
+        "status": span.status.status_code.name,
+        "attributes": dict(span.attributes or {}),
+    }, default=str) + "\n"
+
+
+def _open_append(path: str):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    return open(path, "a", buffering=1)
+
+
+class TailSamplingProcessor(SpanProcessor):
+    """Buffers each trace's spans until its root ends, then forwards slow or failed traces."""
+
+    def __init__(self, downstream, latency_ms: float = TRACE_TAIL_LATENCY_MS, keep_ratio: float = TRACE_TAIL_KEEP,
+                 max_spans: int = TRACE_TAIL_MAX_SPANS):
+        self.downstream = downstream
+        self.latency_ms = latency_ms
+        self.keep_ratio = keep_ratio
+        self.max_spans = max_spans
+        self._traces: OrderedDict[int, list] = OrderedDict()
+        self._buffered = 0
+        self._lock = threading.Lock()
+        self.kept = 0
+        self.discarded = 0
+        self.evicted = 0
+
+    def on_start(self, span, parent_context=None) -> None:
+        pass
+
+    def on_end(self, span) -> None:
+        trace_id = span.context.trace_id
+        with self._lock:
+            self._traces.setdefault(trace_id, []).append(span)
+            self._buffered += 1
+            if span.parent is not None and not span.parent.is_remote:
+                # Bounded buffer: traces whose root never ends (crashed turns) are evicted oldest first
+                while self._buffered > self.max_spans and self._traces:
+                    _, dropped = self._traces.popitem(last=False)
+                    self._buffered -= len(dropped)
+                    self.evicted += 1
+                return
+            spans = self._traces.pop(trace_id, [span])
+            self._buffered -= len(spans)
+        duration_ms = (span.end_time - span.start_time) / 1e6
+        keep = (duration_ms >= self.latency_ms
+                or any(s.status.status_code == StatusCode.ERROR for s in spans)
+                or random.random() < self.keep_ratio)
+        with self._lock:
+            if keep:
+                self.kept += 1
+            else:
+                self.discarded += 1
+        if keep:
+            for s in spans:
+                self.downstream.on_end(s)
+
+    def shutdown(self) -> None:
+        self.downstream.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self.downstream.force_flush(timeout_millis)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"kept": self.kept, "discarded": self.discarded, "evicted": self.evicted, "buffered_spans": self._buffered}
+
+
+def _span_exporter(kind: str):
+    if kind in ("langfuse", "otlp"):
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        return OTLPSpanExporter()
+    from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+    out = _open_append(TRACE_FILE) if kind == "file" else sys.stdout
+    return ConsoleSpanExporter(service_name=SERVICE_NAME, out=out, formatter=compact_span)
+
+
+def _metric_exporter(kind: str):
+    if kind == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.metric_exporter import OTLPMetricExporter
+        return OTLPMetricExporter()
+    from opentelemetry.sdk.metrics.export import ConsoleMetricExporter
+    out = _open_append(METRICS_FILE) if kind == "file" else sys.stdout
+    return ConsoleMetricExporter(out=out, formatter=lambda data: data.to_json(indent=None) + "\n")
+
+
+def _setup_langfuse() -> None:
+    langfuse_public_key = os.environ.get("LANGFUSE_PUBLIC_KEY")
+    langfuse_secret_key = os.environ.get("LANGFUSE_SECRET_KEY")
+    LANGFUSE_AUTH=base64.b64encode(f"{langfuse_public_key}:{langfuse_secret_key}".encode()).decode()
+
+    os.environ["OTEL_EXPORTER_OTLP_ENDPOINT"] = "https://cloud.langfuse.com/api/public/otel" # EU data region
+    os.environ["OTEL_EXPORTER_OTLP_HEADERS"] = f"Authorization=Basic {LANGFUSE_AUTH}"
+
+
+def setup_tracing(exporter: Optional[str] = None, metrics_exporter: Optional[str] = None) -> None:
+    """Install the configured span/metric exporters and samplers, and patch context detaching; safe to call repeatedly."""
+    global _configured
+    if _configured:
+        return
+    _configured = True
+    exporter = exporter or TRACE_EXPORTER
+    metrics_exporter = metrics_exporter or METRICS_EXPORTER
+
+    from opentelemetry.context import _RUNTIME_CONTEXT
+
+    original_detach = _RUNTIME_CONTEXT.detach
+
+    def safe_detach(token: Token):
+        # ADK's async generators can end a span in a different context than the one that started it
+        try:
+            original_detach(token)
+        except ValueError as e:
+            logging.debug(f"[OpenTelemetry Patch] Ignored context detach error: {e}")
+
+    _RUNTIME_CONTEXT.detach = safe_detach
+
+    if exporter != "none":
+        from opentelemetry import trace
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+
+        if exporter == "langfuse":
+            _setup_langfuse()
+        provider = trace.get_tracer_provider()
+        if not hasattr(provider, "add_span_processor"):  # Only the SDK provider takes processors
+            provider = TracerProvider(
+                sampler=ParentBased(TraceIdRatioBased(TRACE_SAMPLE_RATE)),
+                resource=Resource.create({"service.name": SERVICE_NAME}),
+            )
+            trace.set_tracer_provider(provider)
+        processor = BatchSpanProcessor(_span_exporter(exporter))
+        if TRACE_TAIL_LATENCY_MS > 0:
+            processor = TailSamplingProcessor(processor)
+        provider.add_span_processor(processor)
+        at_shutdown(provider.force_flush)
+
+    if metrics_exporter != "none":
+        from opentelemetry import metrics
+        from opentelemetry.sdk.metrics import AlwaysOffExemplarFilter, MeterProvider
+        from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
+        from opentelemetry.sdk.resources import Resource
+
+        reader = PeriodicExportingMetricReader(
+            _metric_exporter(metrics_exporter), export_interval_millis=METRICS_INTERVAL_SECONDS * 1000
+        )
+        # Exemplars (a sampled trace id kept per histogram bucket) cost more per record than the record itself
+        meter_provider = MeterProvider(metric_readers=[reader], resource=Resource.create({"service.name": SERVICE_NAME}),
+                                       exemplar_filter=AlwaysOffExemplarFilter())
+        metrics.set_meter_provider(meter_provider)
+        at_shutdown(meter_provider.force_flush)
@@ -0,0 +1,127 @@
+import argparse
+import json
+import re
+import time
+
+import numpy as np
+import requests
+import weaviate
+import weaviate.classes.config as wvcc
+from weaviate.util import generate_uuid5
+
+# Shared helpers live one level up, next to agent.py: run as `python -m actual.weaviate.<script>`
+from ..index_profiles import INDEX_PROFILES, vector_index_config
+
+parser = argparse.ArgumentParser(
+    description="Measure recall@k, QPS and Weaviate memory for each vector index profile.")
+parser.add_argument("--profiles", nargs="*", default=list(INDEX_PROFILES), choices=list(INDEX_PROFILES))
+parser.add_argument("--objects", type=int, default=20000, help="Synthetic corpus size")
+parser.add_argument("--dim", type=int, default=768, help="Vector dimensions (nomic-embed-text uses 768)")
+parser.add_argument("--clusters", type=int, default=50, help="Topic clusters in the synthetic corpus")
+parser.add_argument("--vectors", default=None,
+                    help="Use a real corpus instead: a .npy matrix of document vectors (e.g. exported embeddings)")
+parser.add_argument("--queries", type=int, default=200, help="Queries per profile")
+parser.add_argument("-k", type=int, default=10, help="Neighbours per query (recall@k)")
+parser.add_argument("--metrics-url", default="http://localhost:2112/metrics",
+                    help="Weaviate Prometheus endpoint (PROMETHEUS_MONITORING_ENABLED in docker-compose.yml)")
+parser.add_argument("--seed", type=int, default=7)
+parser.add_argument("--json", dest="json_path", default=None, help="Also write the results to this file")
+args = parser.parse_args()
+
+
+def normalize(matrix: np.ndarray) -> np.ndarray:
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+def synthetic_corpus(rng: np.random.Generator) -> np.ndarray:
+    """Clustered unit vectors, which behave more like text embeddings than uniform noise."""
+    centers = rng.normal(size=(args.clusters, args.dim))
+    labels = rng.integers(0, args.clusters, size=args.objects)
+    return normalize(centers[labels] + 0.6 * rng.normal(size=(args.objects, args.dim))).astype(np.float32)
+
+
+def resident_memory() -> str:
+    """Weaviate's resident set size in MiB, read from its Prometheus endpoint."""
+    try:
+        text = requests.get(args.metrics_url, timeout=5).text
+    except requests.RequestException:
+        return "n/a"
+    match = re.search(r"^process_resident_memory_bytes (\S+)$", text, re.MULTILINE)
+    return f"{float(match.group(1)) / 2**20:.0f}" if match else "n/a"
+
+
+rng = np.random.default_rng(args.seed)
+corpus = normalize(np.load(args.vectors)).astype(np.float32) if args.vectors else synthetic_corpus(rng)
+query_ids = rng.choice(len(corpus), size=args.queries, replace=False)
+queries = normalize(corpus[query_ids] + 0.1 * rng.normal(size=(args.queries, corpus.shape[1]))).astype(np.float32)
+
+# Exact cosine neighbours as ground truth
+truth = np.argsort(-(queries @ corpus.T), axis=1)[:, :args.k]
+
+# Connect to local Weaviate instance
+client = weaviate.connect_to_local()
+
+if not client.is_ready():
+    print("Weaviate is not ready. Please start the local instance first.")
+    exit(1)
+
+results = []
+try:
+    for profile in args.profiles:
+        name = f"IndexBenchmark_{profile.replace('-', '_')}"
+        if client.collections.exists(name):
+            client.collections.delete(name)
+        memory_before = resident_memory()
+
+        collection = client.collections.create(
+            name=name,
+            vectorizer_config=wvcc.Configure.Vectorizer.none(),
+            vector_index_config=vector_index_config(profile, pq_training_limit=min(100000, len(corpus) // 2)),
+            properties=[wvcc.Property(name="row", data_type=wvcc.DataType.INT)],
+        )
+
+        started = time.perf_counter()
+        with collection.batch.dynamic() as batch:
+            for row, vector in enumerate(corpus):
+                batch.add_object(properties={"row": row}, uuid=generate_uuid5(row), vector=vector.tolist())
+        collection.batch.wait_for_vector_indexing()
+        import_seconds = time.perf_counter() - started
+        if collection.batch.failed_objects:
+            print(f"{profile}: {len(collection.batch.failed_objects)} objects failed to import")
+
+        hits = 0
+        latencies = []
+        for query, expected in zip(queries, truth):
+            started = time.perf_counter()
+            response = collection.query.near_vector(near_vector=query.tolist(), limit=args.k,
+                                                    return_properties=["row"])
+            latencies.append(time.perf_counter() - started)
+            hits += len({obj.properties["row"] for obj in response.objects} & set(expected.tolist()))
+
+        latencies.sort()
+        result = {
+            "profile": profile,
+            "settings": INDEX_PROFILES[profile],
+            "objects": len(corpus),
+            f"recall@{args.k}": hits / (args.k * len(queries)),
+            "qps": len(latencies) / sum(latencies),
+            "p50_ms": 1000 * latencies[len(latencies) // 2],
+            "p99_ms": 1000 * latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+            "import_seconds": import_seconds,
+            "rss_mib_before": memory_before,
+            "rss_mib_after": resident_memory(),
+        }
+        results.append(result)
+        print(f"{profile:>14}: recall@{args.k}={result[f'recall@{args.k}']:.3f} qps={result['qps']:.0f} "
+              f"p50={result['p50_ms']:.1f}ms p99={result['p99_ms']:.1f}ms import={import_seconds:.1f}s "
+              f"rss={result['rss_mib_before']}->{result['rss_mib_after']} MiB")
+
+        client.collections.delete(name)
+
+finally:
+    client.close()
+    print("Connection closed.")
+
+if args.json_path:
+    with open(args.json_path, "w") as f:
+        json.dump(results, f, indent=2)
@@ -0,0 +1,26 @@
+import time
+import weaviate
+
+# Shared helpers live one level up, next to agent.py: run as `python -m actual.weaviate.<script>`
+from ..keyword_index import KeywordIndex, KEYWORD_INDEX_FILE
+
+# Connect to local Weaviate instance
+client = weaviate.connect_to_local()
+
+if not client.is_ready():
+    print("Weaviate is not ready. Please start the local instance first.")
+    exit(1)
+
+try:
+    documents = client.collections.get("Document")
+
+    # Stream the collection page by page instead of fetching it in one call
+    started = time.perf_counter()
+    index = KeywordIndex.build(documents.iterator(return_properties=["title", "content", "source"]))
+    index.save()
+    print(f"Indexed {len(index.docs)} documents ({len(index.postings)} terms) "
+          f"in {time.perf_counter() - started:.1f}s -> {KEYWORD_INDEX_FILE}")
+
+finally:
+    client.close()
+    print("Connection closed.")
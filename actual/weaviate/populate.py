@@ -1,5 +1,44 @@
+import argparse
+import json
+import os
+import sys
 import weaviate
-import weaviate.classes.config as wvcc
+
+# Shared helpers live one level up, next to agent.py: run as `python -m actual.weaviate.<script>`
+from ..search_cache import bump_collection_version, CACHE_DIR
+from ..ingestion import Checkpoint, ingest
+from ..embeddings import Embedder, EmbeddingStore, EMBEDDINGS_MODE
+
+# Loaded when no source is given on the command line
+SAMPLE_DOCS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sample_docs.jsonl")
+
+parser = argparse.ArgumentParser(description="Stream documents into the Weaviate 'Document' collection.")
+parser.add_argument("sources", nargs="*", default=[SAMPLE_DOCS],
+                    help="Directories of text files, .jsonl or .csv files (default: sample_docs.jsonl)")
+parser.add_argument("--source-name", action="append", dest="source_names", metavar="NAME",
+                    help="Stable name for a source, once per source in order (default: its absolute path); "
+                         "object ids and the checkpoint are keyed by it, so keep it the same across runs")
+parser.add_argument("--title-field", default="title", help="JSONL/CSV field holding the title")
+parser.add_argument("--content-field", default="content", help="JSONL/CSV field holding the content")
+parser.add_argument("--segment-size", type=int, default=500,
+                    help="Records written (and checkpointed) per segment")
+parser.add_argument("--chunk-chars", type=int, default=2000, help="Maximum characters per stored chunk")
+parser.add_argument("--chunk-overlap", type=int, default=200, help="Characters shared by neighbouring chunks")
+parser.add_argument("--requests-per-minute", type=int, default=None,
+                    help="Rate-limit batches instead of letting Weaviate size them dynamically")
+parser.add_argument("--max-retries", type=int, default=3, help="Retries for objects that failed to import")
+parser.add_argument("--checkpoint", default=os.path.join(CACHE_DIR, "populate.checkpoint.json"),
+                    help="Progress file used to resume an interrupted load")
+parser.add_argument("--failed-out", default=os.path.join(CACHE_DIR, "populate.failed.jsonl"),
+                    help="Where to write the objects that still failed after the retries")
+parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and load everything again")
+parser.add_argument("--sync", action="store_true",
+                    help="Incremental refresh: only re-embed new or changed records and delete removed ones")
+parser.add_argument("--local-embeddings", action="store_true", default=EMBEDDINGS_MODE == "local",
+                    help="Embed through the local cached embedder and push vectors instead of using Weaviate's vectorizer")
+args = parser.parse_args()
+if args.source_names and len(args.source_names) != len(args.sources):
+    parser.error("give --source-name once for every source")
 
 # Connect to local Weaviate instance
 client = weaviate.connect_to_local()
@@ -13,34 +52,46 @@ try:
     # Get the 'Document' collection (class)
     documents = client.collections.get("Document")
 
-    # Example data to add — list of dicts with title and content
-    example_docs = [
-        {
-            "title": "First Document",
-            "content": "This is the content of the first document. Pop, rock, jazz, and classical music are all popular genres."
-        },
-        {
-            "title": "Second Document",
-            "content": "Here is some more content for the second document. mercedes, toyota, and honda are popular car brands."
-        },
-        # Add as many documents as you want here...
-    ]
-
-    # Use batch to add documents efficiently
-    with documents.batch.fixed_size(batch_size=50) as batch:
-        for doc in example_docs:
-            batch.add_object(doc)
-            if batch.number_errors > 10:
-                print("Batch import stopped due to excessive errors.")
-                break
-
-    # Check if there were failed objects during batch insert
-    failed_objects = documents.batch.failed_objects
-    if failed_objects:
-        print(f"Number of failed imports: {len(failed_objects)}")
-        print(f"First failed object: {failed_objects[0]}")
+    if args.restart and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+
+    embedder = Embedder(EmbeddingStore("documents")) if args.local_embeddings else None
+
+    stats = ingest(
+        documents,
+        args.sources,
+        Checkpoint(args.checkpoint),
+        segment_size=args.segment_size,
+        chunk_chars=args.chunk_chars,
+        overlap=args.chunk_overlap,
+        requests_per_minute=args.requests_per_minute,
+        max_retries=args.max_retries,
+        title_field=args.title_field,
+        content_field=args.content_field,
+        sync=args.sync,
+        embedder=embedder,
+        source_names=args.source_names,
+    )
+    print(f"Import finished: {stats.report()}")
+    if embedder is not None:
+        print(f"Embedding cache: {embedder.hits} hits, {embedder.misses} texts embedded")
+    if stats.failed_objects:
+        os.makedirs(os.path.dirname(os.path.abspath(args.failed_out)), exist_ok=True)
+        with open(args.failed_out, "w") as f:
+            for failure in stats.failed_objects:
+                f.write(json.dumps(failure) + "\n")
+        print(f"{len(stats.failed_objects)} objects could not be imported (see {args.failed_out}); "
+              "re-run to retry them")
+    elif os.path.exists(args.failed_out):
+        os.remove(args.failed_out)  # Left over from an earlier run whose failures are now imported
 
 finally:
+    # Drop search results cached before this import
+    bump_collection_version()
+
     # Close the client connection
     client.close()
     print("Connection closed.")
+
+if stats.failed_objects:
+    sys.exit(1)
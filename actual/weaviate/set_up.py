@@ -1,6 +1,16 @@
+import argparse
 import weaviate
 import weaviate.classes.config as wvcc
 
+# Shared helpers live one level up, next to agent.py: run as `python -m actual.weaviate.<script>`
+from ..search_cache import bump_collection_version
+from ..index_profiles import INDEX_PROFILES, DEFAULT_PROFILE, vector_index_config
+
+parser = argparse.ArgumentParser(description="(Re)create the Weaviate 'Document' collection.")
+parser.add_argument("--profile", choices=list(INDEX_PROFILES), default=DEFAULT_PROFILE,
+                    help="Vector index profile (compare them with benchmark_index.py)")
+args = parser.parse_args()
+
 # Connect to local Weaviate instance
 client = weaviate.connect_to_local()
 
@@ -27,6 +37,7 @@ try:
             api_endpoint="http://host.docker.internal:11434",       # Allow Weaviate from within a Docker container to contact your Ollama instance
             model="llama3.2",                                       # The model to use
         ),
+        vector_index_config=vector_index_config(args.profile),       # HNSW / quantization settings
         properties=[
             wvcc.Property(
                 name="title",
@@ -38,9 +49,38 @@ try:
                 data_type=wvcc.DataType.TEXT,
                 description="Full text or main content of the document"
             ),
+            wvcc.Property(
+                name="source",
+                data_type=wvcc.DataType.TEXT,
+                description="Source file and record the object was loaded from",
+                skip_vectorization=True,
+                tokenization=wvcc.Tokenization.FIELD,
+            ),
+            wvcc.Property(
+                name="chunk_index",
+                data_type=wvcc.DataType.INT,
+                description="Position of this chunk within its source record",
+                skip_vectorization=True,
+            ),
+            wvcc.Property(
+                name="content_hash",
+                data_type=wvcc.DataType.TEXT,
+                description="SHA-256 of the source record, used by incremental sync",
+                skip_vectorization=True,
+                tokenization=wvcc.Tokenization.FIELD,
+            ),
+            wvcc.Property(
+                name="doc_size",
+                data_type=wvcc.DataType.INT,
+                description="Length in characters of the whole source record",
+                skip_vectorization=True,
+            ),
         ],
     )
-    print("Created 'Document' collection successfully.")
+    print(f"Created 'Document' collection successfully (index profile: {args.profile}).")
+
+    # Drop search results cached against the old collection
+    bump_collection_version()
 
 finally:
     # Close the client to avoid memory leaks
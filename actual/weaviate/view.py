@@ -1,5 +1,12 @@
+import argparse
 import weaviate
 
+parser = argparse.ArgumentParser(description="Stream the Document collection with its vectors.")
+parser.add_argument("--page-size", type=int, default=100, help="Objects fetched per cursor page")
+parser.add_argument("--after", default=None, help="Resume after this object id")
+parser.add_argument("--max-chars", type=int, default=200, help="Truncate printed content to this many characters")
+args = parser.parse_args()
+
 # Connect to local Weaviate instance
 client = weaviate.connect_to_local()
 
@@ -11,16 +18,18 @@ try:
     # Get the Document collection
     documents = client.collections.get("Document")
 
-    # Fetch all objects (may be limited if many exist)
-    results = documents.query.fetch_objects(include_vector=True)
-    
-    for i, obj in enumerate(results.objects, 1):
+    # Stream every object through the cursor iterator; only one page is held in memory at a time
+    objects = documents.iterator(include_vector=True, after=args.after, cache_size=args.page_size)
+
+    for i, obj in enumerate(objects, 1):
         properties = obj.properties
-        vector = obj.vector["default"]  # This is where the embedding is stored
+        vector = obj.vector.get("default")  # This is where the embedding is stored
+        content = properties.get('content') or ''
 
         print(f"Document {i}:")
+        print(f" Id: {obj.uuid}")
         print(f" Title: {properties.get('title')}")
-        print(f" Content: {properties.get('content')}")
+        print(f" Content: {content[:args.max_chars]}{'...' if len(content) > args.max_chars else ''}")
         print(f" Vector (first 5 values): {vector[:5] if vector else 'N/A'}\n")  # Only show first few values for brevity
 
 finally:
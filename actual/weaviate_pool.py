@@ -0,0 +1,101 @@
+# @title Shared Weaviate client
+#
+# The search tools used to call `weaviate.connect_to_local()` on every
+# invocation, paying an HTTP + gRPC handshake and a readiness check per call.
+# This module keeps one process-wide client instead: it is opened lazily on
+# first use, health-checked at most every HEALTH_CHECK_INTERVAL seconds,
+# reconnected when it goes bad and closed when the interpreter exits.
+
+import atexit
+import logging
+import os
+import threading
+import time
+from typing import Callable, Optional, TypeVar
+
+import weaviate
+from weaviate.exceptions import (
+    WeaviateClosedClientError,
+    WeaviateConnectionError,
+    WeaviateGRPCUnavailableError,
+)
+
+T = TypeVar("T")
+
+WEAVIATE_HOST = os.environ.get("WEAVIATE_HOST", "localhost")
+WEAVIATE_PORT = int(os.environ.get("WEAVIATE_PORT", "8080"))
+WEAVIATE_GRPC_PORT = int(os.environ.get("WEAVIATE_GRPC_PORT", "50051"))
+
+# Seconds a client that answered a readiness probe is trusted without re-probing
+HEALTH_CHECK_INTERVAL = float(os.environ.get("WEAVIATE_HEALTH_CHECK_INTERVAL", "30"))
+
+# Errors that mean the connection itself is gone, so a reconnect may help
+CONNECTION_ERRORS = (WeaviateClosedClientError, WeaviateConnectionError, WeaviateGRPCUnavailableError)
+
+_lock = threading.Lock()
+_client: Optional[weaviate.WeaviateClient] = None
+_last_check = 0.0
+
+
+def _discard_locked() -> None:
+    global _client
+    if _client is not None:
+        try:
+            _client.close()
+        except Exception as e:
+            logging.warning(f"[Weaviate] Ignored error while closing stale client: {e}")
+    _client = None
+
+
+def get_client() -> weaviate.WeaviateClient:
+    """Return the shared client, connecting or reconnecting when needed."""
+    global _client, _last_check
+    with _lock:
+        now = time.monotonic()
+        if _client is not None and now - _last_check < HEALTH_CHECK_INTERVAL:
+            return _client
+
+        if _client is not None:
+            try:
+                if _client.is_ready():
+                    _last_check = now
+                    return _client
+            except Exception as e:
+                logging.warning(f"[Weaviate] Health check failed, reconnecting: {e}")
+            _discard_locked()
+
+        client = weaviate.connect_to_local(
+            host=WEAVIATE_HOST,
+            port=WEAVIATE_PORT,
+            grpc_port=WEAVIATE_GRPC_PORT,
+        )
+        if not client.is_ready():
+            client.close()
+            raise WeaviateConnectionError("Weaviate is not ready. Please start the local instance first.")
+        _client = client
+        _last_check = now
+        return _client
+
+
+def reset_client() -> None:
+    """Drop the shared client so that the next `get_client()` reconnects."""
+    with _lock:
+        _discard_locked()
+
+
+def close_client() -> None:
+    """Close the shared client. Safe to call more than once."""
+    reset_client()
+
+
+def with_collection(fn: Callable[[object], T], name: str = "Document") -> T:
+    """Run `fn(collection)` on the shared client, reconnecting once if the connection dropped."""
+    try:
+        return fn(get_client().collections.get(name))
+    except CONNECTION_ERRORS as e:
+        logging.warning(f"[Weaviate] Connection lost ({e}), retrying with a fresh client")
+        reset_client()
+        return fn(get_client().collections.get(name))
+
+
+atexit.register(close_client)
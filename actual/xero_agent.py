@@ -0,0 +1,62 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+
+from google.adk.agents import LlmAgent
+from google.adk.tools.mcp_tool.mcp_toolset import StdioServerParameters
+
+from .mcp_cache import CachedMCPToolset
+from .mcp_pool import PooledMCPToolset, close_pools, report_pools
+from .registry import AGENT_MODEL, at_shutdown
+
+# @title Define Xero Agent
+
+xero_client_id = os.environ.get("XERO_CLIENT_ID")
+xero_client_secret = os.environ.get("XERO_CLIENT_SECRET")
+
+xero_agent = LlmAgent(
+    model=AGENT_MODEL,
+    name='xero_agent',
+    instruction='Assist the user with financial tasks using Xero tools.',
+    tools=[
+        # Read tools (list-*, get-*) are cached per mcp_cache.yaml to spare Xero's rate limit
+        CachedMCPToolset(
+            # Shared, warm Node server: started on first use, restarted if it dies
+            PooledMCPToolset(
+                "xero",
+                connection_params=StdioServerParameters(
+                    command = "node",
+                    args = ["temp-xero\\dist\\index.js"],
+                    # Pass the Xero API credentials as environment variables to the npx process
+                    env={
+                        "XERO_CLIENT_ID": xero_client_id,
+                        "XERO_CLIENT_SECRET": xero_client_secret
+                    }
+                ),
+            ),
+            server="xero",
+        )
+    ],
+)
+
+def _report_cache():
+    for toolset in xero_agent.tools:
+        if isinstance(toolset, CachedMCPToolset):
+            print(f"--- MCP cache stats: {toolset.stats()} ---")
+
+at_shutdown(close_pools)
+at_shutdown(report_pools)
+at_shutdown(_report_cache)